@@ -1,25 +1,27 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
 import google.generativeai as genai
 import streamlit as st
+from utils import AI_CACHE_MAX_BYTES, AI_CACHE_TTL_S, AI_MODEL, CACHE_DIR
 
-def generate_economic_report(api_key, data_context):
-    """
-    Generates a narrative report using Gemini.
-    data_context: A dictionary or JSON string with the summary statistics.
-    """
-    if not api_key:
-        return "⚠️ Por favor, introduce tu API Key de Google Gemini en la configuración."
-        
-    genai.configure(api_key=api_key)
-    
-    # Select model - trying gemini-pro (Gemini 1.5 or newer if available via alias)
-    # 'gemini-pro' is the standard stable alias.
-    model = genai.GenerativeModel('gemini-pro')
-    
-    prompt = f"""
+AI_CACHE_DIR = os.path.join(CACHE_DIR, "ai_reports")
+# Bump when PROMPT_TEMPLATE changes: cached reports from older prompts are not reused
+PROMPT_VERSION = 3
+
+PROMPT_TEMPLATE = """
     ROL: Eres el Economista Jefe de un observatorio económico independiente especializado en la economía española. Tu perfil combina el rigor académico de la econometría con la capacidad de comunicación ejecutiva.
 
     CONTEXTO DE DATOS (JSON):
     {data_context}
+    "series" y "comparativa" son tablas por columnas: cada fila sigue el orden de "campos_series" / "campos_comparativa".
+    valor y fecha = último dato; var_anual = variación interanual (puntos porcentuales en tasas, % en niveles);
+    percentil = posición del último dato en su histórico (0-100); z = desviaciones respecto a la media histórica;
+    puesto_ES = posición de España entre n_paises (1 = valor más alto).
 
     INSTRUCCIONES DE REDACCIÓN:
     Genera un informe titulado "Estado de la Nación: Análisis Económico en Tiempo Real" siguiendo esta estructura estricta:
@@ -35,9 +37,151 @@ def generate_economic_report(api_key, data_context):
     - Si un dato falta o es "null", indícalo como "Dato no disponible" y no especules.
     - Mantén un tono objetivo pero analítico. Evita el lenguaje partidista.
     """
-    
+
+_cache_lock = threading.Lock()
+
+
+class StubModel:
+    """Offline stand-in for genai.GenerativeModel (AI_MODEL='stub'): deterministic text, no network."""
+
+    class _Response:
+        def __init__(self, text):
+            self.text = text
+
+    def __init__(self, model_name='stub'):
+        self.model_name = model_name
+        self.calls = 0
+
+    def generate_content(self, prompt, stream=False):
+        self.calls += 1
+        digest = hashlib.sha1(prompt.encode()).hexdigest()[:12]
+        text = f"Estado de la Nación (stub {digest}): informe de prueba generado sin conexión."
+        if stream:
+            return iter([self._Response(word + ' ') for word in text.split(' ')])
+        return self._Response(text)
+
+
+def _plain(obj):
+    """JSON-serializable copy of the context (numpy scalars -> Python, NaN -> None)."""
+    if isinstance(obj, dict):
+        return {str(k): _plain(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_plain(v) for v in obj]
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if isinstance(obj, float) and obj != obj:
+        return None
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    return str(obj)
+
+
+def canonical_context(data_context):
+    """Canonical JSON of the data context: same data -> same string (and same cache key)."""
+    if isinstance(data_context, str):
+        return data_context
+    return json.dumps(_plain(data_context), sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+
+
+def report_cache_key(model_name, data_context):
+    payload = f"{model_name}|{PROMPT_VERSION}|{canonical_context(data_context)}"
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def _cache_path(key):
+    return os.path.join(AI_CACHE_DIR, f"{key}.json")
+
+
+def _cache_get(key):
+    """Cached report text, or None if missing or older than AI_CACHE_TTL_S."""
+    path = _cache_path(key)
+    try:
+        with open(path, encoding='utf-8') as f:
+            entry = json.load(f)
+        if time.time() - entry['created_at'] > AI_CACHE_TTL_S:
+            os.remove(path)
+            return None
+        os.utime(path)  # LRU: mtime = last use, so recently used entries survive eviction
+    except (OSError, ValueError, KeyError):
+        return None
+    return entry['text']
+
+
+def _cache_put(key, model_name, text):
+    os.makedirs(AI_CACHE_DIR, exist_ok=True)
+    entry = {'model': model_name, 'prompt_version': PROMPT_VERSION, 'created_at': time.time(), 'text': text}
+    tmp = f"{_cache_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp, _cache_path(key))
+    _evict()
+
+
+def _evict():
+    """Drop entries unused for AI_CACHE_TTL_S, then least recently used ones until the cache fits AI_CACHE_MAX_BYTES."""
+    with _cache_lock:
+        try:
+            entries = [e for e in os.scandir(AI_CACHE_DIR) if e.name.endswith('.json')]
+        except OSError:
+            return
+        now, total, alive = time.time(), 0, []
+        for e in entries:
+            try:
+                stat = e.stat()
+            except OSError:
+                continue
+            alive.append((stat.st_mtime, stat.st_size, e.path))
+            total += stat.st_size
+        for mtime, size, path in sorted(alive):
+            if total <= AI_CACHE_MAX_BYTES and now - mtime <= AI_CACHE_TTL_S:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+def get_model(api_key, model_name=AI_MODEL):
+    if model_name == 'stub':
+        return StubModel()
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name)
+
+
+def stream_economic_report(api_key, data_context, model_name=AI_MODEL, model=None):
+    """
+    Generates the narrative report with Gemini, yielding text chunks as they arrive
+    (for st.write_stream). data_context: A dictionary or JSON string with the summary statistics.
+    Responses are cached on disk by model + prompt version + canonical context: a cached
+    report is yielded in one chunk, and a complete streamed report is stored for the next
+    caller (the PDF, another session).
+    """
+    if not api_key and model_name != 'stub':
+        yield "⚠️ Por favor, introduce tu API Key de Google Gemini en la configuración."
+        return
+
+    key = report_cache_key(model_name, data_context)
+    cached = _cache_get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    # Select model - 'gemini-pro' is the standard stable alias (AI_MODEL / MONITOR_AI_MODEL)
+    model = model or get_model(api_key, model_name)
+    prompt = PROMPT_TEMPLATE.format(data_context=canonical_context(data_context))
+
+    parts = []
     try:
-        response = model.generate_content(prompt)
-        return response.text
+        for chunk in model.generate_content(prompt, stream=True):
+            parts.append(chunk.text)
+            yield parts[-1]
     except Exception as e:
-        return f"Error generando el informe: {e}"
+        yield f"Error generando el informe: {e}"  # Errors (and partial reports) are not cached
+        return
+    _cache_put(key, model_name, ''.join(parts))
+
+
+def generate_economic_report(api_key, data_context, model_name=AI_MODEL, model=None):
+    """Full report text in one piece (same cache as stream_economic_report)."""
+    return ''.join(stream_economic_report(api_key, data_context, model_name, model))
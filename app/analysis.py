@@ -1,8 +1,7 @@
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import PCA
-from sklearn.impute import SimpleImputer
+from factor_model import Standardizer, FactorModel, align_signs
+from profiling import profiled
 from utils import ICTR_BASE, ICTR_SCALE, PCA_COMPONENTS
 
 def calculate_yoy_growth(df, period_freq=12):
@@ -18,7 +17,7 @@ def calculate_yoy_growth(df, period_freq=12):
     return df[['growth']].dropna()
 
 def standardize_data(df):
-    scaler = StandardScaler()
+    scaler = Standardizer()
     scaled_data = scaler.fit_transform(df)
     return pd.DataFrame(scaled_data, index=df.index, columns=df.columns), scaler
 
@@ -27,27 +26,25 @@ def run_pca(df_scaled):
     Runs PCA on the scaled dataframe.
     """
     # Impute missing values if any (Simple forward fill or mean)
-    # Since it's time series, ffill is better, but sklearn Imputer is column-wise mean/median usually
     # Let's use pandas ffill before calling this function usually, but as safety:
     df_filled = df_scaled.ffill().bfill() # Simple time-series imputation
     
-    pca = PCA(n_components=PCA_COMPONENTS)
-    principal_components = pca.fit_transform(df_filled)
+    pca = FactorModel(n_components=PCA_COMPONENTS)
+    principal_components = pca.fit_transform(df_filled.to_numpy())
     
     # Check polarity: The component should correlate positively with GDP/Growth.
     # We might need to flip the sign if the correlation with the average of inputs is negative
     # (assuming most inputs are pro-cyclical).
     
     # Simple polarity check: correlation with the mean of the variables
-    mean_series = df_filled.mean(axis=1)
-    pc1 = principal_components[:, 0]
-    if np.corrcoef(mean_series, pc1)[0, 1] < 0:
-        principal_components = -principal_components
+    mean_series = df_filled.mean(axis=1).to_numpy()
+    principal_components, _ = align_signs(principal_components, mean_series)
         
     explained_variance = pca.explained_variance_ratio_
     
     return principal_components, explained_variance, pca
 
+@profiled('calculate_ictr')
 def calculate_ictr(indicators_dict):
     """
     Main function to compute ICTR.
@@ -0,0 +1,109 @@
+"""
+Cargas en segundo plano compartidas por todas las sesiones del proceso.
+
+submit(key, label, func, ...) ejecuta func en un pool de hilos y devuelve un
+BackgroundTask. Mientras la tarea esté en curso o su resultado siga vigente
+(BACKGROUND_TTL_S), cualquier sesión que pida la misma key recibe la misma
+tarea: una fuente lenta se descarga una sola vez aunque la pidan varios
+usuarios a la vez. La página se pinta sin esperar y consulta task.done /
+task.result() en cada rerun.
+
+Las tareas terminadas no se guardan indefinidamente: cada submit descarta las
+caducadas y, por encima de BACKGROUND_MAX_TASKS, las terminadas menos usadas
+(cada fecha de vintage o token distinto crea tareas con paneles e históricos
+completos; sin este límite se acumularían durante toda la vida del proceso).
+
+func recibe la tarea como primer argumento para informar del progreso con
+task.report(fracción, texto). Los hilos no tienen contexto de Streamlit: no
+deben llamar a st.* (solo a funciones cacheadas sin spinner).
+
+Si la sesión que lanza la tarea está perfilando (profiling), la tarea graba los
+spans de su hilo en task.spans para que el rerun los añada a su perfil.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import profiling
+from utils import BACKGROUND_MAX_TASKS, BACKGROUND_TTL_S, BACKGROUND_WORKERS
+
+_executor = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="monitor-bg")
+_tasks = OrderedDict()  # key -> BackgroundTask, de menos a más recientemente pedida
+_lock = threading.Lock()
+
+
+class BackgroundTask:
+    """Carga en curso o terminada, con progreso consultable desde cualquier sesión."""
+
+    def __init__(self, key, label):
+        self.key = key
+        self.label = label
+        self.progress = 0.0
+        self.text = label
+        self.submitted = time.time()
+        self.future = None
+        self.spans = None  # Spans del hilo del pool si se lanzó desde un rerun perfilado
+
+    def report(self, fraction, text=None):
+        self.progress = min(max(float(fraction), 0.0), 1.0)
+        if text:
+            self.text = text
+
+    @property
+    def done(self):
+        return self.future.done()
+
+    @property
+    def error(self):
+        return self.future.exception() if self.future.done() else None
+
+    def result(self, default=None, timeout=0):
+        """Resultado si ya está listo (o tras esperar `timeout` s; None = sin límite); si no, default."""
+        if timeout == 0 and not self.future.done():
+            return default
+        try:
+            return self.future.result(timeout=timeout)
+        except Exception:
+            return default
+
+    def _expired(self):
+        return self.future.done() and (self.error is not None or time.time() - self.submitted > BACKGROUND_TTL_S)
+
+
+def _evict():
+    """Descarta las tareas caducadas y, si siguen sobrando, las terminadas menos usadas (con _lock)."""
+    for key in [k for k, t in _tasks.items() if t._expired()]:
+        del _tasks[key]
+    for key in [k for k, t in _tasks.items() if t.done][:max(0, len(_tasks) - BACKGROUND_MAX_TASKS)]:
+        del _tasks[key]
+
+
+def _run_recording(func, task, *args, **kwargs):
+    with profiling.recording() as recorder:
+        task.spans = recorder.spans
+        return func(task, *args, **kwargs)
+
+
+def submit(key, label, func, *args, **kwargs):
+    """Lanza func(task, *args, **kwargs) salvo que ya haya una tarea vigente con esa key."""
+    with _lock:
+        task = _tasks.get(key)
+        if task is None or task._expired():
+            task = BackgroundTask(key, label)
+            if profiling.current_run() is not None:
+                task.future = _executor.submit(_run_recording, func, task, *args, **kwargs)
+            else:
+                task.future = _executor.submit(func, task, *args, **kwargs)
+            _tasks[key] = task
+        _tasks.move_to_end(key)
+        _evict()
+        return task
+
+
+def forget(kind):
+    """Descarta las tareas cuya key empieza por `kind` (la próxima petición las relanza)."""
+    with _lock:
+        for key in [k for k in _tasks if k[0] == kind]:
+            if _tasks[key].done:
+                del _tasks[key]
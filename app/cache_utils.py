@@ -0,0 +1,118 @@
+"""
+Utilidades de caché compartidas por el dashboard y los informes.
+
+- fingerprint(*objs): hash de contenido estable de DataFrames, Series, arrays,
+  dicts, listas y escalares (mismo contenido -> misma clave, en cualquier sesión).
+- LRUCache: caché en memoria de proceso, segura entre hilos, acotada por número
+  de entradas y/o por bytes totales.
+"""
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+def _update(h, obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        h.update(type(obj).__name__.encode())
+        if isinstance(obj, pd.DataFrame):
+            h.update(repr(list(obj.columns)).encode())
+            h.update(repr(list(obj.dtypes.astype(str))).encode())
+        else:
+            h.update(repr(obj.name).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, np.ndarray):
+        h.update(repr((obj.dtype.str, obj.shape)).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        h.update(b"{")
+        for key in sorted(obj, key=repr):
+            _update(h, key)
+            _update(h, obj[key])
+        h.update(b"}")
+    elif isinstance(obj, (list, tuple)):
+        h.update(b"[")
+        for item in obj:
+            _update(h, item)
+        h.update(b"]")
+    else:
+        h.update(repr(obj).encode())
+    h.update(b"|")
+
+
+def fingerprint(*objs):
+    """Hash de contenido (hex) de los objetos dados."""
+    h = hashlib.blake2b(digest_size=16)
+    for obj in objs:
+        _update(h, obj)
+    return h.hexdigest()
+
+
+class LRUCache:
+    """
+    Caché LRU segura entre hilos.
+    max_entries / max_bytes: límites (None = sin límite). El tamaño de cada valor
+    es len() para bytes/str y sys.getsizeof() para el resto, salvo que se indique.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _sizeof(value):
+        if isinstance(value, (bytes, bytearray, str)):
+            return len(value)
+        return sys.getsizeof(value)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, size=None):
+        size = self._sizeof(value) if size is None else size
+        with self._lock:
+            if self.max_bytes is not None and size > self.max_bytes:
+                return  # No cabe: no se cachea
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+            while self._data and (
+                (self.max_entries is not None and len(self._data) > self.max_entries)
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                _, (_, evicted) = self._data.popitem(last=False)
+                self._bytes -= evicted
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    @property
+    def total_bytes(self):
+        return self._bytes
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
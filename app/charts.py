@@ -0,0 +1,175 @@
+"""
+Constructores de gráficas Plotly del dashboard, con caché por contenido.
+
+Cada constructor decorado con @cached_figure se indexa por el hash de contenido
+de sus argumentos (series + opciones). Un rerun que no cambia los datos, en
+cualquier sesión, reutiliza la figura ya construida en lugar de volver a crear
+trazas y normalizar series. La figura cacheada es compartida: no modificarla.
+
+Las comparativas internacionales se construyen desde el panel ancho
+(date x país) de fetch_eurostat_panel. Las series largas se reducen en el
+servidor (downsample_xy, LTTB) a point_budget puntos por traza antes de crear
+la traza.
+"""
+from functools import wraps
+
+import numpy as np
+import plotly.graph_objects as go
+from cache_utils import LRUCache, fingerprint
+from derived import base100
+from downsample import downsample_xy
+from profiling import span
+from utils import EU_AGGREGATES, FIGURE_CACHE_MAX_BYTES, PEER_WEBGL_THRESHOLD
+
+# Tamaño de cada entrada = longitud del JSON serializado de la figura
+_figure_cache = LRUCache(max_bytes=FIGURE_CACHE_MAX_BYTES)
+
+
+def cached_figure(builder):
+    """Memoiza un constructor de figuras por hash de contenido de sus argumentos."""
+    @wraps(builder)
+    def wrapper(*args, **kwargs):
+        key = fingerprint(builder.__name__, args, kwargs)
+        fig = _figure_cache.get(key)
+        if fig is None:
+            with span(f"plotly.{builder.__name__}"):
+                fig = builder(*args, **kwargs)
+                _figure_cache.put(key, fig, size=len(fig.to_json()))
+        return fig
+    return wrapper
+
+
+def figure_cache_stats():
+    return {'entradas': len(_figure_cache), 'bytes': _figure_cache.total_bytes,
+            'aciertos': _figure_cache.hits, 'fallos': _figure_cache.misses}
+
+
+def _padded_range(y_min, y_max, pad=0.1):
+    """Rango del eje Y con margen del 10% (zoom dinámico de las comparativas)."""
+    margin = (y_max - y_min) * pad
+    return [y_min - margin, y_max + margin]
+
+
+@cached_figure
+def build_ictr_figure(ictr_df, nowcast_df=None):
+    fig_ictr = go.Figure()
+    fig_ictr.add_trace(go.Scatter(
+        x=ictr_df.index,
+        y=ictr_df['ICTR'],
+        mode='lines',
+        name='ICTR',
+        line=dict(color='#1f77b4', width=3),
+        fill='tozeroy',
+        fillcolor='rgba(31, 119, 180, 0.1)'
+    ))
+
+    if nowcast_df is not None:
+        fig_ictr.add_trace(go.Scatter(
+            x=nowcast_df.index,
+            y=nowcast_df['Nowcast'],
+            mode='lines',
+            name='Nowcast (DFM mixto)',
+            line=dict(color='#ff7f0e', width=2, dash='dot')
+        ))
+
+    # Línea de base 100
+    fig_ictr.add_hline(y=100, line_dash="dash", line_color="gray", annotation_text="Base 100")
+
+    fig_ictr.update_layout(
+        yaxis_title="ICTR",
+        xaxis_title="",
+        hovermode="x unified",
+        margin=dict(l=0, r=0, t=10, b=0),
+        height=300
+    )
+    return fig_ictr
+
+
+@cached_figure
+def build_peers_figure(panel, yaxis_title, hovertemplate, normalize=False, point_budget=None):
+    """
+    Comparativa por países a partir del panel ancho (date x país), España resaltada.
+    normalize=True: Base 100 al inicio de cada serie (crecimiento acumulado).
+    """
+    fig = go.Figure()
+    if normalize:
+        panel = base100(panel)  # Derivación memoizada, compartida con el PDF
+
+    # Con muchos países (UE-27): WebGL y tooltip por línea en lugar de unificado
+    many = len(panel.columns) > PEER_WEBGL_THRESHOLD
+    trace_cls = go.Scattergl if many else go.Scatter
+
+    for ctry in panel.columns:
+        col = panel[ctry].dropna()
+        if col.empty:
+            continue
+
+        # Highlight Spain; agregados UE/Zona Euro en discontinua
+        width = 5 if ctry=='ES' else 2
+        opacity = 1.0 if ctry=='ES' else 0.6
+        dash = 'dash' if ctry in EU_AGGREGATES else None
+
+        x_plot, y_plot = downsample_xy(col.index, col.to_numpy(), point_budget)
+        fig.add_trace(trace_cls(x=x_plot, y=y_plot, mode='lines', name=ctry,
+                                line=dict(width=width, dash=dash), opacity=opacity,
+                                hovertemplate=hovertemplate))
+
+    # Dynamic Layout for Zoom (Preserved): mínimo/máximo de todo el panel de una vez
+    if fig.data:
+        values = panel.to_numpy(dtype=float)
+        fig.update_layout(
+            yaxis=dict(range=_padded_range(np.nanmin(values), np.nanmax(values))),
+            hovermode="closest" if many else "x unified",
+            yaxis_title=yaxis_title,
+            legend=dict(orientation="h", y=1.1),
+            margin=dict(l=0, r=0, t=10, b=0)
+        )
+    return fig
+
+
+@cached_figure
+def build_esios_figure(esios_df, point_budget=None):
+    """Demanda diaria + tendencia anual (columna Trend_365)."""
+    fig_esios = go.Figure()
+
+    # Datos DIARIOS (Azul suave); min/max por bucket para no perder picos
+    x_daily, y_daily = downsample_xy(esios_df.index, esios_df['value'], point_budget, method='minmax')
+    fig_esios.add_trace(go.Scatter(
+        x=x_daily, y=y_daily,
+        mode='lines', name='Demanda Diaria',
+        line=dict(color='rgba(31, 119, 180, 0.4)', width=1)
+    ))
+
+    # Tendencia Roja (Media 365 días)
+    x_trend, y_trend = downsample_xy(esios_df.index, esios_df['Trend_365'], point_budget)
+    fig_esios.add_trace(go.Scatter(
+        x=x_trend, y=y_trend,
+        mode='lines', name='Tendencia (Media 1 año)',
+        line=dict(color='red', width=3)
+    ))
+
+    fig_esios.update_layout(
+        height=400,
+        yaxis_title="Potencia (MW)",
+        hovermode="x unified",
+        margin=dict(l=0, r=0, t=10, b=0),
+        legend=dict(orientation="h", y=1.1)
+    )
+    return fig_esios
+
+
+@cached_figure
+def build_line_figure(df, value_col='value', scale=1.0, hovertemplate='%{y:,.1f}', point_budget=None):
+    """Serie simple (date, value): sustituye a st.line_chart con la misma caché."""
+    x_plot, y_plot = downsample_xy(df['date'], df[value_col] * scale, point_budget)
+    fig = go.Figure(go.Scatter(
+        x=x_plot, y=y_plot,
+        mode='lines', line=dict(width=2), hovertemplate=hovertemplate, name=''
+    ))
+    fig.update_layout(
+        height=300,
+        hovermode="x unified",
+        showlegend=False,
+        margin=dict(l=0, r=0, t=10, b=0)
+    )
+    return fig
@@ -0,0 +1,116 @@
+"""
+Exportación masiva de las series del dashboard (ZIP de Parquet / CSV o Excel).
+
+Los datos salen del snapshot compartido (data_store) y de las fuentes lentas
+ya cargadas: exportar no vuelve a descargar nada. Cada tabla se escribe en
+streaming, una detrás de otra:
+- ZIP: cada entrada se abre con ZipFile.open(..., 'w') y se escribe por
+  bloques (CSV con chunksize, Parquet por row groups).
+- Excel: openpyxl en modo write-only (las filas se vuelcan al disco según se
+  añaden, sin mantener el libro en memoria).
+Así no se materializa nunca una copia intermedia de cada tabla (el CSV
+completo como string, el libro de Excel entero): solo el fichero final, que
+st.download_button genera al pulsar (data=callable) y no en cada rerun.
+"""
+import io
+import zipfile
+
+import pandas as pd
+from utils import EXPORT_CHUNK_ROWS
+
+try:
+    import pyarrow  # noqa: F401  (opcional: solo para Parquet)
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# formato -> (etiqueta, extensión del fichero descargado, mime)
+EXPORT_FORMATS = {
+    'parquet': ("ZIP de Parquet", 'zip', 'application/zip'),
+    'csv': ("ZIP de CSV", 'zip', 'application/zip'),
+    'xlsx': ("Excel (.xlsx)", 'xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+def available_formats():
+    """Formatos disponibles en este entorno (Parquet requiere pyarrow)."""
+    return [fmt for fmt in EXPORT_FORMATS if fmt != 'parquet' or PARQUET_AVAILABLE]
+
+
+def export_tables(indicators, peers_data=None, ictr_df=None, nowcast_df=None):
+    """
+    (nombre, DataFrame) de todo lo exportable, en orden estable y sin copiar:
+    indicadores de España, demanda ESIOS diaria, paneles de la comparativa y ICTR.
+    """
+    for name, df in indicators.items():
+        if name != 'Demanda_Electrica' and isinstance(df, pd.DataFrame) and not df.empty:
+            yield name, df
+    esios_df = indicators.get('Demanda_Electrica')
+    if esios_df is not None and not esios_df.empty:
+        yield 'ESIOS_Demanda', esios_df
+    for category, panel in (peers_data or {}).items():
+        if not panel.empty:
+            yield f'Comparativa_{category}', panel.reset_index()
+    if ictr_df is not None and not ictr_df.empty:
+        yield 'ICTR', ictr_df.rename_axis('date').reset_index()
+    if nowcast_df is not None and not nowcast_df.empty:
+        yield 'ICTR_Nowcast', nowcast_df.rename_axis('date').reset_index()
+
+
+def _write_parquet(df, handle):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.Schema.from_pandas(df.iloc[:0], preserve_index=False)
+    with pq.ParquetWriter(handle, schema) as writer:
+        for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+            chunk = df.iloc[start:start + EXPORT_CHUNK_ROWS]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def write_zip(tables, fileobj, fmt='csv'):
+    """Una entrada por tabla (Parquet o CSV), escrita por bloques directamente en el ZIP."""
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, df in tables:
+            with zf.open(f'{name}.{fmt}', 'w') as handle:
+                if fmt == 'parquet':
+                    _write_parquet(df, handle)
+                else:
+                    with io.TextIOWrapper(handle, encoding='utf-8', newline='') as text:
+                        df.to_csv(text, index=False, chunksize=EXPORT_CHUNK_ROWS)
+
+
+def _cell(value):
+    """Valor aceptado por openpyxl (NaN/NaT -> celda vacía, Timestamp -> datetime)."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.tz_localize(None).to_pydatetime() if value.tzinfo else value.to_pydatetime()
+    return value
+
+
+def write_xlsx(tables, fileobj):
+    """Una hoja por tabla con openpyxl en modo write-only (memoria constante)."""
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    for name, df in tables:
+        ws = wb.create_sheet(title=name[:31])  # Límite de Excel: 31 caracteres
+        ws.append([str(c) for c in df.columns])
+        for row in df.itertuples(index=False, name=None):
+            ws.append([_cell(v) for v in row])
+    wb.save(fileobj)
+
+
+def build_export(tables, fmt='csv'):
+    """Genera la exportación y devuelve el fichero (BytesIO) posicionado al inicio."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportación no soportado: {fmt}")
+    if fmt == 'parquet' and not PARQUET_AVAILABLE:
+        raise ImportError("La exportación a Parquet requiere pyarrow (pip install pyarrow)")
+
+    out = io.BytesIO()
+    if fmt == 'xlsx':
+        write_xlsx(tables, out)
+    else:
+        write_zip(tables, out, fmt)
+    out.seek(0)
+    return out
@@ -2,12 +2,18 @@
 Data Loader para el Monitor de EconomÃ­a Real
 Obtiene datos de Eurostat e INE utilizando la librerÃ­a eurostat
 """
+import os
+import time
 import requests
 import pandas as pd
 import numpy as np
 from datetime import datetime
 import streamlit as st
 import eurostat
+from vintage_store import record_vintage, series_key
+from profiling import span
+from utils import (CACHE_DIR, ESIOS_DEMAND_MW_RANGE, ESIOS_MIN_DAY_COVERAGE, ESIOS_NEIGHBOUR_MONTHS,
+                   ESIOS_MAX_NEIGHBOUR_RATIO)
 
 
 @st.cache_data(ttl=86400)
@@ -23,7 +29,9 @@ def fetch_ine_data(serie_code, nult=40):
             df = pd.DataFrame(data['Data'])
             df['date'] = pd.to_datetime(df['Fecha'], unit='ms')
             df['value'] = df['Valor']
-            return df[['date', 'value']].sort_values('date')
+            result = df[['date', 'value']].sort_values('date')
+            record_vintage(series_key('ine', serie_code), result)
+            return result
     except Exception:
         pass
     return pd.DataFrame()
@@ -72,6 +80,16 @@ def _parse_eurostat_date(x):
         return pd.NaT
 
 
+def _report_bad_filters(dataset_code, filters):
+    """Un filtro que no devuelve nada suele estar mal configurado: explicarlo con el catálogo de metadatos."""
+    try:
+        from metadata_catalog import get_catalog
+        for problem in get_catalog().validate(dataset_code, filters):
+            print(f"Filtro de Eurostat sin datos: {problem}")
+    except Exception:
+        pass
+
+
 @st.cache_data(ttl=86400)
 def fetch_eurostat_data(dataset_code, filters=None):
     """
@@ -86,7 +104,8 @@ def fetch_eurostat_data(dataset_code, filters=None):
     """
     try:
         # 1. Descargar dataset completo
-        df = eurostat.get_data_df(dataset_code)
+        with span('eurostat.get_data_df'):
+            df = eurostat.get_data_df(dataset_code)
         
         if df is None or df.empty:
             return pd.DataFrame()
@@ -114,6 +133,7 @@ def fetch_eurostat_data(dataset_code, filters=None):
                 df = df[df[geo_col] == 'ES']
         
         if df.empty:
+            _report_bad_filters(dataset_code, filters)
             return pd.DataFrame()
         
         # 5. Identificar columnas de datos (las que son fechas, empiezan con dÃ­gito)
@@ -129,14 +149,15 @@ def fetch_eurostat_data(dataset_code, filters=None):
         if not date_cols:
             return pd.DataFrame()
         
-        # 6. Melt: transformar de formato ancho a largo
-        df_melted = df.melt(id_vars=id_cols, var_name='period', value_name='value')
-        
-        # 7. Limpiar valores
-        df_melted['value'] = pd.to_numeric(df_melted['value'], errors='coerce')
-        
-        # 8. Parsear fechas
-        df_melted['date'] = df_melted['period'].apply(_parse_eurostat_date)
+        with span('eurostat.melt'):
+            # 6. Melt: transformar de formato ancho a largo
+            df_melted = df.melt(id_vars=id_cols, var_name='period', value_name='value')
+            
+            # 7. Limpiar valores
+            df_melted['value'] = pd.to_numeric(df_melted['value'], errors='coerce')
+            
+            # 8. Parsear fechas
+            df_melted['date'] = df_melted['period'].apply(_parse_eurostat_date)
         
         # 9. Filtrar y ordenar
         result = df_melted[['date', 'value']].dropna().sort_values('date')
@@ -146,33 +167,56 @@ def fetch_eurostat_data(dataset_code, filters=None):
         
         # 11. Filtrar datos desde aÃ±o 2000 (evitar histÃ³rico muy antiguo)
         result = result[result['date'] >= '2000-01-01']
+        result = result.reset_index(drop=True)
+        
+        # 12. Guardar vintage (solo se escriben las revisiones)
+        record_vintage(series_key('eurostat', dataset_code, filters or {'geo': 'ES'}), result)
         
-        return result.reset_index(drop=True)
+        return result
 
     except Exception as e:
         # Log silencioso - en producciÃ³n podrÃ­a loguearse
         return pd.DataFrame()
 
 
-@st.cache_data(ttl=86400)
-def fetch_eurostat_multi_country(dataset_code, countries, filters=None):
+def frames_to_panel(frames, countries=None):
+    """
+    {país: DataFrame(date, value)} -> panel ancho (índice 'date', una columna por país).
+    Las columnas siguen el orden de `countries`; un país sin datos queda como columna vacía.
     """
-    Obtiene datos de Eurostat para mÃºltiples paÃ­ses.
+    countries = list(countries if countries is not None else frames)
+    series = {c: frames[c].set_index('date')['value'] for c in countries
+              if c in frames and frames[c] is not None and not frames[c].empty}
+    if not series:
+        return pd.DataFrame(columns=countries, index=pd.DatetimeIndex([], name='date'), dtype=float)
+    panel = pd.concat(series, axis=1).sort_index()
+    panel.index.name = 'date'
+    return panel.reindex(columns=countries)
+
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def fetch_eurostat_panel(dataset_code, countries, filters=None):
+    """
+    Obtiene datos de Eurostat para múltiples países como un panel ancho alineado.
     
     Args:
-        dataset_code: CÃ³digo del dataset
-        countries: Lista de cÃ³digos de paÃ­s (ej: ['ES', 'DE', 'FR'])
+        dataset_code: Código del dataset
+        countries: Lista de códigos de país (ej: ['ES', 'DE', 'FR'])
         filters: Filtros adicionales (sin 'geo')
     
     Returns:
-        Dict con {country_code: DataFrame}
+        DataFrame con índice 'date' (desde 2000) y una columna por país, en el
+        orden de `countries`. Un país sin datos queda como columna vacía (NaN).
     """
+    countries = list(countries)
+    empty = frames_to_panel({}, countries)
     try:
         # 1. Descargar dataset completo (una sola vez)
-        df = eurostat.get_data_df(dataset_code)
+        with span('eurostat.get_data_df'):
+            df = eurostat.get_data_df(dataset_code)
         
         if df is None or df.empty:
-            return {c: pd.DataFrame() for c in countries}
+            return empty
 
         # 2. Normalizar columnas
         df.columns = [c.lower() for c in df.columns]
@@ -180,151 +224,298 @@ def fetch_eurostat_multi_country(dataset_code, countries, filters=None):
         # 3. Detectar columna geo
         geo_col = _find_geo_column(df)
         if not geo_col:
-            return {c: pd.DataFrame() for c in countries}
+            return empty
         
-        # 4. Aplicar filtros que no sean geo
+        # 4. Aplicar filtros que no sean geo y quedarse con los países pedidos
         if filters:
             for filter_col, filter_val in filters.items():
                 filter_col_lower = filter_col.lower()
                 if filter_col_lower != 'geo' and filter_col_lower in df.columns:
                     df = df[df[filter_col_lower] == filter_val]
+        df = df[df[geo_col].isin(countries)]
         
-        # 5. Identificar columnas de datos
-        id_cols = []
-        date_cols = []
-        for col in df.columns:
-            if col[0].isdigit():
-                date_cols.append(col)
-            else:
-                id_cols.append(col)
-        
-        if not date_cols:
-            return {c: pd.DataFrame() for c in countries}
+        # 5. Identificar columnas de datos (periodos)
+        date_cols = [col for col in df.columns if col[0].isdigit()]
+        if df.empty:
+            _report_bad_filters(dataset_code, {**(filters or {}), 'geo': countries[0]} if countries else filters)
+        if df.empty or not date_cols:
+            return empty
         
-        # 6. Procesar cada paÃ­s
-        results = {}
-        for country in countries:
-            df_country = df[df[geo_col] == country]
-            
-            if df_country.empty:
-                results[country] = pd.DataFrame()
-                continue
-            
-            # Melt
-            df_melted = df_country.melt(id_vars=id_cols, var_name='period', value_name='value')
+        # 6. Melt único para todos los países; cada periodo se parsea una sola vez
+        with span('eurostat.melt'):
+            df_melted = df.melt(id_vars=[geo_col], value_vars=date_cols, var_name='period', value_name='value')
             df_melted['value'] = pd.to_numeric(df_melted['value'], errors='coerce')
-            df_melted['date'] = df_melted['period'].apply(_parse_eurostat_date)
-            
-            result = df_melted[['date', 'value']].dropna().sort_values('date')
+            period_dates = {p: _parse_eurostat_date(p) for p in date_cols}
+            df_melted['date'] = df_melted['period'].map(period_dates)
+            df_melted = df_melted.dropna(subset=['date', 'value'])
             
-            # Agregar por fecha para evitar duplicados
-            result = result.groupby('date')['value'].mean().reset_index()
-            
-            # Filtrar desde 2000
-            result = result[result['date'] >= '2000-01-01']
-            
-            results[country] = result.reset_index(drop=True)
+            # Agregar por fecha y país (evita duplicados) y pivotar a ancho
+            panel = df_melted.groupby(['date', geo_col])['value'].mean().unstack(geo_col)
+        
+        # 7. Filtrar desde 2000 y alinear columnas con los países pedidos
+        panel = panel[panel.index >= '2000-01-01'].sort_index().reindex(columns=countries)
+        panel.index.name = 'date'
+        panel.columns.name = None
         
-        return results
+        # 8. Guardar vintages por país (mismas claves que las series individuales)
+        for country in countries:
+            col = panel[country].dropna()
+            if not col.empty:
+                record_vintage(series_key('eurostat', dataset_code, {**(filters or {}), 'geo': country}),
+                               col.rename('value').reset_index())
+        
+        return panel
 
     except Exception as e:
-        return {c: pd.DataFrame() for c in countries}
+        return empty
 
 
-@st.cache_data(ttl=86400, show_spinner=False)
-def fetch_esios_data_v6(token):
-    """
-    Obtiene datos de demanda eléctrica real de la API de ESIOS (Red Eléctrica).
-    Indicador 1293: Demanda real (MW)
-    Versión 6: CHUNKS MENSUALES + RETIES.
-    Para máxima fiabilidad, bajamos bloques de 1 mes (payload ligero) y reintentamos si falla.
-    """
-    if not token:
-        return pd.DataFrame()
-    
-    all_dfs = []
-    end_year = datetime.now().year
-    start_year = 2000
-    
-    import time
+ESIOS_CHUNK_DIR = os.path.join(CACHE_DIR, "esios_chunks")
+ESIOS_QUARANTINE_DIR = os.path.join(ESIOS_CHUNK_DIR, "quarantine")
+
 
-    # Generar rangos MENSUALES para evitar Timeouts
-    # 26 años * 12 meses = ~300 peticiones.
+def _esios_month_ranges(start_year=2000, now=None):
+    """Rangos mensuales [(mes 'YYYY-MM', inicio, fin)] desde start_year hasta el mes actual."""
+    now = now or datetime.now()
     ranges = []
-    for year in range(start_year, end_year + 1):
+    for year in range(start_year, now.year + 1):
         for month in range(1, 13):
             # Cuidado con fecha futura
-            if year == end_year and month > datetime.now().month:
+            if year == now.year and month > now.month:
                 break
-                
             # Fin de mes
             last_day = pd.Period(f"{year}-{month}").days_in_month
             s_str = f"{year}-{month:02d}-01T00:00:00"
             e_str = f"{year}-{month:02d}-{last_day}T23:59:59"
-            ranges.append((s_str, e_str))
+            ranges.append((f"{year}-{month:02d}", s_str, e_str))
+    return ranges
+
+
+def _fetch_esios_chunk(token, s_str, e_str, max_retries=3):
+    """
+    Descarga un mes "raw" del indicador 1293 con reintentos.
+    Devuelve DataFrame(date, value) (vacío si el mes no tiene datos) o None si falla.
+    """
+    url = f"https://api.esios.ree.es/indicators/1293?start_date={s_str}&end_date={e_str}" # Sin time_trunc (Raw)
+    
+    headers = {
+        'Accept': 'application/json; application/vnd.esios-api-v1+json',
+        'Content-Type': 'application/json',
+        'x-api-key': token,
+        'User-Agent': "Mozilla/5.0 (Windows NT 10.0; Win64; x64)" 
+    }
+    
+    for attempt in range(max_retries):
+        try:
+            # Timeout 10s suficiente para 1 mes
+            with span('esios.request'):
+                response = requests.get(url, headers=headers, timeout=10)
             
-    total_steps = len(ranges)
-    progress_text = "Descargando histórico ESIOS (Mes a Mes)... Esta operación puede tardar 1-2 minutos."
-    my_bar = st.progress(0, text=progress_text)
+            if response.status_code == 200:
+                data = response.json()
+                chunk = pd.DataFrame(columns=['date', 'value'])
+                if 'indicator' in data and 'values' in data['indicator']:
+                    raw = pd.DataFrame(data['indicator']['values'])
+                    if not raw.empty:
+                        raw['date'] = pd.to_datetime(raw['datetime'], utc=True, errors='coerce')
+                        raw = raw.dropna(subset=['date'])
+                        raw['date'] = raw['date'].dt.tz_localize(None)
+                        raw['value'] = pd.to_numeric(raw['value'], errors='coerce')
+                        chunk = raw[['date', 'value']]
+                return chunk
+            
+            elif response.status_code == 403:
+                print(f"Bloqueo 403 en {s_str}.") 
+                # No retry on 403 usually (blocked), but maybe temporary? break to be safe
+                return None
+            elif response.status_code == 429: # Rate limit
+                time.sleep(2) # Esperar más
+                
+        except Exception as e:
+            print(f"Error {e} en {s_str}. Retry {attempt+1}/{max_retries}")
+            time.sleep(1)
+    
+    print(f"Fallo definitivo en chunk {s_str}")
+    return None
+
+
+def validate_esios_chunks(chunks, now=None):
+    """
+    Valida cada mes descargado frente a rangos físicos y a sus meses vecinos.
+    
+    Comprobaciones por chunk:
+    - Magnitud: mediana de la demanda dentro de ESIOS_DEMAND_MW_RANGE (MW).
+    - Nº de muestras: días cubiertos y muestras/día coherentes con la resolución
+      de los meses vecinos anteriores o de los posteriores (un cambio de
+      resolución de ESIOS coincide con uno de los dos lados; un mes anómalo, con
+      ninguno). Un cambio en el último mes solo se acepta cuando lo confirman
+      los meses siguientes.
+    - Continuidad: mediana del mes frente a la mediana de los meses vecinos.
+    
+    Args:
+        chunks: {'YYYY-MM': DataFrame(date, value)}
+    Returns:
+        {'YYYY-MM': [motivos]} solo para los meses sospechosos
+    """
+    now = now or datetime.now()
+    lo, hi = ESIOS_DEMAND_MW_RANGE
+    stats = {}
+    for month, chunk in chunks.items():
+        if chunk is None or chunk.empty:
+            continue
+        values = chunk['value'].dropna()
+        n_days = chunk['date'].dt.normalize().nunique()
+        stats[month] = {
+            'median': values.median() if not values.empty else np.nan,
+            'n_days': n_days,
+            'per_day': len(values) / max(n_days, 1),
+        }
+    if not stats:
+        return {}
+
+    summary = pd.DataFrame.from_dict(stats, orient='index').sort_index()
+    # Mediana de los vecinos (± ESIOS_NEIGHBOUR_MONTHS), excluyendo el propio mes;
+    # muestras/día: mediana de los vecinos anteriores y de los posteriores por separado
+    neighbours, per_day_sides = {}, {}
+    for pos, month in enumerate(summary.index):
+        lo_pos, hi_pos = max(0, pos - ESIOS_NEIGHBOUR_MONTHS), pos + ESIOS_NEIGHBOUR_MONTHS + 1
+        around = summary['median'].iloc[lo_pos:hi_pos].drop(month)
+        neighbours[month] = around.median() if not around.empty else np.nan
+        before, after = summary['per_day'].iloc[lo_pos:pos], summary['per_day'].iloc[pos + 1:hi_pos]
+        per_day_sides[month] = [side.median() for side in (before, after) if not side.empty]
+
+    current_month = f"{now.year}-{now.month:02d}"
+    issues = {}
+    for month, row in summary.iterrows():
+        problems = []
+        if np.isnan(row['median']) or not (lo <= row['median'] <= hi):
+            problems.append(f"magnitud fuera de rango ({row['median']:,.0f} MW)")
+        expected_days = pd.Period(month).days_in_month if month != current_month else now.day - 1
+        if row['n_days'] < ESIOS_MIN_DAY_COVERAGE * expected_days:
+            problems.append(f"cobertura incompleta ({row['n_days']}/{expected_days} días)")
+        sides = per_day_sides[month]
+        if sides and not any(0.5 * ref <= row['per_day'] <= 1.5 * ref for ref in sides):
+            refs = " / ".join(f"{ref:.0f}" for ref in sides)
+            problems.append(f"muestras/día anómalas ({row['per_day']:.0f} vs {refs} de los meses vecinos)")
+        ref = neighbours[month]
+        if not np.isnan(ref) and ref > 0 and not np.isnan(row['median']):
+            ratio = row['median'] / ref
+            if ratio > ESIOS_MAX_NEIGHBOUR_RATIO or ratio < 1 / ESIOS_MAX_NEIGHBOUR_RATIO:
+                problems.append(f"salto frente a meses vecinos (x{ratio:.2f})")
+        if problems:
+            issues[month] = problems
+    return issues
+
+
+def _load_esios_chunk(month):
+    path = os.path.join(ESIOS_CHUNK_DIR, f"1293_{month}.pkl")
+    try:
+        return pd.read_pickle(path)
+    except Exception:
+        return None
 
-    for i, (s_str, e_str) in enumerate(ranges):
+
+def _save_esios_chunk(month, chunk, quarantine_reasons=None):
+    """Guarda un mes validado, o lo mueve a cuarentena con sus motivos."""
+    if quarantine_reasons:
+        os.makedirs(ESIOS_QUARANTINE_DIR, exist_ok=True)
+        chunk.to_pickle(os.path.join(ESIOS_QUARANTINE_DIR, f"1293_{month}.pkl"))
+        with open(os.path.join(ESIOS_QUARANTINE_DIR, f"1293_{month}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(quarantine_reasons))
+        path = os.path.join(ESIOS_CHUNK_DIR, f"1293_{month}.pkl")
+        if os.path.exists(path):
+            os.remove(path)
+    else:
+        os.makedirs(ESIOS_CHUNK_DIR, exist_ok=True)
+        chunk.to_pickle(os.path.join(ESIOS_CHUNK_DIR, f"1293_{month}.pkl"))
+
+
+def _download_esios_months(token, ranges, label, progress=None):
+    """
+    Descarga una lista de meses informando del avance. Devuelve {mes: chunk}.
+    progress: callback(fracción, texto); por defecto, barra st.progress en la página.
+    """
+    chunks = {}
+    if not ranges:
+        return chunks
+    total_steps = len(ranges)
+    my_bar = None
+    if progress is None:
+        my_bar = st.progress(0, text=label)
+        progress = lambda fraction, text: my_bar.progress(fraction, text=text)
+    else:
+        progress(0, label)
+    for i, (month, s_str, e_str) in enumerate(ranges):
         # Actualizar barra cada 5 pasos para no saturar UI
         if i % 5 == 0 or i == total_steps - 1:
-            my_bar.progress((i + 1) / total_steps, text=f"Descargando {s_str[:7]}... ({i+1}/{total_steps})")
-        
-        url = f"https://api.esios.ree.es/indicators/1293?start_date={s_str}&end_date={e_str}" # Sin time_trunc (Raw)
-        
-        headers = {
-            'Accept': 'application/json; application/vnd.esios-api-v1+json',
-            'Content-Type': 'application/json',
-            'x-api-key': token,
-            'User-Agent': "Mozilla/5.0 (Windows NT 10.0; Win64; x64)" 
-        }
-        
-        # RETRY LOGIC
-        max_retries = 3
-        success = False
-        
-        for attempt in range(max_retries):
-            try:
-                # Timeout 10s suficiente para 1 mes
-                response = requests.get(url, headers=headers, timeout=10)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if 'indicator' in data and 'values' in data['indicator']:
-                        chunk = pd.DataFrame(data['indicator']['values'])
-                        if not chunk.empty:
-                            chunk['date'] = pd.to_datetime(chunk['datetime'], utc=True, errors='coerce')
-                            chunk = chunk.dropna(subset=['date'])
-                            chunk['date'] = chunk['date'].dt.tz_localize(None)
-                            chunk['value'] = pd.to_numeric(chunk['value'], errors='coerce')
-                            all_dfs.append(chunk[['date', 'value']])
-                    success = True
-                    break # Éxito, salir del retry loop
-                
-                elif response.status_code == 403:
-                    print(f"Bloqueo 403 en {s_str}.") 
-                    # No retry on 403 usually (blocked), but maybe temporary? break to be safe
-                    break
-                elif response.status_code == 429: # Rate limit
-                    time.sleep(2) # Esperar más
-                    
-            except Exception as e:
-                print(f"Error {e} en {s_str}. Retry {attempt+1}/{max_retries}")
-                time.sleep(1)
-        
-        if not success:
-            print(f"Fallo definitivo en chunk {s_str}")
-            
+            progress((i + 1) / total_steps, f"Descargando {month}... ({i+1}/{total_steps})")
+        chunk = _fetch_esios_chunk(token, s_str, e_str)
+        if chunk is not None:
+            chunks[month] = chunk
         time.sleep(0.05) # Pausa muy breve ya que hacemos muchas peticiones pequeñas
+    if my_bar is not None:
+        my_bar.empty()
+    return chunks
 
-    my_bar.empty()
 
+@st.cache_data(ttl=86400, show_spinner=False)
+def fetch_esios_data_v6(token, _progress=None):
+    """
+    Obtiene datos de demanda eléctrica real de la API de ESIOS (Red Eléctrica).
+    Indicador 1293: Demanda real (MW)
+    Versión 6: CHUNKS MENSUALES + RETIES + VALIDACIÓN POR CHUNK.
+    Para máxima fiabilidad, bajamos bloques de 1 mes (payload ligero) y reintentamos si falla.
+    
+    Los meses cerrados y validados se guardan en disco (ESIOS_CHUNK_DIR): una
+    recarga solo descarga los meses que faltan, el mes en curso y el anterior.
+    Los meses que no pasan validate_esios_chunks (unidades mezcladas, saltos,
+    cobertura incompleta) se ponen en cuarentena y se vuelven a pedir una vez;
+    si siguen mal se excluyen en vez de contaminar la serie.
+    
+    _progress: callback(fracción, texto) para informar del avance cuando se
+    llama desde un hilo en segundo plano (sin barra en la página). No forma
+    parte de la clave de caché.
+    """
+    if not token:
+        return pd.DataFrame()
+    
+    now = datetime.now()
+    ranges = _esios_month_ranges(2000, now)
+    # Mes en curso y anterior siempre se refrescan (datos aún provisionales)
+    recent = {m for m, _, _ in ranges[-2:]}
+    
+    chunks = {}
+    pending = []
+    for month, s_str, e_str in ranges:
+        cached = None if month in recent else _load_esios_chunk(month)
+        if cached is not None:
+            chunks[month] = cached
+        else:
+            pending.append((month, s_str, e_str))
+    
+    progress_text = "Descargando histórico ESIOS (Mes a Mes)... Esta operación puede tardar 1-2 minutos."
+    chunks.update(_download_esios_months(token, pending, progress_text, _progress))
+    
+    # Validación y re-descarga dirigida solo de los meses anómalos
+    issues = validate_esios_chunks(chunks, now)
+    if issues:
+        retry = [r for r in ranges if r[0] in issues]
+        refetched = _download_esios_months(token, retry, f"Re-descargando {len(retry)} meses anómalos de ESIOS...", _progress)
+        chunks.update(refetched)
+        issues = validate_esios_chunks(chunks, now)
+    
+    for month, chunk in chunks.items():
+        if month in issues:
+            print(f"ESIOS {month} en cuarentena: {'; '.join(issues[month])}")
+            _save_esios_chunk(month, chunk, quarantine_reasons=issues[month])
+        elif month not in recent:
+            _save_esios_chunk(month, chunk)
+    
+    all_dfs = [c for m, c in chunks.items() if m not in issues and not c.empty]
     if all_dfs:
         full_raw = pd.concat(all_dfs).drop_duplicates(subset=['date']).sort_values('date')
         full_daily = full_raw.set_index('date').resample('D')['value'].mean().reset_index()
+        record_vintage(series_key('esios', '1293'), full_daily)
         return full_daily
     
     return pd.DataFrame()
-
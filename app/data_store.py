@@ -0,0 +1,229 @@
+"""
+Almacén de datos de solo lectura compartido por todas las sesiones del proceso.
+
+load_snapshot() descarga (o reconstruye desde los vintages) los indicadores
+de España y el ICTR, y los guarda una sola vez con st.cache_resource: cada
+sesión recibe una referencia al MISMO objeto, sin las copias deserializadas de
+st.cache_data. La memoria deja de crecer con el número de usuarios.
+
+Las fuentes lentas (demanda ESIOS, paneles de la comparativa con todos los
+países de PEER_GEOS y el nowcast, que depende de ESIOS) no bloquean la página:
+start_slow_sources() las lanza en segundo plano (background.submit), también
+compartidas entre sesiones, y la página las pinta cuando están listas.
+
+Los datos son inmutables:
+- los contenedores son MappingProxyType (no se pueden añadir ni sustituir series),
+- los DataFrame no se modifican nunca: quien necesite añadir columnas trabaja
+  sobre una copia (p. ej. derived.esios_trend).
+En st.session_state solo quedan las selecciones del usuario (widgets).
+"""
+from types import MappingProxyType
+
+import pandas as pd
+import streamlit as st
+import background
+from analysis import calculate_ictr
+from cache_utils import fingerprint
+from data_loader import (fetch_eurostat_data, fetch_esios_data_v6, fetch_eurostat_panel,
+                         fetch_ine_data, frames_to_panel)
+from nowcast import nowcast_ictr
+from vintage_store import get_vintage_store, series_key
+from utils import EUROSTAT_CONFIG, PEER_GEOS
+
+ICTR_INPUTS = ['Renta_PC', 'IPC', 'Paro', 'Vivienda', 'Deuda_PC']
+# Indicadores por país: nombre -> (clave de EUROSTAT_CONFIG, etiqueta)
+COUNTRY_INDICATORS = {
+    # 1. Bienestar & Desigualdad
+    'Renta_PC': ("REAL_GDP_PC", "Renta Real per Cápita"),
+    'Gini': ("GINI", "Desigualdad (Gini)"),
+    'AROPE': ("AROPE", "Riesgo Pobreza"),
+    # 2. Economía Doméstica
+    'IPC': ("HICP", "Coste Vida (IPC)"),
+    'Vivienda': ("HOUSE_PRICES", "Precio Vivienda"),
+    # 3. Deuda & Esfuerzo Fiscal
+    'Deuda_PC': ("DEBT_PC", "Deuda Pública Total"),
+    'Presion_Fiscal': ("TAX_REVENUE", "Presión Fiscal"),
+    # 4. Laboral & Educación
+    'Paro': ("UNEMPLOYMENT", "Paro Registrado"),
+    'NiNis': ("NEET", "Jóvenes Ni-Ni"),
+    # 5. Per Cápita
+    'Poblacion': ("POPULATION", "Población"),
+    'Deuda_Abs': ("DEBT_ABSOLUTE", "Deuda Absoluta"),
+}
+PEER_METRICS = {'GDP': "GDP_PEERS", 'Unemployment': "UNEMPLOYMENT", 'Sentiment': "SENTIMENT"}
+SNAPSHOT_MAX_ENTRIES = 8  # Snapshot actual + algunas vistas históricas (vintages)
+
+
+class DataSnapshot:
+    """Indicadores de España + ICTR de un momento dado, compartidos entre sesiones. No modificar."""
+
+    __slots__ = ('indicators', 'ictr_df', 'explained_var', 'as_of', 'inputs_fingerprint')
+
+    def __init__(self, indicators, ictr_df, explained_var, as_of=None):
+        self.indicators = MappingProxyType(indicators)
+        self.ictr_df = ictr_df
+        self.explained_var = explained_var
+        self.as_of = as_of
+        # Contenido de las series del ICTR: identifica el nowcast que depende de este snapshot
+        self.inputs_fingerprint = fingerprint({k: indicators[k] for k in ICTR_INPUTS if k in indicators})
+
+    def with_sources(self, **extra):
+        """Indicadores + series de las fuentes lentas ya cargadas (vista de solo lectura, sin copiar)."""
+        return MappingProxyType({**self.indicators, **extra})
+
+    @property
+    def nbytes(self):
+        frames = [*self.indicators.values(), self.ictr_df]
+        return int(sum(df.memory_usage(deep=True).sum() for df in frames if df is not None))
+
+
+def select_peers(peer_panels, selection):
+    """
+    {métrica: panel} recortado a los países seleccionados. Los que no están en el
+    panel (códigos Eurostat fuera de PEER_GEOS, p. ej. --countries NO) salen como
+    columnas vacías en vez de un KeyError.
+    """
+    return {metric: panel.reindex(columns=list(selection)) for metric, panel in (peer_panels or {}).items()}
+
+
+# Helper for fetching data (NO dummy data - only real data)
+def get_data_or_dummy(func, config_item, name, vintage_as_of=None, country='ES'):
+    code = config_item
+    filters = {}
+
+    if isinstance(config_item, dict):
+        if 'code' in config_item:
+            code = config_item['code']
+            filters = config_item.get('filters', {}).copy()
+            # Override geo if creating peers data
+            if country != 'ES':
+                filters['geo'] = country
+        elif 'id' in config_item:
+            code = config_item['id']
+
+    df = pd.DataFrame()
+    try:
+        if vintage_as_of is not None:
+            # Vista histórica: reconstruir desde el almacén de vintages (sin descargar)
+            if func and func.__name__ == 'fetch_eurostat_data':
+                df = get_vintage_store().as_of(series_key('eurostat', code, filters), vintage_as_of)
+            elif func and func.__name__ == 'fetch_ine_data' and country == 'ES':
+                df = get_vintage_store().as_of(series_key('ine', code), vintage_as_of)
+        elif func:
+            if func.__name__ == 'fetch_ine_data' and country == 'ES':
+                df = func(code)
+            elif func.__name__ == 'fetch_eurostat_data':
+                df = func(code, filters=filters)
+    except Exception as e:
+        st.warning(f"Error cargando {name}: {e}")
+
+    # NO fallback to dummy data - return empty DataFrame if no data
+    if df is None:
+        df = pd.DataFrame()
+
+    return df
+
+
+def get_peer_panel(config, vintage_as_of=None, countries=PEER_GEOS):
+    """Panel ancho (date x país) con todos los países pedidos: 1 descarga y 1 melt por indicador."""
+    filters = {k: v for k, v in config.get('filters', {}).items() if k.lower() != 'geo'}
+    if vintage_as_of is not None:
+        keys = {c: series_key('eurostat', config['code'], {**filters, 'geo': c}) for c in countries}
+        snapshot = get_vintage_store().snapshot(vintage_as_of, series=list(keys.values()))
+        frames = {c: snapshot[k] for c, k in keys.items() if k in snapshot}
+        return frames_to_panel(frames, countries)
+    return fetch_eurostat_panel(config['code'], list(countries), filters)
+
+
+@st.cache_resource(ttl=86400, max_entries=SNAPSHOT_MAX_ENTRIES, show_spinner=False)
+def load_snapshot(vintage_as_of=None):
+    """
+    Snapshot compartido de los indicadores de España y el ICTR.
+    vintage_as_of=None: datos actuales; una fecha: datos tal y como estaban publicados.
+    """
+    def load(config_key, name):
+        return get_data_or_dummy(fetch_eurostat_data, EUROSTAT_CONFIG[config_key], name, vintage_as_of)
+
+    # --- INDICADORES ESPAÑA (PRINCIPALES) ---
+    indicators = {name: load(config_key, label) for name, (config_key, label) in COUNTRY_INDICATORS.items()}
+
+    # --- ICTR (una vez por snapshot, no por sesión) ---
+    ictr_df, explained_var = calculate_ictr({k: indicators[k] for k in ICTR_INPUTS})
+    if ictr_df is None:
+        ictr_df = pd.DataFrame(columns=['ICTR'])  # Sin datos suficientes (p. ej. vista histórica sin vintages)
+
+    return DataSnapshot(indicators, ictr_df, explained_var, vintage_as_of)
+
+
+# --- FUENTES LENTAS (segundo plano) ---
+def _load_esios(task, esios_token, vintage_as_of):
+    """Datos de Alta Frecuencia (ESIOS): demanda diaria."""
+    if vintage_as_of is not None:
+        return get_vintage_store().as_of(series_key('esios', '1293'), vintage_as_of)
+    if esios_token:
+        return fetch_esios_data_v6(esios_token, _progress=task.report)
+    return pd.DataFrame()
+
+
+def _load_peer_panels(task, vintage_as_of):
+    """Comparativa internacional: un panel por métrica con todos los países."""
+    panels = {}
+    for i, (metric, config_key) in enumerate(PEER_METRICS.items()):
+        task.report(i / len(PEER_METRICS), f"Comparativa internacional: {metric} ({i + 1}/{len(PEER_METRICS)})")
+        panels[metric] = get_peer_panel(EUROSTAT_CONFIG[config_key], vintage_as_of)
+    return MappingProxyType(panels)
+
+
+def _load_nowcast(task, snapshot, esios_task, vintage_as_of):
+    """Nowcast de frecuencia mixta: series del ICTR + demanda eléctrica diaria, sin interpolar."""
+    esios_df = esios_task.result(pd.DataFrame(), timeout=None)  # Espera a ESIOS (otro hilo del pool)
+    task.report(0.5, "Nowcast: estimando el modelo factorial dinámico")
+    inputs = {**{k: snapshot.indicators[k] for k in ICTR_INPUTS}, 'Demanda_Electrica': esios_df}
+    return nowcast_ictr(inputs, as_of=vintage_as_of)
+
+
+def start_slow_sources(snapshot, esios_token=None, vintage_as_of=None):
+    """
+    Lanza (o reutiliza, si otra sesión ya lo hizo) las cargas lentas.
+    Devuelve {'esios': task, 'peers': task, 'nowcast': task} sin esperar.
+    Si el rerun está perfilando, las tareas nuevas graban sus spans en task.spans.
+    La key del nowcast incluye la huella de las series del ICTR: un snapshot nuevo
+    (caducado o invalidado) lanza un nowcast nuevo en vez de reutilizar el anterior.
+    """
+    esios = background.submit(('esios', esios_token, vintage_as_of), "Demanda eléctrica (ESIOS)",
+                              _load_esios, esios_token, vintage_as_of)
+    peers = background.submit(('peers', vintage_as_of), "Comparativa internacional",
+                              _load_peer_panels, vintage_as_of)
+    nowcast_key = ('nowcast', esios_token, vintage_as_of, snapshot.inputs_fingerprint)
+    nowcast = background.submit(nowcast_key, "Nowcast del ICTR", _load_nowcast, snapshot, esios, vintage_as_of)
+    return {'esios': esios, 'peers': peers, 'nowcast': nowcast}
+
+
+# --- INFORMES POR PAÍS (lotes) ---
+def load_country_panels(countries, vintage_as_of=None):
+    """
+    Snapshot multi-país para informes en lote: {indicador: panel date x país}
+    para COUNTRY_INDICATORS y PEER_METRICS (todos los PEER_GEOS). Una descarga
+    por dataset, sea cual sea el número de países.
+    """
+    countries = list(dict.fromkeys(countries))
+    panels = {name: get_peer_panel(EUROSTAT_CONFIG[config_key], vintage_as_of, countries)
+              for name, (config_key, _) in COUNTRY_INDICATORS.items()}
+    peers = {metric: get_peer_panel(EUROSTAT_CONFIG[config_key], vintage_as_of)
+             for metric, config_key in PEER_METRICS.items()}
+    return MappingProxyType(panels), MappingProxyType(peers)
+
+
+def country_indicators(panels, country):
+    """Indicadores de un país (DataFrame(date, value) por nombre) a partir de los paneles."""
+    indicators = {}
+    for name, panel in panels.items():
+        series = panel[country].dropna() if country in panel else pd.Series(dtype=float)
+        indicators[name] = series.rename('value').rename_axis('date').reset_index()
+    return indicators
+
+
+def country_ictr(indicators):
+    """ICTR de un país con las mismas entradas que el de España (None si no hay datos suficientes)."""
+    ictr_df, _ = calculate_ictr({k: indicators[k] for k in ICTR_INPUTS})
+    return ictr_df
@@ -52,4 +52,21 @@ TOKEN = "33682298950d87693d2208197771746960c1fb413f9ee47265be7234661853d9" # Tok
 # I'll assume standard ESIOS behavior: Time Trunc = Sum.
 # 
 # Let's write the debug script to run LOCALLY on the user machine (where the token might be cached or user can input it).
-pass
+#
+# RESUELTO: fetch_esios_data_v6 valida cada chunk mensual (validate_esios_chunks),
+# pone en cuarentena los meses con magnitud/saltos anómalos y solo re-descarga esos.
+# Este script revisa los chunks guardados en disco sin llamar a la API.
+
+if __name__ == "__main__":
+    import os
+    from data_loader import ESIOS_CHUNK_DIR, validate_esios_chunks
+
+    chunks = {}
+    for fname in sorted(os.listdir(ESIOS_CHUNK_DIR)) if os.path.isdir(ESIOS_CHUNK_DIR) else []:
+        if fname.startswith("1293_") and fname.endswith(".pkl"):
+            chunks[fname[5:12]] = pd.read_pickle(os.path.join(ESIOS_CHUNK_DIR, fname))
+
+    issues = validate_esios_chunks(chunks)
+    print(f"{len(chunks)} meses en caché, {len(issues)} sospechosos")
+    for month, problems in issues.items():
+        print(f"  {month}: {'; '.join(problems)}")
@@ -0,0 +1,237 @@
+"""
+Series derivadas (per cápita, normalizaciones, tendencias) compartidas por el
+dashboard, el informe PDF y el contexto de la IA.
+
+Cada función decorada con @derived se memoiza por el hash de contenido de sus
+entradas: se calcula una vez por snapshot de datos y cualquier sesión o ruta
+(pestaña, PDF, IA) que pida la misma derivación recibe el resultado ya hecho.
+El resultado es compartido: no modificarlo.
+"""
+import json
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+from cache_utils import LRUCache, fingerprint
+from profiling import span
+from utils import AI_CONTEXT_MAX_TOKENS
+
+ESIOS_TREND_WINDOW = 365  # Media móvil anual (días)
+
+# Series en tasa / % (la variación anual va en puntos); el resto son niveles (variación en %)
+RATE_SERIES = {'Gini', 'AROPE', 'Paro', 'Deuda_PC', 'Presion_Fiscal', 'NiNis'}
+RATE_PEERS = {'Unemployment'}  # Lo mismo para los paneles de la comparativa (une_rt_m en PC_ACT)
+# Orden de prioridad en el contexto de la IA (si no cabe en el presupuesto se recorta por el final)
+AI_SERIES_PRIORITY = ['Renta_PC', 'IPC', 'Paro', 'Vivienda', 'Deuda_PC', 'Presion_Fiscal', 'Gini', 'AROPE',
+                      'NiNis', 'Deuda_Abs', 'Poblacion']
+SUMMARY_FIELDS = ['valor', 'fecha', 'var_anual', 'percentil', 'z']
+PEER_FIELDS = ['valor_ES', 'var_anual_ES', 'puesto_ES', 'n_paises', 'mediana']
+
+_derived_cache = LRUCache(max_entries=256)
+_MISSING = object()
+
+
+def derived(func):
+    """Memoiza una derivación por hash de contenido de sus argumentos."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        key = fingerprint(func.__name__, args, kwargs)
+        result = _derived_cache.get(key, _MISSING)
+        if result is _MISSING:
+            with span(f"derived.{func.__name__}"):
+                result = func(*args, **kwargs)
+                _derived_cache.put(key, result)
+        return result
+    return wrapper
+
+
+@derived
+def base100(panel):
+    """
+    Panel ancho (date x país) normalizado a Base 100 en el primer dato de cada
+    columna: (Valor / Primer Valor) * 100, en una sola operación por columnas.
+    """
+    if panel is None or panel.empty:
+        return panel
+    first = panel.bfill().iloc[0]
+    return panel.div(first) * 100
+
+
+@derived
+def debt_per_capita(deuda_abs, poblacion):
+    """
+    Deuda pública por habitante (EUR), cruzando por año.
+    deuda_abs en millones EUR, poblacion en personas. Devuelve (date, deuda_pc, year).
+    """
+    if deuda_abs is None or poblacion is None or deuda_abs.empty or poblacion.empty:
+        return pd.DataFrame(columns=['date', 'deuda_pc', 'year'])
+    deuda_df = deuda_abs.assign(year=deuda_abs['date'].dt.year)
+    pob_df = poblacion.assign(year=poblacion['date'].dt.year)
+
+    merged = deuda_df.merge(pob_df[['year', 'value']], on='year', suffixes=('_deuda', '_pob'))
+    # Deuda en millones EUR, población en unidades -> per cápita en EUR
+    merged['deuda_pc'] = (merged['value_deuda'] * 1_000_000) / merged['value_pob']
+    return merged[['date', 'deuda_pc', 'year']]
+
+
+@derived
+def esios_trend(esios_raw):
+    """Demanda diaria indexada por fecha + media móvil anual (columna Trend_365)."""
+    if esios_raw is None or esios_raw.empty:
+        return pd.DataFrame(columns=['value', 'Trend_365'])
+    esios_df = esios_raw.set_index('date').copy()  # Nunca escribir sobre el dato compartido
+    esios_df['Trend_365'] = esios_df['value'].rolling(window=ESIOS_TREND_WINDOW).mean()
+    return esios_df
+
+
+@derived
+def esios_trend_yoy(esios_raw):
+    """
+    Variación de la tendencia anual frente a hace un año.
+    Devuelve {'current', 'year_ago', 'delta_perc'} o None si no hay tendencia.
+    """
+    trend = esios_trend(esios_raw)['Trend_365'].dropna()
+    if trend.empty:
+        return None
+    current_val = float(trend.iloc[-1])
+    # Comparar con hace 1 año (365 días)
+    year_ago_val = float(trend.iloc[-366]) if len(trend) > 366 else current_val
+    return {'current': current_val, 'year_ago': year_ago_val,
+            'delta_perc': ((current_val / year_ago_val) - 1) * 100}
+
+
+def growth_since_start(df, value_col='value'):
+    """% de variación entre el primer y el último dato."""
+    return ((df[value_col].iloc[-1] / df[value_col].iloc[0]) - 1) * 100
+
+
+def _latest(df, value_col='value'):
+    return df[value_col].iloc[-1] if df is not None and not df.empty else "N/A"
+
+
+@derived
+def series_summary(frames):
+    """
+    Resumen de todas las series {nombre: DataFrame(date, value)} en una sola pasada
+    vectorizada sobre el panel largo (serie, date, value):
+    valor y fecha del último dato, variación anual (puntos en RATE_SERIES, % en el
+    resto), percentil del último dato en su histórico y z-score.
+    """
+    frames = {name: df for name, df in frames.items() if df is not None and not df.empty}
+    if not frames:
+        return pd.DataFrame(columns=SUMMARY_FIELDS)
+    long = (pd.concat({name: df[['date', 'value']] for name, df in frames.items()}, names=['serie'])
+            .reset_index(level='serie').dropna(subset=['value']).sort_values(['serie', 'date']))
+    grouped = long.groupby('serie', sort=False)['value']
+
+    last = long.groupby('serie', sort=False).tail(1).set_index('serie')
+    latest = long['serie'].map(last['value'])
+    percentile = (long['value'] <= latest).groupby(long['serie'], sort=False).mean() * 100
+    z = (last['value'] - grouped.mean()) / grouped.std()
+
+    # Valor de hace un año: último dato <= fecha del último - 1 año, para todas las series a la vez
+    targets = (last.assign(date=last['date'] - pd.DateOffset(years=1))
+               .reset_index()[['serie', 'date']].sort_values('date'))
+    year_ago = (pd.merge_asof(targets, long.sort_values('date'), on='date', by='serie')
+                .set_index('serie')['value'].reindex(last.index))
+    is_rate = last.index.isin(list(RATE_SERIES))
+    yoy = np.where(is_rate, last['value'] - year_ago, (last['value'] / year_ago - 1) * 100)
+
+    return pd.DataFrame({
+        'valor': last['value'],
+        'fecha': last['date'].dt.strftime('%Y-%m'),
+        'var_anual': yoy,
+        'percentil': percentile.reindex(last.index),
+        'z': z.reindex(last.index),
+    })
+
+
+@derived
+def peer_summary(peers_data, country='ES'):
+    """
+    Posición de `country` en cada panel de la comparativa (último dato de cada país):
+    valor, variación anual (puntos en RATE_PEERS, % en el resto), puesto (1 = valor
+    más alto), nº de países y mediana.
+    """
+    rows = {}
+    for metric, panel in peers_data.items():
+        if panel is None or panel.empty or country not in panel:
+            continue
+        filled = panel.ffill()
+        latest = filled.iloc[-1]
+        year_ago = filled.asof(filled.index[-1] - pd.DateOffset(years=1))
+        valid = latest.dropna()
+        if country not in valid:
+            continue
+        if metric in RATE_PEERS:
+            yoy = latest[country] - year_ago[country]
+        else:
+            yoy = (latest[country] / year_ago[country] - 1) * 100
+        rows[metric] = {
+            'valor_ES': latest[country],
+            'var_anual_ES': yoy,
+            'puesto_ES': valid.rank(ascending=False, method='min')[country],
+            'n_paises': len(valid),
+            'mediana': valid.median(),
+        }
+    return pd.DataFrame.from_dict(rows, orient='index', columns=PEER_FIELDS)
+
+
+def _significant(value, digits=3):
+    """Redondeo a `digits` cifras significativas (menos tokens); NaN -> None."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, (int, np.integer, str)):
+        return value if isinstance(value, str) else int(value)
+    value = float(value)
+    if value == 0 or not np.isfinite(value):
+        return 0.0 if value == 0 else None
+    return round(value, max(0, digits - 1 - int(np.floor(np.log10(abs(value))))))
+
+
+def _table(df, fields):
+    """{fila: [valores]} en el orden de `fields` (formato columnar: las claves no se repiten)."""
+    return {str(name): [_significant(row[f]) for f in fields] for name, row in df[fields].iterrows()}
+
+
+def ai_context(indicators, status_text, peers_data=None, ictr=None, max_tokens=AI_CONTEXT_MAX_TOKENS):
+    """
+    Contexto de datos para Gemini: el mismo dict en la pestaña IA y en el PDF.
+    Cubre todas las series (series_summary) y la posición en la comparativa
+    (peer_summary) en formato columnar, y se recorta hasta caber en max_tokens
+    (~4 caracteres por token del JSON compacto): primero sin percentil/z-score,
+    después quitando las series de menor prioridad.
+    """
+    frames = {k: v for k, v in indicators.items() if k != 'Demanda_Electrica'}
+    summary = series_summary(frames)
+    summary = summary.reindex([s for s in AI_SERIES_PRIORITY if s in summary.index]
+                              + [s for s in summary.index if s not in AI_SERIES_PRIORITY])
+    peers = peer_summary(dict(peers_data)) if peers_data else pd.DataFrame(columns=PEER_FIELDS)
+    deuda_pc_df = debt_per_capita(indicators.get('Deuda_Abs'), indicators.get('Poblacion'))
+    trend_yoy = esios_trend_yoy(indicators.get('Demanda_Electrica'))
+
+    def build(fields, n_series):
+        context = {
+            "Tendencia": status_text,
+            "ICTR": _significant(ictr) if ictr is not None else "N/A",
+            "Deuda_PC_EUR": _significant(_latest(deuda_pc_df, 'deuda_pc')),
+            "Demanda_Electrica_Tendencia_YoY": _significant(trend_yoy['delta_perc']) if trend_yoy else "N/A",
+            "campos_series": fields,
+            "series": _table(summary.iloc[:n_series], fields),
+        }
+        if not peers.empty:
+            context["campos_comparativa"] = PEER_FIELDS
+            context["comparativa"] = _table(peers, PEER_FIELDS)
+        return context
+
+    def tokens(context):
+        return len(json.dumps(context, ensure_ascii=False, separators=(',', ':'))) / 4
+
+    context = build(SUMMARY_FIELDS, len(summary))
+    if tokens(context) > max_tokens:
+        context = build(SUMMARY_FIELDS[:3], len(summary))
+        n_series = len(summary)
+        while tokens(context) > max_tokens and n_series > 1:
+            n_series -= 1
+            context = build(SUMMARY_FIELDS[:3], n_series)
+    return context
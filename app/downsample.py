@@ -0,0 +1,81 @@
+"""
+Reducción de puntos de series largas antes de construir trazas.
+
+- lttb_indices: Largest-Triangle-Three-Buckets (conserva la forma visual).
+- minmax_indices: mínimo y máximo por bucket (conserva picos y valles).
+- downsample_xy: aplica el método elegido respetando un presupuesto de puntos
+  (CHART_POINT_BUDGET por defecto) y descartando NaN.
+Las series por debajo del presupuesto se devuelven intactas.
+"""
+import numpy as np
+import pandas as pd
+from utils import CHART_POINT_BUDGET
+
+
+def _as_float(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(float)
+    return x.astype(float)
+
+
+def lttb_indices(x, y, n_out):
+    """Índices seleccionados por LTTB (incluye siempre el primero y el último)."""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = _as_float(x)
+    y = np.asarray(y, dtype=float)
+
+    # Buckets interiores: el primer y el último punto se conservan
+    edges = (np.floor(np.arange(n_out - 1) * (n - 2) / (n_out - 2)) + 1).astype(int)
+    edges[-1] = n - 1
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if i < n_out - 3:
+            nxt_start, nxt_end = edges[i + 1], edges[i + 2]
+        else:
+            nxt_start, nxt_end = n - 1, n
+        avg_x = x[nxt_start:nxt_end].mean()
+        avg_y = y[nxt_start:nxt_end].mean()
+        # Área del triángulo (punto elegido anterior, candidato, media del bucket siguiente)
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+
+def minmax_indices(y, n_out):
+    """Índices del mínimo y el máximo de cada bucket (+ extremos), como mucho n_out."""
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    n_buckets = (n_out - 2) // 2
+    bucket = np.repeat(np.arange(n_buckets), np.diff(np.linspace(0, n, n_buckets + 1).astype(int)))
+    grouped = pd.Series(y).groupby(bucket)
+    idx = np.concatenate([grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy(), [0, n - 1]])
+    return np.unique(idx)
+
+
+def downsample_xy(x, y, n_out=None, method='lttb'):
+    """
+    Reduce (x, y) a como mucho n_out puntos. x puede ser fechas.
+    Devuelve (x, y) como arrays (o las entradas sin tocar si ya caben).
+    """
+    n_out = n_out or CHART_POINT_BUDGET
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    valid = ~np.isnan(y)
+    if not valid.all():
+        x, y = x[valid], y[valid]
+    if len(y) <= n_out:
+        return x, y
+    if method == 'minmax':
+        idx = minmax_indices(y, n_out)
+    else:
+        idx = lttb_indices(x, y, n_out)
+    return x[idx], y[idx]
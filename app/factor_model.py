@@ -0,0 +1,124 @@
+"""
+Lightweight NumPy factor engine for the ICTR.
+
+Replaces the scikit-learn StandardScaler/PCA pair: standardization (z-score),
+first (or first k) principal components via truncated SVD or power iteration,
+explained variance ratio and sign alignment. All functions accept a single
+(n_samples, n_features) matrix or a stacked (batch, n_samples, n_features)
+array, so several panels can be fitted in one call.
+"""
+import numpy as np
+
+
+class Standardizer:
+    """Z-score scaler (population std, ddof=0), compatible with StandardScaler."""
+
+    def fit(self, X):
+        X = np.asarray(X, dtype=float)
+        self.mean_ = X.mean(axis=-2, keepdims=True)
+        scale = X.std(axis=-2, keepdims=True)
+        # Constant columns are left centred but unscaled (same as sklearn)
+        scale[scale == 0.0] = 1.0
+        self.scale_ = scale
+        return self
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=float) - self.mean_) / self.scale_
+
+    def fit_transform(self, X):
+        return self.fit(X).transform(X)
+
+
+class FactorModel:
+    """
+    Principal-component factor model.
+
+    method: 'svd' (exact, thin SVD) or 'power' (power iteration, cheaper when
+    only the first components of a wide panel are needed).
+    After fit: components_ (k, p), explained_variance_ratio_ (k,), mean_ (1, p).
+    """
+
+    def __init__(self, n_components=1, method='svd', max_iter=500, tol=1e-12):
+        self.n_components = n_components
+        self.method = method
+        self.max_iter = max_iter
+        self.tol = tol
+
+    def fit(self, X):
+        self.fit_transform(X)
+        return self
+
+    def fit_transform(self, X):
+        X = np.asarray(X, dtype=float)
+        self.mean_ = X.mean(axis=-2, keepdims=True)
+        Xc = X - self.mean_
+        k = self.n_components
+
+        if self.method == 'svd':
+            U, S, Vt = np.linalg.svd(Xc, full_matrices=False)
+            total_ss = (S ** 2).sum(axis=-1, keepdims=True)
+            U, S, Vt = U[..., :k], S[..., :k], Vt[..., :k, :]
+        elif self.method == 'power':
+            U, S, Vt = _power_components(Xc, k, self.max_iter, self.tol)
+            total_ss = (Xc ** 2).sum(axis=(-2, -1))[..., None]
+        else:
+            raise ValueError(f"Unknown factor method: {self.method}")
+
+        U, Vt = _flip_signs(U, Vt)
+        self.components_ = Vt
+        self.singular_values_ = S
+        self.explained_variance_ratio_ = (S ** 2) / np.where(total_ss > 0, total_ss, 1.0)
+        return U * S[..., None, :]
+
+    def transform(self, X):
+        Xc = np.asarray(X, dtype=float) - self.mean_
+        return Xc @ np.swapaxes(self.components_, -1, -2)
+
+
+def _power_components(Xc, k, max_iter, tol):
+    """Top-k singular triplets by power iteration with deflation (batched)."""
+    C = np.swapaxes(Xc, -1, -2) @ Xc
+    p = C.shape[-1]
+    batch = C.shape[:-2]
+    vecs, vals = [], []
+    for _ in range(k):
+        v = np.ones(batch + (p,)) / np.sqrt(p)
+        for _ in range(max_iter):
+            w = (C @ v[..., None])[..., 0]
+            norm = np.linalg.norm(w, axis=-1, keepdims=True)
+            w = w / np.where(norm > 0, norm, 1.0)
+            delta = np.abs(np.abs((w * v).sum(axis=-1)) - 1.0).max()
+            v = w
+            if delta < tol:
+                break
+        lam = (v * (C @ v[..., None])[..., 0]).sum(axis=-1)
+        vecs.append(v)
+        vals.append(lam)
+        # Deflate so the next iteration finds the next component
+        C = C - lam[..., None, None] * (v[..., :, None] * v[..., None, :])
+
+    Vt = np.stack(vecs, axis=-2)
+    S = np.sqrt(np.clip(np.stack(vals, axis=-1), 0.0, None))
+    U = (Xc @ np.swapaxes(Vt, -1, -2)) / np.where(S > 0, S, 1.0)[..., None, :]
+    return U, S, Vt
+
+
+def _flip_signs(U, Vt):
+    """Deterministic signs: largest absolute loading of each component is positive."""
+    idx = np.abs(Vt).argmax(axis=-1)
+    signs = np.sign(np.take_along_axis(Vt, idx[..., None], axis=-1))[..., 0]
+    signs[signs == 0] = 1.0
+    return U * signs[..., None, :], Vt * signs[..., :, None]
+
+
+def align_signs(scores, reference):
+    """
+    Flips each factor so it correlates positively with `reference`
+    (e.g. the cross-sectional mean of the inputs, assumed pro-cyclical).
+    scores: (..., n, k), reference: (..., n). Returns (aligned_scores, signs).
+    """
+    s = scores - scores.mean(axis=-2, keepdims=True)
+    r = reference - reference.mean(axis=-1, keepdims=True)
+    cov = (s * r[..., :, None]).sum(axis=-2)
+    signs = np.where(cov < 0, -1.0, 1.0)
+    return scores * signs[..., None, :], signs
@@ -0,0 +1,204 @@
+"""
+Monitor de actualidad de los datos, solo con metadatos (sin descargar las series).
+
+Para cada indicador del dashboard se pregunta a la fuente por su último periodo
+publicado y su última actualización:
+- Eurostat: anotaciones del dataflow (UPDATE_DATA, OBS_PERIOD_OVERALL_LATEST),
+  unos KB por dataset en vez del dataset completo.
+- INE: último dato de la serie (DATOS_SERIE?nult=1).
+- ESIOS: último valor del indicador 1293 en las últimas 48 h.
+Las consultas van en paralelo, una por dataset aunque lo usen varios
+indicadores, y se comparan con lo ya descargado (almacén de vintages). El
+informe da el retraso de cada indicador y marca como pendiente lo que la
+fuente ha actualizado después de nuestra última descarga.
+
+refresh_stale() invalida solo las cachés de esos datos (y las tareas en
+segundo plano que dependen de ellos): el siguiente rerun descarga lo nuevo y
+reutiliza todo lo demás.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pandas as pd
+import requests
+import background
+from data_loader import _parse_eurostat_date, fetch_esios_data_v6, fetch_eurostat_data, fetch_eurostat_panel, fetch_ine_data
+from data_store import COUNTRY_INDICATORS, ICTR_INPUTS, PEER_METRICS, load_snapshot
+from metadata_catalog import EUROSTAT_SDMX_URL
+from vintage_store import get_vintage_store, series_key
+from utils import EUROSTAT_CONFIG, FRESHNESS_CHECK_S, FRESHNESS_WORKERS, PEER_GEOS
+
+# Último informe terminado por token ESIOS: se sigue mostrando mientras corre la siguiente comprobación
+_last_reports = {}
+
+REPORT_COLUMNS = ['indicador', 'fuente', 'codigo', 'publicado', 'actualizado', 'local', 'descargado',
+                  'retraso_dias', 'pendiente', 'error']
+
+
+def _local_time(value):
+    """Fecha con zona horaria -> hora local sin zona (como las fechas de descarga de los vintages)."""
+    ts = pd.Timestamp(value)
+    return ts.tz_convert(datetime.now().astimezone().tzinfo).tz_localize(None) if ts.tzinfo else ts
+
+
+# --- CONSULTAS DE METADATOS (una petición pequeña cada una) ---
+def eurostat_status(dataset_code, timeout=10):
+    """(último periodo publicado, última actualización) de un dataset según su dataflow."""
+    url = f"{EUROSTAT_SDMX_URL}/dataflow/ESTAT/{dataset_code}?format=JSON&lang=en"
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    annotations = {a.get('type'): a for a in response.json()['extension']['annotation']}
+    latest = annotations.get('OBS_PERIOD_OVERALL_LATEST', {}).get('title')
+    updated = annotations.get('UPDATE_DATA', {}).get('date')
+    return (_parse_eurostat_date(latest) if latest else pd.NaT,
+            _local_time(updated) if updated else pd.NaT)
+
+
+def ine_status(serie_code, timeout=10):
+    """(último periodo publicado, None) de una serie del INE: solo el último dato."""
+    url = f"https://servicios.ine.es/wstempus/js/ES/DATOS_SERIE/{serie_code}?nult=1"
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    data = response.json().get('Data') or []
+    return (pd.to_datetime(data[-1]['Fecha'], unit='ms') if data else pd.NaT), pd.NaT
+
+
+def esios_status(token, timeout=10):
+    """(último instante con dato, None) de la demanda real (1293) en las últimas 48 h."""
+    now = datetime.now()
+    url = (f"https://api.esios.ree.es/indicators/1293?start_date={(now - timedelta(days=2)):%Y-%m-%dT%H:%M:%S}"
+           f"&end_date={now:%Y-%m-%dT%H:%M:%S}")
+    headers = {'Accept': 'application/json; application/vnd.esios-api-v1+json', 'x-api-key': token}
+    response = requests.get(url, headers=headers, timeout=timeout)
+    response.raise_for_status()
+    values = response.json().get('indicator', {}).get('values') or []
+    if not values:
+        return pd.NaT, pd.NaT
+    return _local_time(max(pd.Timestamp(v['datetime']) for v in values)), pd.NaT
+
+
+# --- INFORME ---
+def monitored_series(esios_token=None):
+    """
+    Todo lo que carga el dashboard: [dict(indicador, fuente, codigo, filtros, serie)],
+    donde serie es la clave de vintage con la que se guarda la descarga (España).
+    """
+    items = []
+    for name, (config_key, _) in COUNTRY_INDICATORS.items():
+        config = EUROSTAT_CONFIG[config_key]
+        filters = config.get('filters', {})
+        items.append(dict(indicador=name, fuente='eurostat', codigo=config['code'], filtros=filters,
+                          serie=series_key('eurostat', config['code'], filters)))
+    for metric, config_key in PEER_METRICS.items():
+        config = EUROSTAT_CONFIG[config_key]
+        filters = {k: v for k, v in config.get('filters', {}).items() if k.lower() != 'geo'}
+        items.append(dict(indicador=f'Comparativa_{metric}', fuente='eurostat', codigo=config['code'],
+                          filtros=filters, serie=series_key('eurostat', config['code'], {**filters, 'geo': 'ES'})))
+    for key in get_vintage_store().series():
+        if key.startswith('ine:'):
+            items.append(dict(indicador=key, fuente='ine', codigo=key[len('ine:'):], filtros=None, serie=key))
+    if esios_token:
+        items.append(dict(indicador='Demanda_Electrica', fuente='esios', codigo='1293', filtros=None,
+                          serie=series_key('esios', '1293')))
+    return items
+
+
+def check_freshness(esios_token=None, now=None):
+    """
+    Informe de actualidad (DataFrame, una fila por indicador):
+    publicado / actualizado (fuente), local / descargado (almacén de vintages),
+    retraso_dias (días desde el último periodo publicado) y pendiente (la fuente
+    tiene datos posteriores a nuestra descarga).
+    """
+    now = pd.Timestamp(now or datetime.now())
+    items = monitored_series(esios_token)
+    queries = {(item['fuente'], item['codigo']) for item in items}
+    status_funcs = {'eurostat': eurostat_status, 'ine': ine_status,
+                    'esios': lambda _: esios_status(esios_token)}
+
+    def query(source_code):
+        source, code = source_code
+        try:
+            return status_funcs[source](code), None
+        except Exception as e:
+            return (pd.NaT, pd.NaT), str(e)
+
+    with ThreadPoolExecutor(max_workers=FRESHNESS_WORKERS) as pool:
+        results = dict(zip(queries, pool.map(query, queries)))
+    local = get_vintage_store().status(item['serie'] for item in items)
+
+    rows = []
+    for item in items:
+        (published, updated), error = results[(item['fuente'], item['codigo'])]
+        local_latest, fetched = local.get(item['serie'], (pd.NaT, pd.NaT))
+        if item['fuente'] == 'eurostat':
+            # El último periodo del dataset puede ser de otro país: se compara la fecha de actualización
+            pending = pd.notna(updated) and (pd.isna(fetched) or updated > fetched)
+        elif item['fuente'] == 'esios':
+            pending = pd.notna(published) and (pd.isna(local_latest) or published.normalize() > local_latest)
+        else:
+            pending = pd.notna(published) and (pd.isna(local_latest) or published > local_latest)
+        rows.append(dict(indicador=item['indicador'], fuente=item['fuente'], codigo=item['codigo'],
+                         filtros=item['filtros'], publicado=published, actualizado=updated,
+                         local=local_latest, descargado=fetched,
+                         retraso_dias=(now - published).days if pd.notna(published) else None,
+                         pendiente=bool(pending), error=error))
+    return pd.DataFrame(rows, columns=REPORT_COLUMNS + ['filtros'])
+
+
+def refresh_stale(report, esios_token=None):
+    """
+    Invalida solo las cachés de los indicadores pendientes del informe y las tareas
+    en segundo plano que dependen de ellos. Devuelve los indicadores refrescados.
+    """
+    stale = report[report['pendiente']]
+    forget = set()
+    for row in stale.itertuples():
+        if row.fuente == 'eurostat' and row.indicador.startswith('Comparativa_'):
+            fetch_eurostat_panel.clear(row.codigo, list(PEER_GEOS), row.filtros)  # Misma llamada que get_peer_panel
+            forget.add('peers')
+        elif row.fuente == 'eurostat':
+            fetch_eurostat_data.clear(row.codigo, filters=dict(row.filtros))  # Misma llamada que get_data_or_dummy
+            forget.add('snapshot')
+            if row.indicador in ICTR_INPUTS:
+                forget.add('nowcast')
+        elif row.fuente == 'ine':
+            fetch_ine_data.clear(row.codigo)
+            forget.add('snapshot')
+        elif row.fuente == 'esios' and esios_token:
+            fetch_esios_data_v6.clear(esios_token)
+            forget.update({'esios', 'nowcast'})
+    if 'snapshot' in forget:
+        load_snapshot.clear(None)  # Solo el snapshot actual; las vistas históricas no cambian
+        forget.discard('snapshot')
+    for kind in forget:
+        background.forget(kind)
+    # El informe anterior ya no es válido: la próxima comprobación ve las nuevas descargas
+    _last_reports.clear()
+    background.forget('freshness')
+    return list(stale['indicador'])
+
+
+def _run_check(task, esios_token):
+    task.report(0.5, "Comprobando publicaciones nuevas")
+    return check_freshness(esios_token)
+
+
+def latest_freshness_report(esios_token=None):
+    """
+    Último informe terminado: (instante de la comprobación, informe), o (None, None)
+    si aún no ha terminado ninguna. La comprobación se comparte entre todas las
+    sesiones (background.submit) y se relanza en segundo plano cuando el informe
+    tiene más de FRESHNESS_CHECK_S; mientras tanto se devuelve el anterior.
+    """
+    key = ('freshness', esios_token)
+    task = background.submit(key, "Actualidad de los datos", _run_check, esios_token)
+    if task.done:
+        report = task.result()
+        if report is not None:
+            _last_reports[esios_token] = (task.submitted, report)
+        if time.time() - task.submitted > FRESHNESS_CHECK_S:
+            background.forget('freshness')
+            background.submit(key, "Actualidad de los datos", _run_check, esios_token)
+    return _last_reports.get(esios_token, (None, None))
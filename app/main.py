@@ -1,17 +1,26 @@
 import streamlit as st
 import requests
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from data_loader import fetch_ine_data, fetch_eurostat_data, fetch_esios_data_v6, fetch_eurostat_multi_country
-from analysis import calculate_ictr
-from ai_report import generate_economic_report
+from data_loader import fetch_esios_data_v6
+from data_store import load_snapshot, start_slow_sources, select_peers
+import background
+from freshness import latest_freshness_report, refresh_stale
+from ai_report import generate_economic_report, report_cache_key, stream_economic_report
 from pdf_report import build_pdf_report
-from utils import INE_CONFIG, EUROSTAT_CONFIG, PEER_COUNTRIES
+from data_export import EXPORT_FORMATS, available_formats, build_export, export_tables
+from derived import ai_context, debt_per_capita, esios_trend, esios_trend_yoy, growth_since_start
+from charts import build_ictr_figure, build_peers_figure, build_esios_figure, build_line_figure
+import profiling
+from profiling import span
+from utils import (PEER_COUNTRIES, PEER_GEOS, GEO_LABELS, CHART_POINT_BUDGET, BACKGROUND_POLL_S, AI_MODEL,
+                   FRESHNESS_POLL_S)
 
 # Page Config
 st.set_page_config(page_title="Monitor de la Economía Real", layout="wide", page_icon="🏘️")
 
+# Perfilado opcional de este rerun (?profile=1 o MONITOR_PROFILE=1)
+profile_run = profiling.start_run("main.py") if profiling.is_enabled(st.query_params) else None
+
 # --- HELP & CONFIGURATION SIDEBAR ---
 st.sidebar.title("Configuración")
 
@@ -51,16 +60,19 @@ with st.sidebar.expander("ℹ️ Ayuda y Metodología Detallada", expanded=False
     - **🟢 Mejorando**: El indicador combinado sube respecto al periodo anterior.
     - **🔴 Empeorando**: El indicador combinado baja.
     - **Fiabilidad**: Porcentaje de varianza explicada por el primer componente principal. Un valor alto (>50%) indica que los indicadores "se mueven juntos".
+    - **Nowcast (DFM mixto)**: Estimación del mes en curso con un modelo factorial dinámico que combina datos diarios (demanda eléctrica), mensuales, trimestrales y anuales sin interpolarlos.
     
     ---
     
     ## 🌍 Comparativa Internacional
     
     ### Países "Compañeros de Clase"
-    Comparamos España exclusivamente con economías similares en tamaño y estructura:
+    Por defecto comparamos España con economías similares en tamaño y estructura:
     - 🇪🇸 **España** | 🇩🇪 **Alemania** | 🇫🇷 **Francia**
     - 🇮🇹 **Italia** | 🇵🇹 **Portugal** | 🇵🇱 **Polonia**
     
+    En el sidebar (**🌍 Países de la comparativa**) puedes elegir cualquier país de la UE-27 y los agregados **UE-27** y **Zona Euro**. Todos se descargan una sola vez: cambiar la selección no genera nuevas descargas.
+    
     ### Método "Base 100"
     Para comparar países de distintos tamaños, normalizamos todas las series para que **empiecen en 100** al inicio del periodo.
     
@@ -141,6 +153,30 @@ if st.sidebar.button("⚡ Probar Conexión ESIOS"):
         except Exception as e:
             st.sidebar.error(f"Error de conexión: {e}")
 
+if st.sidebar.button("🩺 Revisar datos ESIOS", help="Valida cada mes descargado y vuelve a pedir solo los meses anómalos o ausentes."):
+    # Los meses válidos están en disco: al limpiar la caché solo se re-descargan los sospechosos
+    fetch_esios_data_v6.clear()
+    background.forget('esios')  # La demanda y el nowcast se relanzan con los meses corregidos
+    background.forget('nowcast')
+    st.sidebar.info("Validación ESIOS relanzada: solo se descargarán los meses anómalos.")
+
+
+with st.sidebar.expander("🕰️ Datos publicados a fecha (vintages)", expanded=False):
+    st.caption("Reconstruye los indicadores y el ICTR tal y como estaban publicados en una fecha pasada, a partir de las descargas guardadas.")
+    use_vintage = st.checkbox("Activar vista histórica", key="use_vintage")
+    vintage_date = st.date_input("Fecha de publicación", key="vintage_date", disabled=not use_vintage)
+
+# Fin del día elegido: incluye las descargas hechas ese mismo día
+vintage_as_of = pd.Timestamp(vintage_date) + pd.Timedelta(days=1) if use_vintage else None
+
+with st.sidebar.expander("🌍 Países de la comparativa", expanded=False):
+    peer_selection = st.multiselect(
+        "Países y agregados", PEER_GEOS, default=PEER_COUNTRIES, key="peer_selection",
+        format_func=lambda g: f"{GEO_LABELS.get(g, g)} ({g})"
+    )
+    st.caption("UE-27 + agregados UE/Zona Euro. Los datos de todos se cargan una vez; la selección solo filtra.")
+# España siempre se muestra (referencia de la comparativa)
+peer_selection = ['ES'] + [g for g in PEER_GEOS if g in peer_selection and g != 'ES']
 
 st.sidebar.markdown("---")
 # (El botón de PDF se renderizará al final del script para asegurar que los datos están listos)
@@ -151,93 +187,68 @@ st.markdown("Más allá del PIB: Bienestar, Desigualdad y Comparativa Real.")
 st.caption("📅 **Nota sobre datos**: Eurostat publica indicadores anuales con 6-18 meses de retraso. Los datos mensuales (paro, IPC) son más recientes.")
 
 # 1. Data Loading Section
-with st.spinner('Analizando datos de España y Europa...'):
-    
-    indicators = {}
-    peers_data = {'GDP': {}, 'Unemployment': {}, 'Sentiment': {}}
-    
-    # Helper for fetching data (NO dummy data - only real data)
-    def get_data_or_dummy(func, config_item, name, freq='M', country='ES'):
-        code = config_item
-        filters = {}
-        
-        if isinstance(config_item, dict):
-            if 'code' in config_item:
-                code = config_item['code']
-                filters = config_item.get('filters', {}).copy()
-                # Override geo if creating peers data
-                if country != 'ES':
-                    filters['geo'] = country
-            elif 'id' in config_item: 
-                code = config_item['id']
-        
-        df = pd.DataFrame()
-        try:
-            if func:
-                if func.__name__ == 'fetch_ine_data' and country == 'ES':
-                    df = func(code)
-                elif func.__name__ == 'fetch_eurostat_data':
-                    df = func(code, filters=filters)
-        except Exception as e:
-            st.warning(f"Error cargando {name}: {e}")
-            
-        # NO fallback to dummy data - return empty DataFrame if no data
-        if df is None:
-            df = pd.DataFrame()
-        
-        return df
-
-    # --- INDICADORES ESPAÑA (PRINCIPALES) ---
-    # 1. Bienestar & Desigualdad
-    indicators['Renta_PC'] = get_data_or_dummy(fetch_eurostat_data, EUROSTAT_CONFIG["REAL_GDP_PC"], "Renta Real per Cápita", 'Y')
-    indicators['Gini'] = get_data_or_dummy(fetch_eurostat_data, EUROSTAT_CONFIG["GINI"], "Desigualdad (Gini)", 'Y')
-    indicators['AROPE'] = get_data_or_dummy(fetch_eurostat_data, EUROSTAT_CONFIG["AROPE"], "Riesgo Pobreza", 'Y')
-    
-    # 2. Economía Doméstica
-    indicators['IPC'] = get_data_or_dummy(fetch_eurostat_data, EUROSTAT_CONFIG["HICP"], "Coste Vida (IPC)", 'M')
-    indicators['Vivienda'] = get_data_or_dummy(fetch_eurostat_data, EUROSTAT_CONFIG["HOUSE_PRICES"], "Precio Vivienda", 'Q')
-    
-    # 3. Deuda & Esfuerzo Fiscal
-    indicators['Deuda_PC'] = get_data_or_dummy(fetch_eurostat_data, EUROSTAT_CONFIG["DEBT_PC"], "Deuda Pública Total", 'Q')
-    indicators['Presion_Fiscal'] = get_data_or_dummy(fetch_eurostat_data, EUROSTAT_CONFIG["TAX_REVENUE"], "Presión Fiscal", 'Y')
-
-    # 4. Laboral & Educación
-    indicators['Paro'] = get_data_or_dummy(fetch_eurostat_data, EUROSTAT_CONFIG["UNEMPLOYMENT"], "Paro Registrado", 'M')
-    indicators['NiNis'] = get_data_or_dummy(fetch_eurostat_data, EUROSTAT_CONFIG["NEET"], "Jóvenes Ni-Ni", 'Y')
-    
-    # 5. Per Cápita
-    indicators['Poblacion'] = get_data_or_dummy(fetch_eurostat_data, EUROSTAT_CONFIG["POPULATION"], "Población", 'Y')
-    indicators['Deuda_Abs'] = get_data_or_dummy(fetch_eurostat_data, EUROSTAT_CONFIG["DEBT_ABSOLUTE"], "Deuda Absoluta", 'Y')
-    
-    # 6. Datos de Alta Frecuencia (ESIOS)
-    if esios_token:
-        indicators['Demanda_Electrica'] = fetch_esios_data_v6(esios_token)
-    else:
-        indicators['Demanda_Electrica'] = pd.DataFrame()
-    
-    # --- COMPARATIVA INTERNACIONAL (PEERS) ---
-    # Usar fetch_eurostat_multi_country para eficiencia (1 descarga por indicador)
-    gdp_config = EUROSTAT_CONFIG["GDP_PEERS"]
-    gdp_filters = {k: v for k, v in gdp_config.get('filters', {}).items() if k.lower() != 'geo'}
-    peers_data['GDP'] = fetch_eurostat_multi_country(gdp_config['code'], PEER_COUNTRIES, gdp_filters)
-    
-    unemp_config = EUROSTAT_CONFIG["UNEMPLOYMENT"]
-    unemp_filters = {k: v for k, v in unemp_config.get('filters', {}).items() if k.lower() != 'geo'}
-    peers_data['Unemployment'] = fetch_eurostat_multi_country(unemp_config['code'], PEER_COUNTRIES, unemp_filters)
-    
-    sent_config = EUROSTAT_CONFIG["SENTIMENT"]
-    sent_filters = {k: v for k, v in sent_config.get('filters', {}).items() if k.lower() != 'geo'}
-    peers_data['Sentiment'] = fetch_eurostat_multi_country(sent_config['code'], PEER_COUNTRIES, sent_filters)
-
-# 2. Analysis Section (ICTR - Semáforo)
-ictr_subset = {k: v for k, v in indicators.items() if k in ['Renta_PC', 'IPC', 'Paro', 'Vivienda', 'Deuda_PC']}
-ictr_df, explained_var = calculate_ictr(ictr_subset)
-
-# Save to session state for PDF/persistence
-st.session_state.indicators = indicators
-st.session_state.peers_data = peers_data
-st.session_state.current_ictr = ictr_df['ICTR'].iloc[-1] if not ictr_df.empty else 100
-current_ictr = st.session_state.current_ictr
+# Snapshot de solo lectura compartido por todas las sesiones (st.cache_resource);
+# la sesión solo aporta sus selecciones (token, fecha de vintage, países).
+# Solo los indicadores de España y el ICTR bloquean la página: ESIOS, la
+# comparativa y el nowcast se cargan en segundo plano y se pintan al terminar.
+with st.spinner('Analizando datos de España...'), span('carga_datos'):
+    snapshot = load_snapshot(vintage_as_of)
+slow = start_slow_sources(snapshot, esios_token or None, vintage_as_of)
+
+
+def collect_slow_sources(slow):
+    """Indicadores + comparativa + nowcast con lo que ya haya terminado (vacío si sigue en curso)."""
+    indicators = snapshot.with_sources(Demanda_Electrica=slow['esios'].result(pd.DataFrame()))
+    peers_data = select_peers(slow['peers'].result(), peer_selection)  # {métrica: panel ancho date x país}
+    nowcast_df, nowcast_info = slow['nowcast'].result(None) or (None, None)
+    return indicators, peers_data, nowcast_df, nowcast_info
+
+
+indicators, peers_data, nowcast_df, nowcast_info = collect_slow_sources(slow)
+
+
+@st.fragment(run_every=BACKGROUND_POLL_S)
+def background_progress(slow):
+    """Progreso de las cargas en segundo plano; al terminar todas, re-ejecuta la página completa."""
+    pending = [task for task in slow.values() if not task.done]
+    if not pending:
+        st.rerun()
+    for task in pending:
+        st.progress(task.progress, text=f"⏳ {task.text}")
+
+
+if not all(task.done for task in slow.values()):
+    background_progress(slow)
+
+
+@st.fragment(run_every=FRESHNESS_POLL_S)
+def freshness_monitor(esios_token):
+    """Datos nuevos en las fuentes (solo metadatos, comprobación compartida entre sesiones)."""
+    checked, report = latest_freshness_report(esios_token)
+    if report is None:
+        st.caption("🔎 Comprobando publicaciones nuevas...")
+        return
+    stale = report[report['pendiente']]
+    checked_at = pd.Timestamp.fromtimestamp(checked)
+    if stale.empty:
+        st.caption(f"🟢 Datos al día (comprobado a las {checked_at:%H:%M})")
+        return
+    st.warning("🆕 Nuevos datos publicados: " + ", ".join(stale['indicador']))
+    if st.button("🔄 Cargar datos nuevos", key="refresh_stale", help="Descarga solo los indicadores actualizados."):
+        refresh_stale(stale, esios_token)
+        st.rerun()
+
+
+if vintage_as_of is None:
+    with st.sidebar:
+        freshness_monitor(esios_token or None)
+for task in slow.values():
+    if task.done and task.error is not None:
+        st.warning(f"Error cargando {task.label}: {task.error}")
+
+# 2. Analysis Section (ICTR - Semáforo), calculado una vez por snapshot
+ictr_df, explained_var = snapshot.ictr_df, snapshot.explained_var
+current_ictr = ictr_df['ICTR'].iloc[-1] if not ictr_df.empty else 100
 
 # Determine status
 last_ictr = ictr_df['ICTR'].iloc[-1] if not ictr_df.empty else 100
@@ -246,10 +257,6 @@ delta = last_ictr - prev_ictr
 
 status_color = "🟢" if delta > 0 else ("🔴" if delta < 0 else "🟡")
 status_text = "Mejorando" if delta > 0 else ("Empeorando" if delta < 0 else "Estable")
-status_full = f"{status_color} {status_text}"
-
-st.session_state.status_text = status_full
-st.session_state.status_color = status_color # Added for metrics use
 
 # 3. Dashboard Layout
 # Top Metrics (Semaforo Ciudadano)
@@ -293,145 +300,75 @@ if not ictr_df.empty:
     )
     
     # Gráfica ICTR
-    with st.expander("📈 Ver evolución histórica del ICTR", expanded=False):
+    with st.expander("📈 Ver evolución histórica del ICTR", expanded=False), span('plotly.ictr'):
         st.caption("El ICTR (Indicador Combinado de Tiempo Real) sintetiza múltiples indicadores en un único valor. Base 100 = nivel neutral. Por encima = economía en expansión, por debajo = contracción.")
         
-        # Crear gráfica con Plotly para mejor control
-        fig_ictr = go.Figure()
-        fig_ictr.add_trace(go.Scatter(
-            x=ictr_df.index, 
-            y=ictr_df['ICTR'], 
-            mode='lines',
-            name='ICTR',
-            line=dict(color='#1f77b4', width=3),
-            fill='tozeroy',
-            fillcolor='rgba(31, 119, 180, 0.1)'
-        ))
-        
-        # Línea de base 100
-        fig_ictr.add_hline(y=100, line_dash="dash", line_color="gray", annotation_text="Base 100")
-        
-        fig_ictr.update_layout(
-            yaxis_title="ICTR",
-            xaxis_title="",
-            hovermode="x unified",
-            margin=dict(l=0, r=0, t=10, b=0),
-            height=300
-        )
-        st.plotly_chart(fig_ictr, use_container_width=True)
+        # Gráfica cacheada por contenido (ICTR + nowcast)
+        fig_ictr = build_ictr_figure(ictr_df, nowcast_df)
+        st.plotly_chart(fig_ictr, width="stretch", key="chart_ictr")
         
         # Estadísticas resumidas
         col_stats1, col_stats2, col_stats3 = st.columns(3)
         col_stats1.metric("Mínimo histórico", f"{ictr_df['ICTR'].min():.1f}")
         col_stats2.metric("Máximo histórico", f"{ictr_df['ICTR'].max():.1f}")
         col_stats3.metric("Media", f"{ictr_df['ICTR'].mean():.1f}")
+        
+        if nowcast_df is not None:
+            st.caption(
+                f"**Nowcast {nowcast_df.index[-1].strftime('%b %Y')}: {nowcast_df['Nowcast'].iloc[-1]:.1f}** — "
+                "Modelo factorial dinámico (filtro de Kalman) que usa cada serie en su frecuencia original "
+                "(diaria, mensual, trimestral y anual). "
+                f"Parámetros estimados el {nowcast_info['fitted_at'][:10]}."
+            )
+        elif nowcast_info and nowcast_info.get('error'):
+            st.caption(f"⚠️ Nowcast no disponible: {nowcast_info['error']}")
 
-# Tabs Reorganized
-tab_peers, tab_percapita, tab_welfare, tab_pocket, tab_ia = st.tabs([
-    "🌍 Comparativa", "👤 Per Cápita", "🏘️ Bienestar", "💰 Tu Bolsillo", "🤖 Informe IA"
-])
+if vintage_as_of is not None:
+    st.info(f"🕰️ Vista histórica: datos tal y como estaban publicados el {vintage_date.strftime('%d/%m/%Y')}.")
 
-with tab_peers:
+# Tabs Reorganized
+# Cada pestaña es un fragmento: solo se ejecuta la visible (tab.open) y los widgets
+# de una pestaña (periodo ESIOS, botón IA) re-ejecutan solo su fragmento.
+def render_tab(tab, name, render, *args):
+    """Renderiza el contenido de la pestaña solo si es la seleccionada."""
+    with tab:
+        if tab.open:
+            with span(name):
+                render(*args)
+
+@st.fragment
+def tab_comparativa(peers_data):
     st.header("¿Cómo vamos respecto a nuestros vecinos?")
-    st.caption("Comparativa exclusiva con: Alemania, Francia, Italia, Portugal y Polonia.")
+    if not peers_data:
+        st.info("⏳ Cargando la comparativa internacional... se mostrará en cuanto esté lista.")
+        return
+    st.caption("Comparativa con: " + ", ".join(GEO_LABELS.get(g, g) for g in peers_data['GDP'].columns if g != 'ES') + ". Cambia los países en el sidebar.")
     
     col_a, col_b = st.columns(2)
     
     with col_a:
         st.subheader("Evolución del Crecimiento (PIB)")
         st.caption("Base 100 al inicio de la serie. Permite comparar quién crece más rápido independientemente del tamaño del país.")
-        fig_gdp = go.Figure()
-        
-        all_vals = []
-        for ctry, df in peers_data['GDP'].items():
-            if not df.empty:
-                # Normalización: (Valor / Primer Valor) * 100
-                first_val = df['value'].iloc[0]
-                df_norm = df.copy()
-                df_norm['value_norm'] = (df['value'] / first_val) * 100
-                
-                # Highlight Spain
-                width = 5 if ctry=='ES' else 2
-                opacity = 1.0 if ctry=='ES' else 0.6
-                
-                fig_gdp.add_trace(go.Scatter(x=df_norm['date'], y=df_norm['value_norm'], mode='lines', name=ctry, 
-                                             line=dict(width=width), opacity=opacity,
-                                             hovertemplate='%{y:.1f} (Base 100)'))
-                all_vals.extend(df_norm['value_norm'])
-        
-        # Dynamic Layout for Zoom (Preserved)
-        if all_vals:
-            y_min = min(all_vals)
-            y_max = max(all_vals)
-            margin = (y_max - y_min) * 0.1
-            fig_gdp.update_layout(
-                yaxis=dict(range=[y_min - margin, y_max + margin]),
-                hovermode="x unified",
-                yaxis_title="Crecimiento Acumulado",
-                legend=dict(orientation="h", y=1.1),
-                margin=dict(l=0, r=0, t=10, b=0)
-            )
-        st.plotly_chart(fig_gdp, use_container_width=True)
+        fig_gdp = build_peers_figure(peers_data['GDP'], "Crecimiento Acumulado", '%{y:.1f} (Base 100)', normalize=True)
+        st.plotly_chart(fig_gdp, width="stretch", key="chart_gdp")
         st.info("Interpretación: Si la línea de España está por encima, crecemos más rápido que el resto.")
         
     with col_b:
         st.subheader("Desempleo (Tasa de Paro)")
-        fig_unemp = go.Figure()
-        all_vals_unemp = []
-        for ctry, df in peers_data['Unemployment'].items():
-            if not df.empty:
-                width = 5 if ctry=='ES' else 2
-                opacity = 1.0 if ctry=='ES' else 0.6
-                fig_unemp.add_trace(go.Scatter(x=df['date'], y=df['value'], mode='lines', name=ctry,
-                                               line=dict(width=width), opacity=opacity,
-                                               hovertemplate='%{y:.1f}%'))
-                all_vals_unemp.extend(df['value'])
-        
-        # Dynamic Layout
-        if all_vals_unemp:
-            y_min = min(all_vals_unemp)
-            y_max = max(all_vals_unemp)
-            margin = (y_max - y_min) * 0.1
-            fig_unemp.update_layout(
-                yaxis=dict(range=[y_min - margin, y_max + margin]),
-                hovermode="x unified",
-                yaxis_title="Tasa de Paro (%)",
-                legend=dict(orientation="h", y=1.1),
-                margin=dict(l=0, r=0, t=10, b=0)
-            )
-        st.plotly_chart(fig_unemp, use_container_width=True)
+        fig_unemp = build_peers_figure(peers_data['Unemployment'], "Tasa de Paro (%)", '%{y:.1f}%')
+        st.plotly_chart(fig_unemp, width="stretch", key="chart_unemp")
         st.info("Nota: Menos es mejor. Compara la brecha de España con el resto.")
         
     st.markdown("---")
     st.subheader("🧠 Índice de Sentimiento Económico (Expectativas)")
     st.caption("Indicador adelantado que mide la confianza de empresas y consumidores. **100** es el promedio histórico. Valores > 100 indican optimismo. Fuente: Eurostat (teibs010).")
     
-    fig_sent = go.Figure()
-    all_vals_sent = []
-    for ctry, df in peers_data['Sentiment'].items():
-        if not df.empty:
-            width = 5 if ctry=='ES' else 2
-            opacity = 1.0 if ctry=='ES' else 0.6
-            fig_sent.add_trace(go.Scatter(x=df['date'], y=df['value'], mode='lines', name=ctry,
-                                           line=dict(width=width), opacity=opacity,
-                                           hovertemplate='%{y:.1f}'))
-            all_vals_sent.extend(df['value'])
-            
-    if all_vals_sent:
-        y_min = min(all_vals_sent)
-        y_max = max(all_vals_sent)
-        margin = (y_max - y_min) * 0.1
-        fig_sent.update_layout(
-            yaxis=dict(range=[y_min - margin, y_max + margin]),
-            hovermode="x unified",
-            yaxis_title="Índice de Confianza",
-            legend=dict(orientation="h", y=1.1),
-            margin=dict(l=0, r=0, t=10, b=0)
-        )
-    st.plotly_chart(fig_sent, use_container_width=True)
+    fig_sent = build_peers_figure(peers_data['Sentiment'], "Índice de Confianza", '%{y:.1f}')
+    st.plotly_chart(fig_sent, width="stretch", key="chart_sent")
     st.info("💡 **Dato clave**: El sentimiento suele 'adelantarse' a los movimientos del PIB. Caídas continuadas predicen recesiones.")
 
-with tab_percapita:
+@st.fragment
+def tab_per_capita(indicators):
     st.header("Indicadores Per Cápita")
     st.caption("La economía vista desde la perspectiva del ciudadano individual. Todos los valores divididos por la población de cada año.")
     
@@ -441,10 +378,9 @@ with tab_percapita:
         st.subheader("PIB Real per Cápita (€)")
         st.caption("Producción económica dividida entre la población. En términos reales (ajustado por inflación). Fuente: Eurostat (sdg_08_10).")
         if not indicators['Renta_PC'].empty:
-            st.line_chart(indicators['Renta_PC'].set_index('date')['value'])
+            st.plotly_chart(build_line_figure(indicators['Renta_PC']), width="stretch", key="chart_renta_pc")
             ultimo = indicators['Renta_PC']['value'].iloc[-1]
-            primero = indicators['Renta_PC']['value'].iloc[0]
-            crecimiento = ((ultimo / primero) - 1) * 100
+            crecimiento = growth_since_start(indicators['Renta_PC'])
             st.info(f"**Último dato**: {ultimo:,.0f} € | **Crecimiento desde 2000**: +{crecimiento:.1f}%")
         else:
             st.warning("Datos no disponibles")
@@ -453,27 +389,15 @@ with tab_percapita:
         st.subheader("Deuda Pública per Cápita (€)")
         st.caption("Deuda del gobierno dividida entre la población de cada año. Fuente: Eurostat (gov_10dd_edpt1).")
         
-        # Calcular deuda per cápita usando población histórica
+        # Deuda per cápita con población histórica (derivada y memoizada por snapshot)
         if not indicators['Deuda_Abs'].empty and not indicators['Poblacion'].empty:
-            deuda_df = indicators['Deuda_Abs'].copy()
-            pob_df = indicators['Poblacion'].copy()
-            
-            # Merge por año
-            deuda_df['year'] = deuda_df['date'].dt.year
-            pob_df['year'] = pob_df['date'].dt.year
+            deuda_pc_df = debt_per_capita(indicators['Deuda_Abs'], indicators['Poblacion'])
             
-            merged = deuda_df.merge(pob_df[['year', 'value']], on='year', suffixes=('_deuda', '_pob'))
-            
-            if not merged.empty:
-                # Deuda en millones EUR, población en unidades -> per cápita en EUR
-                merged['deuda_pc'] = (merged['value_deuda'] * 1_000_000) / merged['value_pob']
-                
-                chart_data = merged[['date', 'deuda_pc']].set_index('date')
-                st.line_chart(chart_data['deuda_pc'])
+            if not deuda_pc_df.empty:
+                st.plotly_chart(build_line_figure(deuda_pc_df, value_col='deuda_pc'), width="stretch", key="chart_deuda_pc_eur")
                 
-                ultimo_deuda_pc = merged['deuda_pc'].iloc[-1]
-                primero_deuda_pc = merged['deuda_pc'].iloc[0]
-                crecimiento_deuda = ((ultimo_deuda_pc / primero_deuda_pc) - 1) * 100
+                ultimo_deuda_pc = deuda_pc_df['deuda_pc'].iloc[-1]
+                crecimiento_deuda = growth_since_start(deuda_pc_df, 'deuda_pc')
                 st.info(f"**Último dato**: {ultimo_deuda_pc:,.0f} € por habitante | **Crecimiento**: +{crecimiento_deuda:.1f}%")
             else:
                 st.warning("No se pudo calcular - datos incompatibles")
@@ -484,15 +408,15 @@ with tab_percapita:
     st.subheader("📊 Población de España (histórico)")
     st.caption("Evolución de la población residente en España. Fuente: Eurostat (demo_gind).")
     if not indicators['Poblacion'].empty:
-        pob_chart = indicators['Poblacion'].copy()
-        pob_chart['value'] = pob_chart['value'] / 1000  # Convertir a millones
-        st.line_chart(pob_chart.set_index('date')['value'])
+        # Convertir a millones (scale) dentro del constructor cacheado
+        st.plotly_chart(build_line_figure(indicators['Poblacion'], scale=1 / 1000), width="stretch", key="chart_poblacion")
         ultimo_pob = indicators['Poblacion']['value'].iloc[-1] / 1000
         st.info(f"**Última población**: {ultimo_pob:.1f} millones de habitantes")
     else:
         st.warning("Datos no disponibles")
 
-with tab_welfare:
+@st.fragment
+def tab_bienestar(indicators):
     st.header("La Realidad Social: Pobreza y Desigualdad")
     st.caption("Indicadores de bienestar que miden cómo se reparte la riqueza y quién queda atrás.")
     
@@ -502,7 +426,7 @@ with tab_welfare:
         st.subheader("Desigualdad (Índice Gini)")
         st.caption("Mide la distribución de la riqueza. **0** = igualdad perfecta (todos igual), **100** = desigualdad máxima (uno tiene todo). Fuente: Eurostat (ilc_di12).")
         if not indicators['Gini'].empty:
-            st.line_chart(indicators['Gini'].set_index('date')['value'])
+            st.plotly_chart(build_line_figure(indicators['Gini']), width="stretch", key="chart_gini")
             ultimo_gini = indicators['Gini']['value'].iloc[-1]
             interpretacion = "alta" if ultimo_gini > 35 else ("moderada" if ultimo_gini > 30 else "baja")
             st.info(f"**Último dato**: {ultimo_gini:.1f} | **Interpretación**: Desigualdad {interpretacion} para estándares europeos")
@@ -513,7 +437,7 @@ with tab_welfare:
         st.subheader("Riesgo de Pobreza (Tasa AROPE)")
         st.caption("% de población en riesgo de pobreza o exclusión social. Combina: baja renta (<60% mediana), privación material severa, y baja intensidad laboral. Fuente: Eurostat (ilc_peps01).")
         if not indicators['AROPE'].empty:
-            st.line_chart(indicators['AROPE'].set_index('date')['value'])
+            st.plotly_chart(build_line_figure(indicators['AROPE']), width="stretch", key="chart_arope")
             ultimo_arope = indicators['AROPE']['value'].iloc[-1]
             st.info(f"**Último dato**: {ultimo_arope:.1f}% de la población | Aproximadamente {ultimo_arope * 0.47:.1f} millones de personas")
         else:
@@ -523,13 +447,14 @@ with tab_welfare:
     st.subheader("Futuro: Jóvenes 'Ni-Ni' (Educación/Laboral)")
     st.caption("Porcentaje de jóvenes de 15-29 años que **ni estudian ni trabajan** (NEET). Es un proxy del fracaso del sistema educativo y del mercado laboral juvenil. Fuente: Eurostat (edat_lfse_20).")
     if not indicators['NiNis'].empty:
-        st.line_chart(indicators['NiNis'].set_index('date')['value'])
+        st.plotly_chart(build_line_figure(indicators['NiNis']), width="stretch", key="chart_ninis")
         ultimo_nini = indicators['NiNis']['value'].iloc[-1]
         st.info(f"**Último dato**: {ultimo_nini:.1f}% de jóvenes (15-29 años) | Aprox. {int(ultimo_nini * 8 / 100 * 1000)}k jóvenes afectados")
     else:
         st.warning("Datos no disponibles")
 
-with tab_pocket:
+@st.fragment
+def tab_bolsillo(indicators, esios_ready=True):
     st.header("Economía Doméstica")
     st.caption("Indicadores que afectan directamente a tu bolsillo: inflación, vivienda y fiscalidad.")
     
@@ -539,8 +464,8 @@ with tab_pocket:
         st.subheader("Coste de la Vida (IPC)")
         st.caption("Índice de Precios al Consumo. Mide la inflación acumulada. Base 100 = año referencia. Si sube, tu dinero vale menos.")
         if not indicators['IPC'].empty:
-            st.line_chart(indicators['IPC'].set_index('date')['value'])
-            st.info(f"**Último dato**: {indicators['IPC']['value'].iloc[-1]:.1f} | **Variación desde inicio**: {((indicators['IPC']['value'].iloc[-1] / indicators['IPC']['value'].iloc[0]) - 1) * 100:.1f}%")
+            st.plotly_chart(build_line_figure(indicators['IPC']), width="stretch", key="chart_ipc")
+            st.info(f"**Último dato**: {indicators['IPC']['value'].iloc[-1]:.1f} | **Variación desde inicio**: {growth_since_start(indicators['IPC']):.1f}%")
         else:
             st.warning("Datos no disponibles")
         
@@ -548,7 +473,7 @@ with tab_pocket:
         st.subheader("Vivienda (Precio)")
         st.caption("Índice de precios de la vivienda. Base 100 = 2015. Refleja la evolución del coste de acceso a la vivienda.")
         if not indicators['Vivienda'].empty:
-            st.line_chart(indicators['Vivienda'].set_index('date')['value'])
+            st.plotly_chart(build_line_figure(indicators['Vivienda']), width="stretch", key="chart_vivienda")
             st.info(f"**Último dato**: {indicators['Vivienda']['value'].iloc[-1]:.1f} | **Variación desde 2015**: {indicators['Vivienda']['value'].iloc[-1] - 100:.1f}%")
         else:
             st.warning("Datos no disponibles")
@@ -559,7 +484,7 @@ with tab_pocket:
         st.subheader("Deuda Pública (% PIB)")
         st.caption("Deuda bruta del gobierno general como porcentaje del PIB. Mide el nivel de endeudamiento relativo a la economía. Fuente: Eurostat (sdg_17_40).")
         if not indicators['Deuda_PC'].empty:
-            st.line_chart(indicators['Deuda_PC'].set_index('date')['value'])
+            st.plotly_chart(build_line_figure(indicators['Deuda_PC']), width="stretch", key="chart_deuda_pc")
             ultimo_deuda = indicators['Deuda_PC']['value'].iloc[-1]
             st.info(f"**Último dato**: {ultimo_deuda:.1f}% del PIB | El criterio de Maastricht establece un límite del 60%")
         else:
@@ -569,30 +494,28 @@ with tab_pocket:
         st.subheader("Ingresos Públicos (% PIB)")
         st.caption("Total de ingresos del gobierno general como % del PIB. Incluye impuestos y cotizaciones sociales. Fuente: Eurostat (gov_10a_main).")
         if not indicators['Presion_Fiscal'].empty:
-            st.line_chart(indicators['Presion_Fiscal'].set_index('date')['value'])
+            st.plotly_chart(build_line_figure(indicators['Presion_Fiscal']), width="stretch", key="chart_presion_fiscal")
             st.info(f"**Último dato**: {indicators['Presion_Fiscal']['value'].iloc[-1]:.1f}% del PIB | Media UE: ~46%")
         else:
             st.warning("Datos no disponibles")
 
     # Demanda Eléctrica (ESIOS)
-    if not indicators['Demanda_Electrica'].empty:
+    if not esios_ready:
+        st.markdown("---")
+        st.info("⏳ Cargando la demanda eléctrica (ESIOS)...")
+    elif not indicators['Demanda_Electrica'].empty:
         st.markdown("---")
         st.subheader("⚡ Demanda Eléctrica en Tiempo Real (ESIOS)")
         st.caption("Consumo diario promedio en MW. Un aumento sostenido suele preceder a una mayor actividad industrial. Fuente: ESIOS (REE).")
         
-        esios_df = indicators['Demanda_Electrica'].set_index('date')
+        # Tendencia (Media Móvil 365 días - Anual), derivada y memoizada por snapshot
+        esios_df = esios_trend(indicators['Demanda_Electrica'])
         
-        # Calcular Tendencia (Media Móvil 365 días - Anual)
         if len(esios_df) > 365:
-            esios_df['Trend_365'] = esios_df['value'].rolling(window=365).mean()
-            
-            # Calcular Variación Cuantitativa
-            try:
-                current_val = float(esios_df['Trend_365'].dropna().iloc[-1])
-                # Comparar con hace 1 año (365 días)
-                year_ago_val = float(esios_df['Trend_365'].dropna().iloc[-366]) if len(esios_df['Trend_365'].dropna()) > 366 else current_val
-                delta_perc = ((current_val / year_ago_val) - 1) * 100
-                
+            # Variación Cuantitativa
+            trend_yoy = esios_trend_yoy(indicators['Demanda_Electrica'])
+            if trend_yoy is not None:
+                delta_perc = trend_yoy['delta_perc']
                 status_elec = "CRECIENTE" if delta_perc > 0 else "DECRECIENTE"
                 color_elec = "green" if delta_perc > 0 else "red"
                 
@@ -600,56 +523,54 @@ with tab_pocket:
                 **Análisis de Tendencia (Media Móvil Anual):** 
                 La demanda estructural está en fase **:{color_elec}[{status_elec}]** ({delta_perc:+.2f}% vs hace un año).
                 """)
-            except IndexError:
+            else:
                 st.warning("Datos ESIOS insuficientes para calcular tendencia anual.")
                 
-            # Gráfica Plotly
-            fig_esios = go.Figure()
-            
-            # Datos DIARIOS (Azul suave)
-            fig_esios.add_trace(go.Scatter(
-                x=esios_df.index, y=esios_df['value'],
-                mode='lines', name='Demanda Diaria',
-                line=dict(color='rgba(31, 119, 180, 0.4)', width=1)
-            ))
+            # Zoom por periodo: el histórico completo se reduce a CHART_POINT_BUDGET puntos;
+            # al acotar el periodo se envían más puntos reales (resolución completa si caben)
+            first_day, last_day = esios_df.index.min().date(), esios_df.index.max().date()
+            esios_window = st.slider("Periodo", min_value=first_day, max_value=last_day,
+                                     value=(first_day, last_day), format="MM/YYYY", key="esios_window")
+            esios_view = esios_df.loc[pd.Timestamp(esios_window[0]):pd.Timestamp(esios_window[1])]
             
-            # Tendencia Roja (Media 365 días)
-            fig_esios.add_trace(go.Scatter(
-                x=esios_df.index, y=esios_df['Trend_365'],
-                mode='lines', name='Tendencia (Media 1 año)',
-                line=dict(color='red', width=3)
-            ))
-            
-            fig_esios.update_layout(
-                height=400,
-                yaxis_title="Potencia (MW)",
-                hovermode="x unified",
-                margin=dict(l=0, r=0, t=10, b=0),
-                legend=dict(orientation="h", y=1.1)
-            )
-            st.plotly_chart(fig_esios, use_container_width=True)
+            # Gráfica Plotly (cacheada por contenido)
+            fig_esios = build_esios_figure(esios_view)
+            st.plotly_chart(fig_esios, width="stretch", key="chart_esios")
+            if len(esios_view) > CHART_POINT_BUDGET:
+                st.caption(f"Mostrando {CHART_POINT_BUDGET:,} de {len(esios_view):,} días (reducción LTTB/min-max). Acota el periodo para ver la resolución diaria completa.")
             
         else:
             st.warning(f"Histórico ESIOS incompleto ({len(esios_df)} días). Se requieren >365 días para la tendencia.")
 
-with tab_ia:
+@st.fragment
+def tab_informe_ia(indicators, status_text, gemini_api_key, peers_data=None, ictr=None):
     st.header("Análisis de la Verdad")
     st.markdown("Generación de informes para detectar 'maquillaje' estadístico.")
     
     if gemini_api_key:
+        context = ai_context(indicators, status_text, peers_data, ictr)
+        context_key = report_cache_key(AI_MODEL, context)
         if st.button("Generar Informe Ciudadano"):
-            with st.spinner("Analizando datos reales..."):
-                context = {
-                    "Tendencia": status_text,
-                    "Renta_PC": indicators['Renta_PC']['value'].iloc[-1] if not indicators['Renta_PC'].empty else "N/A",
-                    "Gini": indicators['Gini']['value'].iloc[-1] if not indicators['Gini'].empty else "N/A",
-                    "Paro_ES": indicators['Paro']['value'].iloc[-1] if not indicators['Paro'].empty else "N/A",
-                }
-                report = generate_economic_report(gemini_api_key, context)
-                st.markdown(report)
+            # Streaming: el texto aparece según lo genera Gemini. Al completarse queda en la
+            # caché de respuestas, de donde lo toma el PDF sin volver a llamar a la API.
+            report = st.write_stream(stream_economic_report(gemini_api_key, context))
+            st.session_state.ai_report = (context_key, report)
+        elif st.session_state.get('ai_report', (None, None))[0] == context_key:
+            st.markdown(st.session_state.ai_report[1])  # Último informe de esta sesión con los mismos datos
     else:
         st.info("Introduce tu clave Gemini en el sidebar para el análisis inteligente.")
 
+tab_peers, tab_percapita, tab_welfare, tab_pocket, tab_ia = st.tabs(
+    ["🌍 Comparativa", "👤 Per Cápita", "🏘️ Bienestar", "💰 Tu Bolsillo", "🤖 Informe IA"],
+    key="tab_activa", on_change="rerun"
+)
+render_tab(tab_peers, 'tab.comparativa', tab_comparativa, peers_data)
+render_tab(tab_percapita, 'tab.per_capita', tab_per_capita, indicators)
+render_tab(tab_welfare, 'tab.bienestar', tab_bienestar, indicators)
+render_tab(tab_pocket, 'tab.bolsillo', tab_bolsillo, indicators, slow['esios'].done)
+render_tab(tab_ia, 'tab.informe_ia', tab_informe_ia, indicators, status_text, gemini_api_key,
+           peers_data, current_ictr)
+
 # --- SIDEBAR: PDF EXPORT (At the end to ensure data is ready) ---
 with st.sidebar:
     st.markdown("---")
@@ -659,27 +580,25 @@ with st.sidebar:
     if st.button("📄 Generar Informe Analítico", key="gen_pdf_btn"):
         with st.spinner("Procesando datos y análisis IA..."):
             try:
+                # El informe incluye todas las fuentes: esperar a las cargas en curso
+                for task in slow.values():
+                    task.result(timeout=None)
+                indicators, peers_data, nowcast_df, nowcast_info = collect_slow_sources(slow)
+
                 ai_text = None
                 if gemini_api_key:
-                    context = {
-                        "Tendencia": status_text,
-                        "Renta_PC": indicators['Renta_PC']['value'].iloc[-1] if not indicators['Renta_PC'].empty else "N/A",
-                        "Gini": indicators['Gini']['value'].iloc[-1] if not indicators['Gini'].empty else "N/A",
-                        "Paro_ES": indicators['Paro']['value'].iloc[-1] if not indicators['Paro'].empty else "N/A",
-                    }
+                    context = ai_context(indicators, status_text, peers_data, current_ictr)
+                    # Si ya se generó (p. ej. en streaming en la pestaña IA) sale de la caché de respuestas
                     ai_text = generate_economic_report(gemini_api_key, context)
 
-                # Prepare ESIOS data if available
+                # ESIOS con tendencia anual (misma derivación memoizada que el dashboard)
                 esios_data_for_pdf = None
                 if 'Demanda_Electrica' in indicators and not indicators['Demanda_Electrica'].empty:
-                    # Re-create trend logic locally for PDF (window 365 days)
-                    esios_raw = indicators['Demanda_Electrica'].set_index('date')
-                    esios_raw['Trend_365'] = esios_raw['value'].rolling(window=365).mean()
-                    esios_data_for_pdf = esios_raw
+                    esios_data_for_pdf = esios_trend(indicators['Demanda_Electrica'])
 
                 # We have direct access to indicators, peers_data, etc. at this point in the script
-                pdf_path = build_pdf_report(current_ictr, status_text, indicators, peers_data, ai_analysis=ai_text, esios_data=esios_data_for_pdf)
-                st.session_state.final_pdf_path = pdf_path
+                # PDF generado en memoria (bytes): sin ficheros temporales en disco
+                st.session_state.final_pdf = build_pdf_report(current_ictr, status_text, indicators, peers_data, ai_analysis=ai_text, esios_data=esios_data_for_pdf)
                 if ai_text:
                     st.success("¡Informe con IA listo!")
                 else:
@@ -687,57 +606,54 @@ with st.sidebar:
             except Exception as e:
                 st.error(f"Error al generar PDF: {e}")
 
-    if "final_pdf_path" in st.session_state:
-        try:
-            with open(st.session_state.final_pdf_path, "rb") as f:
-                st.download_button(
-                    label="💾 Descargar PDF Ahora",
-                    data=f,
-                    file_name="informe_ciudadano_completo.pdf",
-                    mime="application/pdf"
-                )
-        except Exception as e:
-            st.error(f"Error al descargar PDF: {e}")
+    if "final_pdf" in st.session_state:
+        st.download_button(
+            label="💾 Descargar PDF Ahora",
+            data=st.session_state.final_pdf,
+            file_name="informe_ciudadano_completo.pdf",
+            mime="application/pdf"
+        )
 
     st.markdown("---")
-    st.subheader("📊 Exportar Datos (CSV)")
-    st.caption("Descarga todos los indicadores en formato .csv (ZIP)")
-    
-    if st.button("Generar CSV Completo"):
-        import io
-        import zipfile
-        buffer = io.BytesIO()
-        try:
-            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-                # ESIOS
-                if 'Demanda_Electrica' in indicators and not indicators['Demanda_Electrica'].empty:
-                    zf.writestr('ESIOS_Demanda.csv', indicators['Demanda_Electrica'].to_csv())
-                
-                # Otros Indicadores (INE/Eurostat)
-                for name, df in indicators.items():
-                    if name != 'Demanda_Electrica' and isinstance(df, pd.DataFrame) and not df.empty:
-                        zf.writestr(f'{name}.csv', df.to_csv(index=False))
-                        
-                # Peers Data (Comparativa)
-                if isinstance(peers_data, dict):
-                    for category, category_dict in peers_data.items():
-                        if isinstance(category_dict, dict):
-                            for country, df in category_dict.items():
-                                if isinstance(df, pd.DataFrame) and not df.empty:
-                                    zf.writestr(f'Comparativa_{category}_{country}.csv', df.to_csv(index=False))
-                    
-            st.download_button(
-                label="💾 Descargar CSV (ZIP)",
-                data=buffer.getvalue(),
-                file_name="datos_economia_espana.zip",
-                mime="application/zip"
-            )
-            st.success("CSV generado correctamente.")
-        except Exception as e:
-            st.error(f"Error generando CSV: {e}")
-        except FileNotFoundError:
-            pass
+    st.subheader("📊 Exportar Datos")
+    st.caption("Todas las series: indicadores, comparativa (todos los países), ICTR y demanda ESIOS diaria")
+
+    export_fmt = st.selectbox("Formato", available_formats(), format_func=lambda f: EXPORT_FORMATS[f][0],
+                              key="export_format")
+    _, export_ext, export_mime = EXPORT_FORMATS[export_fmt]
+    def export_data():
+        """Fichero con todas las fuentes: como el PDF, espera a las cargas en segundo plano."""
+        for task in slow.values():
+            task.result(timeout=None)
+        all_indicators, _, all_nowcast_df, _ = collect_slow_sources(slow)
+        return build_export(export_tables(all_indicators, slow['peers'].result(), ictr_df, all_nowcast_df), export_fmt)
+
+    # data=callable: el fichero se genera al pulsar (en otro hilo), desde el snapshot ya cargado
+    st.download_button(
+        label="💾 Descargar datos",
+        data=export_data,
+        file_name=f"datos_economia_espana.{export_ext}",
+        mime=export_mime,
+        on_click="ignore",
+        key="export_btn",
+    )
+    if not all(task.done for task in slow.values()):
+        st.caption("⏳ Algunas fuentes siguen cargando: la descarga esperará a que terminen.")
 
     st.markdown("---")
     st.caption("© 2026 Luis Benedicto Tuzón & Gemini")
-    st.caption("lbt00001@gmail.com")
\ No newline at end of file
+    st.caption("lbt00001@gmail.com")
+
+# --- PERFILADO: tabla por etapa + flamegraph en disco ---
+if profile_run is not None:
+    for task in slow.values():
+        if task.spans:  # Descargas en hilos del pool (solo si se lanzaron desde un rerun perfilado)
+            profile_run.add_background(task.label, task.spans)
+    profiling.finish_run()
+    with st.sidebar.expander("⏱️ Perfilado de este rerun", expanded=True):
+        st.caption(f"Rerun completo: {profile_run.wall_s:.2f} s")
+        st.dataframe(profile_run.stage_table(), hide_index=True)
+        if profile_run.background:
+            st.caption("Cargas en segundo plano (en paralelo al rerun, hasta el momento):")
+            st.dataframe(profile_run.background_table(), hide_index=True)
+        st.caption(f"Flamegraph y tabla guardados en `{profile_run.output_dir}`")
@@ -0,0 +1,208 @@
+"""
+Catálogo local de metadatos de Eurostat: dimensiones y listas de códigos por dataset.
+
+Para saber qué `unit`, `s_adj` o `coicop` existen en un dataset no hace falta
+descargar los datos: el endpoint SDMX `contentconstraint` devuelve, en una
+sola petición de pocos KB, cada dimensión con los códigos que realmente tienen
+datos (y el rango de periodos). El resultado se guarda en SQLite, indexado por
+(dataset, dimensión, código), y se reutiliza durante CATALOG_TTL_S: las
+consultas y la validación de filtros responden en milisegundos sin red.
+
+    catalog = get_catalog()
+    catalog.codes('prc_hicp_midx', 'coicop')
+    catalog.validate('sdg_08_10', {'unit': 'CLV20_EUR_HAB', 'geo': 'ES'})  # [] si es correcto
+    validate_config()  # {clave de EUROSTAT_CONFIG: [problemas]}
+"""
+import difflib
+import os
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+
+import requests
+from utils import CACHE_DIR, CATALOG_TTL_S, EUROSTAT_CONFIG, PEER_GEOS
+
+CATALOG_DB_PATH = os.path.join(CACHE_DIR, "eurostat_catalog.sqlite")
+EUROSTAT_SDMX_URL = "https://ec.europa.eu/eurostat/api/dissemination/sdmx/2.1"
+TIME_DIMENSION = 'time_period'
+
+_NS = {'s': 'http://www.sdmx.org/resources/sdmxml/schemas/v2_1/structure',
+       'c': 'http://www.sdmx.org/resources/sdmxml/schemas/v2_1/common'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    code       TEXT PRIMARY KEY,
+    fetched    INTEGER NOT NULL,
+    time_start TEXT,
+    time_end   TEXT
+);
+CREATE TABLE IF NOT EXISTS dimensions (
+    code     TEXT    NOT NULL,
+    dim      TEXT    NOT NULL,
+    position INTEGER NOT NULL,
+    n_codes  INTEGER NOT NULL,
+    PRIMARY KEY (code, dim)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS codes (
+    code  TEXT NOT NULL,
+    dim   TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (code, dim, value)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS codes_by_value ON codes (value);
+"""
+
+
+def fetch_dataset_metadata(dataset_code, timeout=15):
+    """
+    Dimensiones y códigos con datos de un dataset (endpoint contentconstraint, sin datos).
+    Devuelve ({dimensión: [códigos]} en el orden de la respuesta, (inicio, fin) de TIME_PERIOD).
+    """
+    url = f"{EUROSTAT_SDMX_URL}/contentconstraint/ESTAT/{dataset_code}"
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    root = ET.fromstring(response.content)
+
+    dims, time_range = {}, (None, None)
+    for key_value in root.iterfind('.//s:ContentConstraint/s:CubeRegion/c:KeyValue', _NS):
+        dim = key_value.get('id').lower()
+        if dim == TIME_DIMENSION:
+            time_range = (key_value.findtext('.//c:StartPeriod', namespaces=_NS),
+                          key_value.findtext('.//c:EndPeriod', namespaces=_NS))
+        else:
+            dims[dim] = [v.text for v in key_value.iterfind('c:Value', _NS)]
+    if not dims:
+        raise ValueError(f"Sin metadatos de dimensiones para {dataset_code}")
+    return dims, time_range
+
+
+class EurostatCatalog:
+    """Catálogo en SQLite (seguro entre hilos: una conexión por operación). Se rellena bajo demanda."""
+
+    def __init__(self, path=CATALOG_DB_PATH, ttl=CATALOG_TTL_S, fetch=fetch_dataset_metadata):
+        self.path = path
+        self.ttl = ttl
+        self._fetch = fetch
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:  # commit / rollback
+                yield conn
+        finally:
+            conn.close()
+
+    def refresh(self, dataset_code):
+        """Descarga los metadatos del dataset y sustituye los guardados."""
+        dims, (time_start, time_end) = self._fetch(dataset_code)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM codes WHERE code = ?", (dataset_code,))
+            conn.execute("DELETE FROM dimensions WHERE code = ?", (dataset_code,))
+            conn.executemany("INSERT INTO dimensions VALUES (?, ?, ?, ?)",
+                             [(dataset_code, dim, i, len(values)) for i, (dim, values) in enumerate(dims.items())])
+            conn.executemany("INSERT OR IGNORE INTO codes VALUES (?, ?, ?)",
+                             [(dataset_code, dim, v) for dim, values in dims.items() for v in values])
+            conn.execute("INSERT OR REPLACE INTO datasets VALUES (?, ?, ?, ?)",
+                         (dataset_code, int(time.time()), time_start, time_end))
+
+    def ensure(self, dataset_code):
+        """Descarga los metadatos solo si faltan o tienen más de `ttl` segundos."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT fetched FROM datasets WHERE code = ?", (dataset_code,)).fetchone()
+        if row is None or time.time() - row[0] > self.ttl:
+            self.refresh(dataset_code)
+
+    def dimensions(self, dataset_code):
+        """Dimensiones del dataset (sin TIME_PERIOD), en orden: [(dimensión, nº de códigos)]."""
+        self.ensure(dataset_code)
+        with self._connect() as conn:
+            return conn.execute("SELECT dim, n_codes FROM dimensions WHERE code = ? ORDER BY position",
+                                (dataset_code,)).fetchall()
+
+    def codes(self, dataset_code, dim):
+        """Códigos con datos de una dimensión."""
+        self.ensure(dataset_code)
+        with self._connect() as conn:
+            return [v for (v,) in conn.execute("SELECT value FROM codes WHERE code = ? AND dim = ? ORDER BY value",
+                                               (dataset_code, dim.lower()))]
+
+    def time_range(self, dataset_code):
+        """(primer, último) periodo con datos según los metadatos (texto ISO o None)."""
+        self.ensure(dataset_code)
+        with self._connect() as conn:
+            row = conn.execute("SELECT time_start, time_end FROM datasets WHERE code = ?", (dataset_code,)).fetchone()
+        return tuple(row) if row else (None, None)
+
+    def find(self, value):
+        """Datasets ya catalogados y dimensiones en los que aparece un código: [(dataset, dimensión)]."""
+        with self._connect() as conn:
+            return conn.execute("SELECT code, dim FROM codes WHERE value = ? ORDER BY code, dim", (value,)).fetchall()
+
+    def validate(self, dataset_code, filters, geos=()):
+        """
+        Problemas de un filtro de EUROSTAT_CONFIG ([] si es correcto): dimensiones que
+        no existen y códigos sin datos (con sugerencias). `geos`: países que además
+        deben existir en la dimensión geo (paneles de la comparativa).
+        """
+        self.ensure(dataset_code)
+        with self._connect() as conn:
+            known = {dim: set() for (dim,) in conn.execute(
+                "SELECT dim FROM dimensions WHERE code = ? ORDER BY position", (dataset_code,))}
+            for dim, value in conn.execute("SELECT dim, value FROM codes WHERE code = ?", (dataset_code,)):
+                known[dim].add(value)
+
+        problems = []
+        for dim, value in (filters or {}).items():
+            dim = dim.lower()
+            if dim not in known:
+                problems.append(f"{dataset_code}: la dimensión '{dim}' no existe (hay: {', '.join(known)})")
+            elif value not in known[dim]:
+                close = difflib.get_close_matches(value, known[dim], n=3, cutoff=0.5)
+                hint = f" ¿{', '.join(close)}?" if close else ""
+                problems.append(f"{dataset_code}: '{value}' no existe en {dim}.{hint}")
+        missing = [g for g in geos if 'geo' in known and g not in known['geo']]
+        if missing:
+            problems.append(f"{dataset_code}: sin datos para {', '.join(missing)} en geo")
+        return problems
+
+
+def validate_config(config=EUROSTAT_CONFIG, catalog=None, peer_keys=()):
+    """
+    Valida todas las entradas de EUROSTAT_CONFIG contra el catálogo: {clave: [problemas]}.
+    Las entradas sin 'geo' y las de `peer_keys` (paneles de la comparativa, que ignoran
+    su 'geo') se comprueban para todos los PEER_GEOS.
+    """
+    catalog = catalog or get_catalog()
+    report = {}
+    for key, item in config.items():
+        filters = item.get('filters', {})
+        if key in peer_keys or not any(k.lower() == 'geo' for k in filters):
+            filters = {k: v for k, v in filters.items() if k.lower() != 'geo'}
+            geos = PEER_GEOS
+        else:
+            geos = ()
+        try:
+            report[key] = catalog.validate(item['code'], filters, geos)
+        except Exception as e:
+            report[key] = [f"{item['code']}: sin metadatos ({e})"]
+    return report
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """Instancia compartida del catálogo (una por proceso)."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = EurostatCatalog()
+        return _catalog
@@ -0,0 +1,245 @@
+"""
+Mixed-frequency dynamic factor nowcast of the ICTR.
+
+Instead of interpolating quarterly/annual series to monthly (calculate_ictr),
+a one-factor dynamic factor model with a Kalman filter (statsmodels
+DynamicFactorMQ) ingests each indicator at its own frequency:
+- daily (ESIOS): month-to-date average, so the current month is already observed
+- monthly: as is
+- quarterly: quarterly observation, linked to the monthly factor by the model
+- annual: quarterly observation placed in Q4 (missing in Q1-Q3)
+
+Fitted parameters are cached on disk and warm-start the next estimation.
+Between re-estimations (NOWCAST_REFIT_DAYS) an update only runs the smoother
+with the cached parameters. The EM fit also estimates the initial state, so the
+cache stores it with the parameters: the smoother then reproduces the fitted
+model exactly (same likelihood on the same panel) instead of a variant with the
+default initialization.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from cache_utils import fingerprint
+from profiling import profiled
+from utils import (ICTR_BASE, ICTR_SCALE, NOWCAST_FACTOR_ORDER, NOWCAST_REFIT_DAYS,
+                   NOWCAST_MAXITER, CACHE_DIR)
+
+PARAMS_DIR = os.path.join(CACHE_DIR, "nowcast")
+
+
+def infer_frequency(df):
+    """Returns 'D', 'M', 'Q' or 'A' from the median spacing of the dates."""
+    dates = pd.to_datetime(df['date']).sort_values().drop_duplicates()
+    if len(dates) < 2:
+        return None
+    step = dates.diff().dt.days.median()
+    if step <= 7:
+        return 'D'
+    if step <= 45:
+        return 'M'
+    if step <= 135:
+        return 'Q'
+    return 'A'
+
+
+def _yoy(vals, periods):
+    # Same growth definition as calculate_ictr: log-diff, or plain diff for non-positive series
+    if (vals <= 0).any():
+        return vals.diff(periods)
+    return np.log(vals).diff(periods)
+
+
+def build_mixed_frequency_panel(indicators_dict, as_of=None):
+    """
+    Splits the indicators into a monthly and a quarterly YoY-growth panel.
+    indicators_dict: { 'IndicatorName': DataFrame(date, value) }
+    Returns (monthly_df, quarterly_df, frequencies) with PeriodIndex.
+    The monthly panel is extended to the as_of month (default: today) so the
+    filter produces a nowcast for the current month.
+    """
+    as_of = pd.Timestamp(as_of or datetime.now())
+    monthly, quarterly, frequencies = {}, {}, {}
+
+    for name, df in indicators_dict.items():
+        if df is None or df.empty:
+            continue
+        freq = infer_frequency(df)
+        if freq is None:
+            continue
+        s = df.set_index(pd.to_datetime(df['date']))['value'].sort_index()
+        s = s[s.index <= as_of].dropna()
+        if s.empty:
+            continue
+
+        if freq in ('D', 'M'):
+            # Daily -> month-to-date mean; monthly -> last value of the month
+            s_m = s.resample('ME').mean() if freq == 'D' else s.resample('ME').last()
+            s_m.index = s_m.index.to_period('M')
+            monthly[name] = _yoy(s_m, 12)
+        elif freq == 'Q':
+            s_q = s.resample('QE').last()
+            s_q.index = s_q.index.to_period('Q')
+            quarterly[name] = _yoy(s_q, 4)
+        else:
+            s_a = s.resample('YE').last()
+            growth = _yoy(s_a, 1)
+            growth.index = growth.index.to_period('Q')  # Year end -> Q4
+            quarterly[name] = growth
+        frequencies[name] = freq
+
+    if not monthly:
+        return None, None, frequencies
+
+    df_m = pd.DataFrame(monthly).replace([np.inf, -np.inf], np.nan).dropna(how='all')
+    end_m = max(df_m.index.max(), as_of.to_period('M'))
+    df_m = df_m.reindex(pd.period_range(df_m.index.min(), end_m, freq='M'))
+
+    df_q = None
+    if quarterly:
+        df_q = pd.DataFrame(quarterly).replace([np.inf, -np.inf], np.nan)
+        df_q = df_q.reindex(pd.period_range(df_q.index.min(), df_q.index.max(), freq='Q'))
+        # The quarterly panel may not start before the monthly one
+        df_q = df_q[df_q.index >= df_m.index.min().asfreq('Q')]
+        if df_q.dropna(how='all').empty:
+            df_q = None
+
+    return df_m, df_q, frequencies
+
+
+def _spec_key(df_m, df_q):
+    spec = {
+        'monthly': list(df_m.columns),
+        'quarterly': list(df_q.columns) if df_q is not None else [],
+        'factor_order': NOWCAST_FACTOR_ORDER,
+    }
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _load_params(key):
+    path = os.path.join(PARAMS_DIR, f"{key}.json")
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _panel_hash(df_m, df_q):
+    return fingerprint('nowcast_panel', df_m, df_q)
+
+
+def _fitted_initialization(results):
+    """Initial state estimated by EM (None if the fit used the default initialization)."""
+    retvals = getattr(results, 'mle_retvals', None)
+    inits = getattr(retvals, 'inits', None) if retvals is not None else None
+    return inits[-1] if inits else None
+
+
+def _restore_initialization(model, cached):
+    """Sets the cached EM initial state on the model (before smoothing with the cached params)."""
+    from statsmodels.tsa.statespace.initialization import Initialization
+    if cached.get('init_constant') is not None:
+        model.ssm.initialization = Initialization(
+            model.k_states, 'known', constant=np.asarray(cached['init_constant']),
+            stationary_cov=np.asarray(cached['init_cov']))
+
+
+def _save_params(key, results, panel_hash):
+    os.makedirs(PARAMS_DIR, exist_ok=True)
+    params = results.params
+    init = _fitted_initialization(results)
+    payload = {
+        'fitted_at': datetime.now().isoformat(timespec='seconds'),
+        'param_names': list(params.index),
+        'params': [float(v) for v in params.values],
+        'init_constant': init.constant.tolist() if init is not None else None,
+        'init_cov': init.stationary_cov.tolist() if init is not None else None,
+        'llf': float(results.llf),
+        'panel_hash': panel_hash,
+    }
+    tmp = os.path.join(PARAMS_DIR, f"{key}.json.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(payload, f)
+    os.replace(tmp, os.path.join(PARAMS_DIR, f"{key}.json"))
+    return payload
+
+
+@profiled('nowcast_ictr')
+def nowcast_ictr(indicators_dict, as_of=None, force_refit=False):
+    """
+    Main function to compute the mixed-frequency ICTR nowcast.
+    Returns (DataFrame['Nowcast'] indexed by month end, info dict); (None, None) if there
+    is not enough data, or (None, {'error': str}) if the estimation failed.
+    info: {'refit': bool, 'fitted_at': str, 'frequencies': {name: freq}}
+    """
+    from statsmodels.tsa.statespace.dynamic_factor_mq import DynamicFactorMQ
+
+    df_m, df_q, frequencies = build_mixed_frequency_panel(indicators_dict, as_of)
+    if df_m is None or len(df_m.dropna(how='all')) < 24:
+        return None, None
+
+    def build_model():
+        return DynamicFactorMQ(df_m, endog_quarterly=df_q, factors=1,
+                               factor_orders=NOWCAST_FACTOR_ORDER,
+                               idiosyncratic_ar1=True, standardize=True)
+
+    try:
+        model = build_model()
+
+        key = _spec_key(df_m, df_q)
+        panel_hash = _panel_hash(df_m, df_q)
+        cached = _load_params(key)
+        usable = cached is not None and cached['param_names'] == list(model.param_names)
+        fresh = (usable and 'init_constant' in cached
+                 and (datetime.now() - datetime.fromisoformat(cached['fitted_at'])).days < NOWCAST_REFIT_DAYS)
+
+        results = None
+        if fresh and not force_refit:
+            # Daily update: Kalman filter/smoother only, no re-estimation, with the fitted initial state
+            _restore_initialization(model, cached)
+            results = model.smooth(np.asarray(cached['params']))
+            fitted_at, refit = cached['fitted_at'], False
+            # Same panel as the fit: the cached model must reproduce its likelihood, otherwise refit
+            if cached.get('panel_hash') == panel_hash and not np.isclose(results.llf, cached['llf'], rtol=1e-6, atol=1e-6):
+                print(f"Nowcast: the cached model does not reproduce the fit (llf {results.llf:.4f} vs "
+                      f"{cached['llf']:.4f}); re-estimating")
+                results = None
+        if results is None:
+            start = np.asarray(cached['params']) if usable else None
+            fit = model.fit(start_params=start, maxiter=NOWCAST_MAXITER, disp=False)
+            payload = _save_params(key, fit, panel_hash)
+            # The nowcast comes from the saved model on a fresh instance (same path as a cached
+            # update: the smoothed first period depends on earlier runs of the same instance),
+            # so a refit and the following updates on the same panel publish identical values
+            model = build_model()
+            _restore_initialization(model, payload)
+            results = model.smooth(np.asarray(payload['params']))
+            fitted_at, refit = payload['fitted_at'], True
+
+        # The model index spans both panels, so it may be longer than df_m
+        smoothed = results.factors.smoothed.iloc[:, 0]
+        factor = smoothed.to_numpy()
+
+        # Sign alignment: positive correlation with the mean of the standardized monthly inputs
+        z = (df_m - df_m.mean()) / df_m.std()
+        mean_series = z.mean(axis=1).reindex(smoothed.index).to_numpy()
+        valid = ~np.isnan(mean_series)
+        if valid.sum() > 2 and np.corrcoef(mean_series[valid], factor[valid])[0, 1] < 0:
+            factor = -factor
+
+        # Scale to ICTR (Mean 100, SD 10)
+        factor = (factor - factor.mean()) / factor.std()
+        index = pd.PeriodIndex(smoothed.index, freq='M').to_timestamp(how='end').normalize()
+        result_df = pd.DataFrame({'Nowcast': factor * ICTR_SCALE + ICTR_BASE}, index=index)
+        # Nowcast up to the as_of month, not a forecast of later quarters
+        end = pd.Timestamp(as_of or datetime.now()).to_period('M').to_timestamp(how='end').normalize()
+        result_df = result_df[result_df.index <= end]
+        info = {'refit': refit, 'fitted_at': fitted_at, 'frequencies': frequencies}
+        return result_df, info
+    except Exception as e:
+        print(f"Nowcast failed: {type(e).__name__}: {e}")
+        return None, {'error': f"{type(e).__name__}: {e}"}
@@ -1,86 +1,226 @@
 from fpdf import FPDF
 import pandas as pd
-import tempfile
+import io
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import matplotlib
+matplotlib.use('Agg')  # Render sin GUI, también en los procesos del pool
+matplotlib.rcParams['svg.hashsalt'] = 'monitor'  # Ids de clip-path fijos (por defecto aleatorios): SVG reproducible
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
-import os
+from cache_utils import LRUCache, fingerprint
+from derived import base100
+from downsample import downsample_xy
+from profiling import profiled, span
+from utils import GEO_LABELS, PDF_CACHE_MAX_BYTES, PDF_CHART_FORMAT, PDF_CHART_POINT_BUDGET, PDF_RENDER_WORKERS
+
+# Gráficos de indicadores individuales, en orden de página: (indicador, título, color)
+INDICATOR_CHARTS = [
+    ('Gini', "Desigualdad (Indice Gini)", 'purple'),
+    ('AROPE', "Riesgo de Pobreza (% Poblacion)", 'orange'),
+    ('IPC', "Indice de Precios (IPC)", 'red'),
+    ('Vivienda', "Precio Vivienda (Indice)", 'brown'),
+    ('Deuda_PC', "Deuda Publica (% PIB)", 'black'),
+    ('Presion_Fiscal', "Presion Fiscal (% PIB)", 'grey'),
+]
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+# Informes ya generados, por hash de contenido de sus entradas (compartidos entre sesiones)
+_report_cache = LRUCache(max_bytes=PDF_CACHE_MAX_BYTES)
 
 class EconomicReportPDF(FPDF):
     def header(self):
-        self.set_font('Arial', 'B', 15)
-        self.cell(0, 10, 'Monitor Economico MBAI Native', 0, 1, 'C')
+        self.set_font('Helvetica', 'B', 15)
+        self.cell(0, 10, 'Monitor Economico MBAI Native', align='C', new_x="LMARGIN", new_y="NEXT")
         self.ln(5)
 
     def footer(self):
         self.set_y(-15)
-        self.set_font('Arial', 'I', 8)
-        self.cell(0, 10, f'Pagina {self.page_no()}', 0, 0, 'C')
+        self.set_font('Helvetica', 'I', 8)
+        self.cell(0, 10, f'Pagina {self.page_no()}', align='C')
+
+@profiled('pdf.create_chart_image')
+def create_chart_image(df, title, kind='line', color='blue', trend=None, peers_panel=None, highlight='ES',
+                       fmt=None, point_budget=None):
+    """
+    Genera el grafico en memoria (bytes: se pueden devolver desde otro proceso).
+    Las series se reducen a point_budget puntos (la resolución visible en la página), de
+    modo que el tamaño y el tiempo no crecen con el histórico.
+    fmt='svg' (por defecto, PDF_CHART_FORMAT): trazos vectoriales sin marcadores por punto.
+    fmt='png': raster a 100 dpi, como antes.
+    """
+    fmt = fmt or PDF_CHART_FORMAT
+    vector = fmt == 'svg'
+    budget = point_budget or PDF_CHART_POINT_BUDGET
+
+    def points(x, y, method='lttb'):
+        return downsample_xy(x, y, budget, method)
 
-def create_chart_image(df, title, kind='line', color='blue', trend=None, peers_dict=None):
-    """Genera un archivo temporal PNG con el grafico."""
     plt.figure(figsize=(10, 5))
     
-    if peers_dict:
-        # Modo Comparativa
-        for ctry, c_df in peers_dict.items():
-            if not c_df.empty:
-                width = 3 if ctry == 'ES' else 1
-                alpha = 1.0 if ctry == 'ES' else 0.5
-                lbl = ctry
-                
-                # Normalizar si es GDP
-                y_vals = c_df['value']
-                if "Crecimiento" in title:
-                    start_val = y_vals.iloc[0]
-                    y_vals = (y_vals / start_val) * 100
-                    
-                plt.plot(c_df['date'], y_vals, label=lbl, linewidth=width, alpha=alpha)
-        plt.legend()
+    if peers_panel is not None:
+        # Modo Comparativa: una línea por columna (país) del panel ancho
+        for ctry in peers_panel.columns:
+            col = peers_panel[ctry].dropna()
+            if not col.empty:
+                width = 3 if ctry == highlight else 1
+                alpha = 1.0 if ctry == highlight else 0.5
+                plt.plot(*points(col.index, col.to_numpy()), label=ctry, linewidth=width, alpha=alpha)
+        plt.legend(ncol=max(1, len(peers_panel.columns) // 8), fontsize='small')
     
     elif trend is not None:
-        # Modo ESIOS (Dual)
-        plt.plot(df.index, df['value'], color='skyblue', label='Diario/Mensual', alpha=0.5, linewidth=2, marker='.', markersize=5)
-        plt.plot(df.index, trend, color='red', label='Tendencia (Anual)', linewidth=3)
+        # Modo ESIOS (Dual): la serie diaria con min-max por bucket para conservar picos y valles
+        marker = {} if vector else dict(marker='.', markersize=5)
+        plt.plot(*points(df.index, df['value'], 'minmax'), color='skyblue', label='Diario/Mensual', alpha=0.5,
+                 linewidth=1 if vector else 2, **marker)
+        plt.plot(*points(df.index, trend), color='red', label='Tendencia (Anual)', linewidth=3)
         plt.legend()
         
     else:
         # Modo Simple
-        plt.plot(df['date'], df['value'], color=color, linewidth=2, marker='o', markersize=3)
+        marker = {} if vector else dict(marker='o', markersize=3)
+        plt.plot(*points(df['date'], df['value']), color=color, linewidth=2, **marker)
         
     plt.title(title)
     plt.grid(True, alpha=0.3)
     plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%Y'))
     
+    buffer = io.BytesIO()
     try:
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-        plt.savefig(tmp.name, bbox_inches='tight', dpi=100)
+        if vector:
+            # Sin <metadata> (fecha, creador): SVG reproducible y sin etiquetas que fpdf2 ignora
+            plt.savefig(buffer, format='svg', bbox_inches='tight', metadata=dict.fromkeys(('Creator', 'Date', 'Format', 'Type')))
+        else:
+            plt.savefig(buffer, format='png', bbox_inches='tight', dpi=100)
     finally:
         plt.close() # Important to close plot to free memory
         
-    return tmp.name
+    return buffer.getvalue()
 
-def build_pdf_report(ictr_val, trend_val, indicators_dict, peers_data=None, ai_analysis=None, esios_data=None):
+def _get_render_pool():
+    """Pool de procesos del proceso servidor (se crea una vez y se reutiliza entre informes)."""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # spawn: el servidor de Streamlit tiene hilos vivos y fork no es seguro
+            _render_pool = ProcessPoolExecutor(max_workers=PDF_RENDER_WORKERS,
+                                               mp_context=multiprocessing.get_context('spawn'))
+        return _render_pool
+
+def render_charts(jobs):
+    """
+    Renderiza {clave: kwargs de create_chart_image} en paralelo (un gráfico por proceso)
+    y devuelve {clave: imagen en bytes (SVG o PNG)} en el mismo orden. Sin pool (PDF_RENDER_WORKERS <= 1)
+    o si el pool se rompe, renderiza en secuencia en este proceso.
+    """
+    global _render_pool
+    with span('pdf.render_charts'):
+        if PDF_RENDER_WORKERS > 1 and len(jobs) > 1:
+            try:
+                pool = _get_render_pool()
+                futures = {key: pool.submit(create_chart_image, **kwargs) for key, kwargs in jobs.items()}
+                return {key: future.result() for key, future in futures.items()}
+            except BrokenProcessPool:
+                with _render_pool_lock:
+                    _render_pool = None  # Se recrea en el próximo informe
+        return {key: create_chart_image(**kwargs) for key, kwargs in jobs.items()}
+
+def _chart_jobs(indicators_dict, peers_data=None, esios_data=None, country='ES'):
+    """Gráficos del informe en orden de página: {clave: kwargs de create_chart_image}."""
+    jobs = {}
+    if esios_data is not None and not esios_data.empty:
+        trend_series = esios_data['Trend_365'] if 'Trend_365' in esios_data else None
+        jobs['ESIOS'] = dict(df=esios_data, title="Consumo Electrico vs Tendencia", trend=trend_series)
+    if peers_data:
+        if 'GDP' in peers_data and not peers_data['GDP'].empty:
+            jobs['GDP'] = dict(df=None, title="Crecimiento PIB (Base 100)", peers_panel=base100(peers_data['GDP']), highlight=country)
+        if 'Unemployment' in peers_data and not peers_data['Unemployment'].empty:
+            jobs['Unemployment'] = dict(df=None, title="Tasa de Desempleo Comparison", peers_panel=peers_data['Unemployment'], highlight=country)
+    for name, title, color in INDICATOR_CHARTS:
+        if name in indicators_dict and not indicators_dict[name].empty:
+            jobs[name] = dict(df=indicators_dict[name], title=title, color=color)
+    return jobs
+
+def report_cache_key(ictr_val, trend_val, indicators_dict, peers_data=None, ai_analysis=None, esios_data=None,
+                     country='ES', as_of=None):
+    """Clave de contenido del informe: datos + ICTR (como se imprime) + tendencia + texto IA."""
+    return fingerprint('pdf_report', f"{ictr_val:.2f}", trend_val, dict(indicators_dict),
+                       dict(peers_data or {}), ai_analysis, esios_data, country, str(as_of))
+
+def report_cache_stats():
+    return {'entradas': len(_report_cache), 'bytes': _report_cache.total_bytes,
+            'aciertos': _report_cache.hits, 'fallos': _report_cache.misses}
+
+@profiled('pdf.build_pdf_report')
+def build_pdf_report(ictr_val, trend_val, indicators_dict, peers_data=None, ai_analysis=None, esios_data=None,
+                     country='ES', as_of=None):
+    # Mismas entradas -> mismo PDF: se sirve desde la caché sin renderizar nada.
+    # Todos los gráficos se renderizan a la vez (en paralelo) y se maquetan después en orden.
+    # Todo en memoria: ni imágenes ni PDF pasan por disco. Devuelve el PDF en bytes.
+    return build_pdf_reports([dict(ictr_val=ictr_val, trend_val=trend_val, indicators_dict=indicators_dict,
+                                   peers_data=peers_data, ai_analysis=ai_analysis, esios_data=esios_data,
+                                   country=country, as_of=as_of)])[0]
+
+@profiled('pdf.build_pdf_reports')
+def build_pdf_reports(reports):
+    """
+    Varios informes a la vez: lista de kwargs de build_pdf_report -> lista de PDFs (bytes).
+    Los gráficos de todos los informes que no estén en caché se renderizan juntos en el
+    pool de procesos, y los idénticos (mismo contenido, p. ej. la comparativa de un mismo
+    periodo) una sola vez.
+    """
+    keys = [report_cache_key(**report) for report in reports]
+    results = [_report_cache.get(key) for key in keys]
+    pending = [i for i, pdf_bytes in enumerate(results) if pdf_bytes is None]
+
+    unique_jobs, report_charts = {}, {}
+    for i in pending:
+        report = reports[i]
+        jobs = _chart_jobs(report['indicators_dict'], report.get('peers_data'), report.get('esios_data'),
+                           report.get('country', 'ES'))
+        report_charts[i] = {name: fingerprint('pdf_chart', kwargs) for name, kwargs in jobs.items()}
+        for name, chart_key in report_charts[i].items():
+            unique_jobs.setdefault(chart_key, jobs[name])
+    rendered = render_charts(unique_jobs) if unique_jobs else {}
+
+    for i in pending:
+        images = {name: rendered[chart_key] for name, chart_key in report_charts[i].items()}
+        results[i] = _layout_pdf(images, **{k: v for k, v in reports[i].items() if k != 'esios_data'})
+        _report_cache.put(keys[i], results[i])
+    return results
+
+def _layout_pdf(images, ictr_val, trend_val, indicators_dict, peers_data=None, ai_analysis=None,
+                country='ES', as_of=None):
     pdf = EconomicReportPDF()
     pdf.add_page()
-    pdf.set_font("Arial", size=12)
+    pdf.set_font("Helvetica", size=12)
     
     # --- PAGE 1: DASHBOARD SUMMARY ---
-    pdf.set_font("Arial", "B", 14)
-    pdf.cell(0, 10, f"Informe de Situacion: ICTR {ictr_val:.2f}", ln=True)
-    pdf.set_font("Arial", size=12)
-    pdf.cell(0, 10, f"Tendencia Detectada: {trend_val}", ln=True)
+    pdf.set_font("Helvetica", "B", 14)
+    pdf.cell(0, 10, f"Informe de Situacion: ICTR {ictr_val:.2f}", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("Helvetica", size=12)
+    pdf.cell(0, 10, f"Tendencia Detectada: {trend_val}", new_x="LMARGIN", new_y="NEXT")
+    if country != 'ES':
+        label = GEO_LABELS.get(country, country).encode('latin-1', 'replace').decode('latin-1')
+        pdf.cell(0, 10, f"Pais: {label}", new_x="LMARGIN", new_y="NEXT")
+    if as_of is not None:
+        pdf.cell(0, 10, f"Datos publicados a: {pd.Timestamp(as_of).date()}", new_x="LMARGIN", new_y="NEXT")
     pdf.ln(5)
     
     # Table (Condensed)
-    pdf.set_font("Arial", "B", 10)
-    pdf.cell(0, 8, "Indicadores Clave", ln=True)
-    pdf.set_font("Arial", "B", 8)
+    pdf.set_font("Helvetica", "B", 10)
+    pdf.cell(0, 8, "Indicadores Clave", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("Helvetica", "B", 8)
     pdf.cell(50, 8, "Indicador", 1)
     pdf.cell(30, 8, "Valor", 1)
     pdf.cell(40, 8, "Fecha", 1)
     pdf.ln()
     
-    pdf.set_font("Arial", size=8)
+    pdf.set_font("Helvetica", size=8)
     meta = {
         'Renta_PC': 'PIB Real pc', 'Gini': 'Desigualdad', 'AROPE': 'Riesgo Pobreza',
         'IPC': 'IPC Coste Vida', 'Paro': 'Tasa Paro', 'Deuda_PC': 'Deuda Pub (% PIB)',
@@ -102,102 +242,80 @@ def build_pdf_report(ictr_val, trend_val, indicators_dict, peers_data=None, ai_a
     # --- CHARTS SECTION (EXPANDED) ---
     
     # A. ESIOS CHART (High Priority)
-    if esios_data is not None and not esios_data.empty:
-        pdf.set_font("Arial", "B", 12)
-        pdf.cell(0, 10, "Demanda Electrica (Indicador Adelantado)", ln=True)
-        trend_series = esios_data['Trend_365'] if 'Trend_365' in esios_data else None
-        img_path = create_chart_image(esios_data, "Consumo Electrico vs Tendencia", trend=trend_series)
-        pdf.image(img_path, w=170)
-        os.unlink(img_path)
+    if 'ESIOS' in images:
+        pdf.set_font("Helvetica", "B", 12)
+        pdf.cell(0, 10, "Demanda Electrica (Indicador Adelantado)", new_x="LMARGIN", new_y="NEXT")
+        pdf.image(io.BytesIO(images['ESIOS']), w=170)
     
     # B. COMPARISON CHARTS
     if peers_data:
         pdf.add_page()
-        pdf.set_font("Arial", "B", 14)
-        pdf.cell(0, 10, "1. Comparativa Internacional", ln=True)
+        pdf.set_font("Helvetica", "B", 14)
+        pdf.cell(0, 10, "1. Comparativa Internacional", new_x="LMARGIN", new_y="NEXT")
         
         # GDP
-        if 'GDP' in peers_data:
-            pdf.set_font("Arial", "B", 10)
-            pdf.cell(0, 8, "Crecimiento Acumulado (Base 100)", ln=True)
-            img_gdp = create_chart_image(None, "Crecimiento PIB (Base 100)", peers_dict=peers_data['GDP'])
-            pdf.image(img_gdp, w=170)
-            os.unlink(img_gdp)
+        if 'GDP' in images:
+            pdf.set_font("Helvetica", "B", 10)
+            pdf.cell(0, 8, "Crecimiento Acumulado (Base 100)", new_x="LMARGIN", new_y="NEXT")
+            pdf.image(io.BytesIO(images['GDP']), w=170)
             
         # Unemployment
-        if 'Unemployment' in peers_data:
+        if 'Unemployment' in images:
             pdf.ln(5)
-            pdf.cell(0, 8, "Tasa de Paro (%)", ln=True)
-            img_un = create_chart_image(None, "Tasa de Desempleo Comparison", peers_dict=peers_data['Unemployment'])
-            pdf.image(img_un, w=170)
-            os.unlink(img_un)
+            pdf.cell(0, 8, "Tasa de Paro (%)", new_x="LMARGIN", new_y="NEXT")
+            pdf.image(io.BytesIO(images['Unemployment']), w=170)
 
     # C. INDIVIDAL INDICATORS CHARTS (Categorized)
     
     # Page: Bienestar & Sociedad
     pdf.add_page()
-    pdf.set_font("Arial", "B", 14)
-    pdf.cell(0, 10, "2. Bienestar y Sociedad", ln=True)
+    pdf.set_font("Helvetica", "B", 14)
+    pdf.cell(0, 10, "2. Bienestar y Sociedad", new_x="LMARGIN", new_y="NEXT")
     
     # Layout: 2 charts per page logic roughly
     
-    if 'Gini' in indicators_dict and not indicators_dict['Gini'].empty:
+    if 'Gini' in images:
         pdf.ln(2)
-        img = create_chart_image(indicators_dict['Gini'], "Desigualdad (Indice Gini)", color='purple')
-        pdf.image(img, w=160, h=80)
-        os.unlink(img)
+        pdf.image(io.BytesIO(images['Gini']), w=160, h=80)
         
-    if 'AROPE' in indicators_dict and not indicators_dict['AROPE'].empty:
+    if 'AROPE' in images:
         pdf.ln(5)
-        img = create_chart_image(indicators_dict['AROPE'], "Riesgo de Pobreza (% Poblacion)", color='orange')
-        pdf.image(img, w=160, h=80)
-        os.unlink(img)
+        pdf.image(io.BytesIO(images['AROPE']), w=160, h=80)
         
     # Page: Economía Doméstica
     pdf.add_page()
-    pdf.set_font("Arial", "B", 14)
-    pdf.cell(0, 10, "3. Economia Domestica", ln=True)
+    pdf.set_font("Helvetica", "B", 14)
+    pdf.cell(0, 10, "3. Economia Domestica", new_x="LMARGIN", new_y="NEXT")
     
-    if 'IPC' in indicators_dict and not indicators_dict['IPC'].empty:
+    if 'IPC' in images:
         pdf.ln(2)
-        img = create_chart_image(indicators_dict['IPC'], "Indice de Precios (IPC)", color='red')
-        pdf.image(img, w=160, h=80)
-        os.unlink(img)
+        pdf.image(io.BytesIO(images['IPC']), w=160, h=80)
 
-    if 'Vivienda' in indicators_dict and not indicators_dict['Vivienda'].empty:
+    if 'Vivienda' in images:
         pdf.ln(5)
-        img = create_chart_image(indicators_dict['Vivienda'], "Precio Vivienda (Indice)", color='brown')
-        pdf.image(img, w=160, h=80)
-        os.unlink(img)
+        pdf.image(io.BytesIO(images['Vivienda']), w=160, h=80)
         
     # Page: Fiscalidad y Deuda
     pdf.add_page()
-    pdf.set_font("Arial", "B", 14)
-    pdf.cell(0, 10, "4. Deuda y Fiscalidad", ln=True)
+    pdf.set_font("Helvetica", "B", 14)
+    pdf.cell(0, 10, "4. Deuda y Fiscalidad", new_x="LMARGIN", new_y="NEXT")
     
-    if 'Deuda_PC' in indicators_dict and not indicators_dict['Deuda_PC'].empty:
+    if 'Deuda_PC' in images:
         pdf.ln(2)
-        img = create_chart_image(indicators_dict['Deuda_PC'], "Deuda Publica (% PIB)", color='black')
-        pdf.image(img, w=160, h=80)
-        os.unlink(img)
+        pdf.image(io.BytesIO(images['Deuda_PC']), w=160, h=80)
         
-    if 'Presion_Fiscal' in indicators_dict and not indicators_dict['Presion_Fiscal'].empty:
+    if 'Presion_Fiscal' in images:
         pdf.ln(5)
-        img = create_chart_image(indicators_dict['Presion_Fiscal'], "Presion Fiscal (% PIB)", color='grey')
-        pdf.image(img, w=160, h=80)
-        os.unlink(img)
+        pdf.image(io.BytesIO(images['Presion_Fiscal']), w=160, h=80)
 
     # --- AI ANALYSIS ---
     if ai_analysis and len(ai_analysis) > 10:
         pdf.add_page()
-        pdf.set_font("Arial", "B", 14)
-        pdf.cell(0, 10, "Analisis Inteligente (Gemini)", ln=True)
+        pdf.set_font("Helvetica", "B", 14)
+        pdf.cell(0, 10, "Analisis Inteligente (Gemini)", new_x="LMARGIN", new_y="NEXT")
         pdf.ln(5)
-        pdf.set_font("Arial", size=10)
+        pdf.set_font("Helvetica", size=10)
         sanitized_ai = ai_analysis.encode('latin-1', 'replace').decode('latin-1')
         pdf.multi_cell(0, 6, sanitized_ai)
 
-    # Save
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    pdf.output(temp_file.name)
-    return temp_file.name
\ No newline at end of file
+    return bytes(pdf.output())
\ No newline at end of file
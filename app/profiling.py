@@ -0,0 +1,257 @@
+"""
+Perfilado opcional del pipeline (descarga, melt, ICTR, gráficas, PDF).
+
+Se activa con la variable de entorno MONITOR_PROFILE=1 o con el parámetro
+de URL ?profile=1. En cada rerun:
+- span(nombre) / @profiled(nombre) miden el tiempo de cada etapa,
+- un hilo muestreador toma la pila del hilo del script cada PROFILE_INTERVAL_S,
+- al terminar se escriben en CACHE_DIR/profiles/<run>/:
+  stages.csv (tabla de tiempos por etapa), stacks.folded (formato flamegraph.pl /
+  speedscope) y flamegraph.svg.
+Desactivado, span() es un context manager casi gratuito.
+
+Los spans son por hilo. Las cargas en segundo plano (background.submit) corren
+en hilos del pool: si la sesión que las lanza está perfilando, la tarea graba
+sus spans con recording() y el script los añade al rerun con add_background()
+(tabla aparte, background.csv: no cuentan en el tiempo del rerun).
+"""
+import html
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+import pandas as pd
+from utils import CACHE_DIR
+
+PROFILE_DIR = os.path.join(CACHE_DIR, "profiles")
+PROFILE_INTERVAL_S = 0.005
+PROFILE_MAX_S = 600  # Un rerun interrumpido (st.rerun, excepción) no deja el muestreador vivo
+
+_local = threading.local()
+
+
+def is_enabled(query_params=None):
+    """True si el perfilado está pedido por entorno o por query param (?profile=1)."""
+    if os.environ.get("MONITOR_PROFILE", "").lower() in ("1", "true", "yes"):
+        return True
+    if query_params is not None:
+        return str(query_params.get("profile", "")).lower() in ("1", "true", "yes")
+    return False
+
+
+class _Sampler(threading.Thread):
+    """Muestreador de pila: cuenta pilas "plegadas" del hilo objetivo."""
+
+    def __init__(self, target_ident, interval):
+        super().__init__(name="monitor-profiler", daemon=True)
+        self.target_ident = target_ident
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        deadline = time.monotonic() + PROFILE_MAX_S
+        while not self._stop_event.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.target_ident)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=1)
+
+
+STAGE_COLUMNS = ['etapa', 'llamadas', 'total_ms', 'media_ms', 'max_ms']
+
+
+def _stage_table(spans):
+    """Llamadas, total, media y máximo por etapa a partir de [(nombre, profundidad, segundos)]."""
+    if not spans:
+        return pd.DataFrame(columns=STAGE_COLUMNS)
+    df = pd.DataFrame(spans, columns=['etapa', 'nivel', 'seg'])
+    table = df.groupby('etapa')['seg'].agg(llamadas='count', total_ms='sum', media_ms='mean', max_ms='max')
+    table[['total_ms', 'media_ms', 'max_ms']] *= 1000
+    return table.sort_values('total_ms', ascending=False).reset_index()
+
+
+class SpanRecorder:
+    """Spans medidos en un hilo (el del script o uno del pool de segundo plano)."""
+
+    def __init__(self):
+        self.spans = []  # (nombre, profundidad, segundos)
+        self._depth = 0
+
+
+class ProfileRun(SpanRecorder):
+    """Un rerun perfilado: spans medidos + muestras de pila."""
+
+    def __init__(self, label="rerun", interval=PROFILE_INTERVAL_S):
+        super().__init__()
+        self.label = label
+        self.started = datetime.now()
+        self.background = []  # (tarea, nombre, profundidad, segundos) grabados en hilos del pool
+        self._t0 = time.perf_counter()
+        self._sampler = _Sampler(threading.get_ident(), interval)
+        self._sampler.start()
+        self.output_dir = None
+        self.wall_s = None
+
+    def stage_table(self):
+        """Tabla por etapa: llamadas, total, media, máximo y % del rerun."""
+        table = _stage_table(self.spans)
+        wall = self.wall_s or (time.perf_counter() - self._t0)
+        table['pct_rerun'] = (table['total_ms'] / (wall * 1000) * 100).astype(float)
+        return table.round(1)
+
+    def add_background(self, label, spans):
+        """Añade los spans de una tarea en segundo plano (grabados con recording() en su hilo)."""
+        self.background.extend((label, *s) for s in list(spans))
+
+    def background_table(self):
+        """Tabla por tarea en segundo plano y etapa (sin % del rerun: corren en paralelo a él)."""
+        tables = [_stage_table([s[1:] for s in self.background if s[0] == label]).assign(tarea=label)
+                  for label in dict.fromkeys(s[0] for s in self.background)]
+        if not tables:
+            return pd.DataFrame(columns=['tarea'] + STAGE_COLUMNS)
+        return pd.concat(tables, ignore_index=True)[['tarea'] + STAGE_COLUMNS].round(1)
+
+    def finish(self):
+        """Para el muestreador y escribe tabla, pilas plegadas y flamegraph."""
+        self.wall_s = time.perf_counter() - self._t0
+        self._sampler.stop()
+        run_id = f"{self.started:%Y%m%d-%H%M%S}-{threading.get_ident() % 10000:04d}"
+        self.output_dir = os.path.join(PROFILE_DIR, run_id)
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        self.stage_table().to_csv(os.path.join(self.output_dir, "stages.csv"), index=False)
+        if self.background:
+            self.background_table().to_csv(os.path.join(self.output_dir, "background.csv"), index=False)
+        with open(os.path.join(self.output_dir, "stacks.folded"), "w", encoding="utf-8") as f:
+            for stack, count in self._sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(self.output_dir, "flamegraph.svg"), "w", encoding="utf-8") as f:
+            f.write(render_flamegraph(self._sampler.stacks, title=f"{self.label} ({self.wall_s:.2f}s)"))
+        return self.output_dir
+
+
+def start_run(label="rerun"):
+    """Inicia el perfilado del hilo actual. Devuelve el ProfileRun activo."""
+    previous = getattr(_local, "run", None)
+    if previous is not None:
+        previous._sampler.stop()  # Rerun anterior interrumpido antes de finish_run()
+    run = ProfileRun(label)
+    _local.run = run
+    return run
+
+
+def finish_run():
+    """Cierra el perfilado del hilo actual y devuelve el ProfileRun (o None)."""
+    run = getattr(_local, "run", None)
+    _local.run = None
+    if run is not None:
+        run.finish()
+    return run
+
+
+def current_run():
+    """ProfileRun activo en este hilo (o None)."""
+    return getattr(_local, "run", None)
+
+
+@contextmanager
+def recording():
+    """
+    Graba los spans de este hilo en un SpanRecorder propio mientras dura el bloque
+    (p. ej. una tarea del pool lanzada desde un rerun perfilado).
+    """
+    previous = getattr(_local, "run", None)
+    recorder = SpanRecorder()
+    _local.run = recorder
+    try:
+        yield recorder
+    finally:
+        _local.run = previous
+
+
+@contextmanager
+def span(name):
+    """Mide una etapa si hay un perfilado activo en este hilo."""
+    run = getattr(_local, "run", None)
+    if run is None:
+        yield
+        return
+    run._depth += 1
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        run._depth -= 1
+        run.spans.append((name, run._depth, time.perf_counter() - t0))
+
+
+def profiled(name):
+    """Decorador equivalente a envolver la función en span(name)."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render_flamegraph(stacks, title="", width=1200, row_height=16):
+    """Flamegraph SVG autocontenido a partir de {pila_plegada: muestras}."""
+    # Árbol de llamadas: nodo = [muestras, {hijo: nodo}]
+    root = [0, {}]
+    for stack, count in stacks.items():
+        node = root
+        node[0] += count
+        for frame in stack.split(";"):
+            node = node[1].setdefault(frame, [0, {}])
+            node[0] += count
+
+    total = root[0] or 1
+    rects = []
+
+    def walk(node, x, depth):
+        for frame, child in sorted(node[1].items()):
+            w = child[0] / total * width
+            if w >= 0.5:
+                rects.append((x, depth, w, frame, child[0]))
+                walk(child, x, depth + 1)
+            x += w
+
+    walk(root, 0.0, 0)
+    max_depth = max((r[1] for r in rects), default=0) + 1
+    height = (max_depth + 2) * row_height
+
+    out = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+           f'font-family="monospace" font-size="11">',
+           f'<text x="4" y="12">{html.escape(title)} - {root[0]} muestras</text>']
+    for x, depth, w, frame, count in rects:
+        y = height - (depth + 1) * row_height
+        hue = zlib.crc32(frame.split(":")[0].encode()) % 60
+        label = html.escape(frame)
+        out.append(
+            f'<g><title>{label} ({count} muestras, {count / total * 100:.1f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" '
+            f'fill="hsl({hue},80%,60%)"/>'
+        )
+        if w > 40:
+            out.append(f'<text x="{x + 2:.1f}" y="{y + row_height - 4}">{label[:int(w / 7)]}</text>')
+        out.append('</g>')
+    out.append('</svg>')
+    return "\n".join(out)
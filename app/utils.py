@@ -1,3 +1,5 @@
+import os
+
 # Mapping of indicators and API configurations based on "Citizen Realism" Methodology
 # Focus: Per Capita, Inequality, Real Welfare, International Comparison (Peers)
 
@@ -47,7 +49,72 @@ EUROSTAT_CONFIG = {
 }
 
 # Constants
-PEER_COUNTRIES = ['ES', 'DE', 'FR', 'IT', 'PT', 'PL']
+PEER_COUNTRIES = ['ES', 'DE', 'FR', 'IT', 'PT', 'PL']  # Selección por defecto de la comparativa
+
+# Países seleccionables: UE-27 (códigos geo de Eurostat; Grecia es 'EL') + agregados
+EU27_COUNTRIES = ['AT', 'BE', 'BG', 'CY', 'CZ', 'DE', 'DK', 'EE', 'EL', 'ES', 'FI', 'FR', 'HR', 'HU',
+                  'IE', 'IT', 'LT', 'LU', 'LV', 'MT', 'NL', 'PL', 'PT', 'RO', 'SE', 'SI', 'SK']
+EU_AGGREGATES = ['EU27_2020', 'EA20']
+PEER_GEOS = EU27_COUNTRIES + EU_AGGREGATES  # Se descargan todos una vez; la selección solo recorta el panel
+GEO_LABELS = {
+    'AT': 'Austria', 'BE': 'Bélgica', 'BG': 'Bulgaria', 'CY': 'Chipre', 'CZ': 'Chequia',
+    'DE': 'Alemania', 'DK': 'Dinamarca', 'EE': 'Estonia', 'EL': 'Grecia', 'ES': 'España',
+    'FI': 'Finlandia', 'FR': 'Francia', 'HR': 'Croacia', 'HU': 'Hungría', 'IE': 'Irlanda',
+    'IT': 'Italia', 'LT': 'Lituania', 'LU': 'Luxemburgo', 'LV': 'Letonia', 'MT': 'Malta',
+    'NL': 'Países Bajos', 'PL': 'Polonia', 'PT': 'Portugal', 'RO': 'Rumanía', 'SE': 'Suecia',
+    'SI': 'Eslovenia', 'SK': 'Eslovaquia', 'EU27_2020': 'UE-27', 'EA20': 'Zona Euro',
+}
+PEER_WEBGL_THRESHOLD = 10  # A partir de N países las trazas se dibujan con WebGL (Scattergl)
 PCA_COMPONENTS = 1
 ICTR_BASE = 100
-ICTR_SCALE = 10
\ No newline at end of file
+ICTR_SCALE = 10
+
+# Validación de chunks mensuales de ESIOS (indicador 1293, demanda real en MW)
+ESIOS_DEMAND_MW_RANGE = (10_000, 60_000)  # Demanda peninsular plausible; ~250M indica unidades/agregación mezcladas
+ESIOS_MIN_DAY_COVERAGE = 0.9   # Fracción mínima de días del mes con datos
+ESIOS_NEIGHBOUR_MONTHS = 2     # Meses a cada lado para la comprobación de continuidad
+ESIOS_MAX_NEIGHBOUR_RATIO = 1.5  # Salto máximo admitido frente a la mediana de los vecinos
+
+# Nowcasting (modelo factorial dinámico de frecuencia mixta)
+NOWCAST_FACTOR_ORDER = 1
+NOWCAST_REFIT_DAYS = 30  # Re-estimación completa como máximo una vez al mes; entre medias solo filtro de Kalman
+NOWCAST_MAXITER = 200
+
+# Presupuesto de puntos por traza enviado al navegador (LTTB / min-max en el servidor)
+CHART_POINT_BUDGET = int(os.environ.get("MONITOR_CHART_POINT_BUDGET", 1500))
+
+# Caché de figuras Plotly en memoria del proceso (compartida entre sesiones)
+FIGURE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Cargas lentas (ESIOS, paneles de la comparativa, nowcast) en segundo plano
+BACKGROUND_WORKERS = 8
+BACKGROUND_TTL_S = 86400  # Igual que la caché de descargas
+BACKGROUND_POLL_S = 2     # Frecuencia con la que la página comprueba si ya terminaron
+BACKGROUND_MAX_TASKS = 24  # Tareas terminadas que se conservan (LRU): ~3 por vista (actual, vintages, tokens)
+
+# Informe PDF: procesos para renderizar los gráficos en paralelo (1 = en secuencia)
+PDF_RENDER_WORKERS = int(os.environ.get("MONITOR_PDF_WORKERS", min(8, os.cpu_count() or 1)))
+PDF_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Informes ya generados (LRU por bytes totales)
+# Gráficos del PDF: 'svg' (vectorial) o 'png' (raster 100 dpi); en ambos las series se reducen
+PDF_CHART_FORMAT = os.environ.get("MONITOR_PDF_CHART_FORMAT", "svg")
+PDF_CHART_POINT_BUDGET = 500  # Puntos por traza: ~1 por punto tipográfico en un gráfico de 170 mm (482 pt)
+
+# Exportación masiva (ZIP Parquet/CSV, Excel): filas por bloque escrito
+EXPORT_CHUNK_ROWS = 50_000
+
+# Informe IA: modelo ('stub' = modelo local de prueba, sin red) y caché de respuestas en disco
+AI_MODEL = os.environ.get("MONITOR_AI_MODEL", "gemini-pro")
+AI_CACHE_TTL_S = 7 * 86400
+AI_CACHE_MAX_BYTES = 16 * 1024 * 1024
+AI_CONTEXT_MAX_TOKENS = 600  # Presupuesto del contexto de datos en el prompt (~4 caracteres por token)
+
+# Catálogo de metadatos de Eurostat (dimensiones y códigos): la estructura de un dataset cambia poco
+CATALOG_TTL_S = 7 * 86400
+
+# Monitor de actualidad (solo metadatos de las fuentes): cada cuánto se comprueba y consultas en paralelo
+FRESHNESS_CHECK_S = 300
+FRESHNESS_POLL_S = 30  # La página consulta el último informe más a menudo de lo que se relanza la comprobación
+FRESHNESS_WORKERS = 8
+
+# Caché local en disco (parámetros de modelos, vintages, etc.)
+CACHE_DIR = os.environ.get("MONITOR_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
@@ -0,0 +1,214 @@
+"""
+Almacén de vintages (revisiones) de las series descargadas.
+
+Cada descarga se guarda como un vintage, pero solo se escriben las
+observaciones nuevas o revisadas respecto al estado anterior (codificación
+delta). Las observaciones que desaparecen se marcan con valor NULL. Así se
+puede reconstruir cualquier serie, o el conjunto completo, "tal y como se
+publicó" en una fecha, sin guardar copias completas por día.
+
+Formato: SQLite (librería estándar). Fechas y vintages en segundos Unix.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from utils import CACHE_DIR
+
+VINTAGE_DB_PATH = os.path.join(CACHE_DIR, "vintages.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    series  TEXT    NOT NULL,
+    date    INTEGER NOT NULL,
+    vintage INTEGER NOT NULL,
+    value   REAL,
+    PRIMARY KEY (series, date, vintage)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS fetches (
+    series    TEXT    NOT NULL,
+    vintage   INTEGER NOT NULL,
+    n_obs     INTEGER NOT NULL,
+    n_changed INTEGER NOT NULL,
+    PRIMARY KEY (series, vintage)
+) WITHOUT ROWID;
+"""
+
+
+def series_key(source, code, filters=None):
+    """
+    Identificador estable de una serie.
+    Ej: series_key('eurostat', 'sdg_08_10', {'geo': 'ES', 'unit': 'CLV20_EUR_HAB'})
+        -> 'eurostat:sdg_08_10|geo=ES|unit=CLV20_EUR_HAB'
+    """
+    parts = [f"{source}:{code}"]
+    for k, v in sorted((filters or {}).items()):
+        parts.append(f"{k.lower()}={v}")
+    return "|".join(parts)
+
+
+def _to_epoch(ts):
+    return int(pd.Timestamp(ts).timestamp())
+
+
+class VintageStore:
+    """Almacén delta de vintages sobre SQLite (seguro entre hilos: una conexión por operación)."""
+
+    def __init__(self, path=VINTAGE_DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:  # commit / rollback
+                yield conn
+        finally:
+            conn.close()
+
+    def _state(self, conn, series, as_of_epoch):
+        """Estado de una serie en un vintage: {date_epoch: value} (sin tombstones)."""
+        rows = conn.execute(
+            "SELECT date, value, MAX(vintage) FROM observations "
+            "WHERE series = ? AND vintage <= ? GROUP BY date",
+            (series, as_of_epoch),
+        ).fetchall()
+        return {d: v for d, v, _ in rows if v is not None}
+
+    def record(self, series, df, vintage=None):
+        """
+        Guarda el resultado de una descarga (DataFrame con 'date' y 'value').
+        Solo inserta observaciones nuevas/revisadas y tombstones de las eliminadas.
+        Devuelve el número de filas escritas (0 si no hubo cambios).
+        """
+        if df is None or df.empty:
+            return 0
+        vintage_epoch = _to_epoch(vintage or datetime.now())
+
+        dates = pd.to_datetime(df['date']).map(_to_epoch).to_numpy()
+        values = pd.to_numeric(df['value'], errors='coerce').to_numpy(dtype=float)
+        keep = ~np.isnan(values)
+        new_state = dict(zip(dates[keep].tolist(), values[keep].tolist()))
+
+        with self._connect() as conn:
+            old_state = self._state(conn, series, vintage_epoch)
+            changed = [
+                (series, d, vintage_epoch, v) for d, v in new_state.items()
+                if d not in old_state or not np.isclose(old_state[d], v, rtol=1e-12, atol=0.0)
+            ]
+            removed = [(series, d, vintage_epoch, None) for d in old_state.keys() - new_state.keys()]
+            rows = changed + removed
+            if rows:
+                conn.executemany("INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?)", rows)
+            conn.execute("INSERT OR REPLACE INTO fetches VALUES (?, ?, ?, ?)",
+                         (series, vintage_epoch, len(new_state), len(rows)))
+        return len(rows)
+
+    def as_of(self, series, as_of=None):
+        """Reconstruye una serie tal y como estaba publicada en la fecha `as_of`."""
+        with self._connect() as conn:
+            state = self._state(conn, series, _to_epoch(as_of or datetime.now()))
+        return _state_to_frame(state)
+
+    def snapshot(self, as_of=None, series=None):
+        """
+        Reconstruye todas las series (o las indicadas) a fecha `as_of`.
+        Devuelve {series_key: DataFrame(date, value)} con una sola consulta.
+        """
+        query = ("SELECT series, date, value, MAX(vintage) FROM observations "
+                 "WHERE vintage <= ? GROUP BY series, date")
+        with self._connect() as conn:
+            rows = conn.execute(query, (_to_epoch(as_of or datetime.now()),)).fetchall()
+        if not rows:
+            return {}
+        long_df = pd.DataFrame(rows, columns=['series', 'date', 'value', 'vintage']).dropna(subset=['value'])
+        if series is not None:
+            long_df = long_df[long_df['series'].isin(series)]
+        long_df['date'] = pd.to_datetime(long_df['date'], unit='s')
+        return {
+            key: grp[['date', 'value']].sort_values('date').reset_index(drop=True)
+            for key, grp in long_df.groupby('series', sort=False)
+        }
+
+    def revisions(self, series):
+        """Historial completo de revisiones: DataFrame(date, vintage, value)."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT date, vintage, value FROM observations WHERE series = ? ORDER BY date, vintage",
+                (series,),
+            ).fetchall()
+        df = pd.DataFrame(rows, columns=['date', 'vintage', 'value'])
+        df['date'] = pd.to_datetime(df['date'], unit='s')
+        df['vintage'] = pd.to_datetime(df['vintage'], unit='s')
+        return df
+
+    def vintages(self, series=None):
+        """Fechas de descarga registradas (de una serie o de todas)."""
+        with self._connect() as conn:
+            if series is None:
+                rows = conn.execute("SELECT DISTINCT vintage FROM fetches ORDER BY vintage").fetchall()
+            else:
+                rows = conn.execute("SELECT vintage FROM fetches WHERE series = ? ORDER BY vintage",
+                                    (series,)).fetchall()
+        return [pd.Timestamp(v, unit='s') for (v,) in rows]
+
+    def status(self, series):
+        """
+        Estado actual de varias series con dos consultas: {serie: (último periodo con dato,
+        última descarga)}. Las series nunca descargadas no aparecen.
+        """
+        series = list(series)
+        if not series:
+            return {}
+        marks = ",".join("?" * len(series))
+        with self._connect() as conn:
+            latest = dict(conn.execute(
+                f"SELECT series, MAX(date) FROM (SELECT series, date, value, MAX(vintage) FROM observations "
+                f"WHERE series IN ({marks}) GROUP BY series, date) WHERE value IS NOT NULL GROUP BY series",
+                series,
+            ).fetchall())
+            fetched = conn.execute(f"SELECT series, MAX(vintage) FROM fetches WHERE series IN ({marks}) GROUP BY series",
+                                   series).fetchall()
+        return {key: (pd.Timestamp(latest[key], unit='s') if key in latest else pd.NaT, pd.Timestamp(vintage, unit='s'))
+                for key, vintage in fetched}
+
+    def series(self):
+        with self._connect() as conn:
+            return [s for (s,) in conn.execute("SELECT DISTINCT series FROM fetches ORDER BY series")]
+
+
+def _state_to_frame(state):
+    if not state:
+        return pd.DataFrame(columns=['date', 'value'])
+    df = pd.DataFrame({'date': pd.to_datetime(list(state.keys()), unit='s'), 'value': list(state.values())})
+    return df.sort_values('date').reset_index(drop=True)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_vintage_store():
+    """Instancia compartida del almacén (una por proceso)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = VintageStore()
+        return _store
+
+
+def record_vintage(series, df):
+    """Registra una descarga sin interrumpir nunca la carga de datos."""
+    try:
+        return get_vintage_store().record(series, df)
+    except Exception as e:
+        print(f"No se pudo registrar el vintage de {series}: {e}")
+        return 0
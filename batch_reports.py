@@ -0,0 +1,111 @@
+"""
+Informes PDF en lote: varios países x varias fechas de publicación (vintages).
+
+Todos los informes salen de un único snapshot de datos por fecha: cada dataset
+de Eurostat se descarga (o se reconstruye desde los vintages) una sola vez
+para todos los países pedidos, y los paneles de la comparativa se comparten
+entre los informes del mismo periodo. Los gráficos de todos los informes se
+renderizan juntos en el pool de procesos de pdf_report; los idénticos (mismo
+contenido) una sola vez.
+
+    # Informe actual de España, Alemania y Francia
+    python batch_reports.py --countries ES DE FR --out informes/
+    # Mismos países a fecha de varias publicaciones (requiere vintages grabados)
+    python batch_reports.py --countries ES DE FR --as-of 2025-01-15 2025-07-15 --out informes/
+    # 'actual' puede mezclarse con fechas; --workers fija los procesos de render
+    python batch_reports.py --countries ES PT --as-of actual 2025-01-15 --workers 4
+
+Los informes en lote no incluyen el análisis de IA. La demanda eléctrica
+(ESIOS) solo existe para España: se incluye desde los vintages o, para los
+datos actuales, si se pasa --esios-token.
+"""
+import argparse
+import os
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app')
+sys.path.insert(0, APP_DIR)
+
+
+def ictr_status(ictr_df):
+    """(ICTR actual, tendencia) con la misma regla que el semáforo del dashboard."""
+    if ictr_df is None or ictr_df.empty:
+        return 100, "Estable"
+    last_ictr = ictr_df['ICTR'].iloc[-1]
+    prev_ictr = ictr_df['ICTR'].iloc[-2] if len(ictr_df) > 1 else last_ictr
+    delta = last_ictr - prev_ictr
+    return last_ictr, "Mejorando" if delta > 0 else ("Empeorando" if delta < 0 else "Estable")
+
+
+def load_esios(as_of, esios_token):
+    import pandas as pd
+    from vintage_store import get_vintage_store, series_key
+    if as_of is not None:
+        return get_vintage_store().as_of(series_key('esios', '1293'), as_of)
+    if esios_token:
+        from data_loader import fetch_esios_data_v6
+        return fetch_esios_data_v6(esios_token, _progress=lambda fraction, text=None: None)
+    return pd.DataFrame()
+
+
+def report_requests(countries, as_of, esios_token=None):
+    """Peticiones de build_pdf_reports para todos los países de una fecha (un solo snapshot)."""
+    from data_store import country_ictr, country_indicators, load_country_panels, select_peers
+    from derived import esios_trend
+    from utils import PEER_COUNTRIES
+
+    panels, peer_panels = load_country_panels(countries, as_of)
+    reports = []
+    for country in countries:
+        indicators = country_indicators(panels, country)
+        ictr_val, trend_val = ictr_status(country_ictr(indicators))
+        selection = [country] + [g for g in PEER_COUNTRIES if g != country]
+        esios_data = esios_trend(load_esios(as_of, esios_token)) if country == 'ES' else None
+        reports.append(dict(ictr_val=ictr_val, trend_val=trend_val, indicators_dict=indicators,
+                            peers_data=select_peers(peer_panels, selection), esios_data=esios_data,
+                            country=country, as_of=as_of))
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera informes PDF para varios países y fechas")
+    parser.add_argument('--countries', nargs='+', default=['ES'], help="Códigos Eurostat (ES DE FR ... EL)")
+    parser.add_argument('--as-of', nargs='+', default=['actual'],
+                        help="Fechas de publicación (AAAA-MM-DD) o 'actual'")
+    parser.add_argument('--out', default='informes', help="Directorio de salida")
+    parser.add_argument('--workers', type=int, default=None, help="Procesos de render (por defecto, nº de CPUs)")
+    parser.add_argument('--esios-token', default=None, help="Token ESIOS para la demanda actual de España")
+    args = parser.parse_args()
+
+    if args.workers:
+        os.environ['MONITOR_PDF_WORKERS'] = str(args.workers)  # Antes de importar utils / pdf_report
+    import pandas as pd
+    from pdf_report import build_pdf_reports, report_cache_stats
+
+    countries = [c.upper() for c in args.countries]
+    dates = [None if d.lower() == 'actual' else pd.Timestamp(d) for d in args.as_of]
+    os.makedirs(args.out, exist_ok=True)
+
+    t0 = time.perf_counter()
+    reports = []
+    for as_of in dates:
+        t = time.perf_counter()
+        reports += report_requests(countries, as_of, args.esios_token)
+        print(f"Datos {'actuales' if as_of is None else as_of.date()}: {time.perf_counter() - t:.1f} s")
+
+    t = time.perf_counter()
+    pdfs = build_pdf_reports(reports)
+    print(f"{len(pdfs)} informes renderizados en {time.perf_counter() - t:.1f} s")
+
+    for report, pdf_bytes in zip(reports, pdfs):
+        suffix = 'actual' if report['as_of'] is None else report['as_of'].strftime('%Y%m%d')
+        path = os.path.join(args.out, f"informe_{report['country']}_{suffix}.pdf")
+        with open(path, 'wb') as f:
+            f.write(pdf_bytes)
+        print(f"  {path} ({len(pdf_bytes) / 1024:.0f} KB)")
+    print(f"Total: {time.perf_counter() - t0:.1f} s | caché de informes: {report_cache_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,53 @@
 """
-Verificar fechas más recientes de los datos
+Verificar la actualidad de los datos: último periodo publicado por cada fuente,
+retraso por indicador y datos nuevos sin descargar.
+
+Solo consulta metadatos (dataflow de Eurostat, último dato del INE, últimas 48 h
+de ESIOS), en paralelo, sin descargar las series (app/freshness.py).
+
+    python check_dates.py                      # una comprobación
+    python check_dates.py --esios-token TOKEN  # incluye la demanda eléctrica
+    python check_dates.py --watch 5            # repetir cada 5 minutos
 """
+import argparse
 import sys
+import time
 sys.path.insert(0, 'app')
 
-from data_loader import fetch_eurostat_data
-from utils import EUROSTAT_CONFIG
-
-indicators = ['REAL_GDP_PC', 'GINI', 'HICP', 'DEBT_PC', 'NEET', 'AROPE']
-
-print("="*60)
-print("FECHAS MÁS RECIENTES DE LOS DATOS")
-print("="*60)
-
-for ind in indicators:
-    try:
-        config = EUROSTAT_CONFIG[ind]
-        df = fetch_eurostat_data(config['code'], config.get('filters'))
-        if df is not None and not df.empty:
-            max_date = df['date'].max()
-            last_val = df['value'].iloc[-1]
-            print(f"{ind}: {max_date} -> {last_val:.1f}")
-        else:
-            print(f"{ind}: SIN DATOS")
-    except Exception as e:
-        print(f"{ind}: ERROR - {e}")
-
-print("="*60)
+from freshness import check_freshness
+
+
+def _fmt(ts, fmt='%Y-%m-%d'):
+    return ts.strftime(fmt) if ts is not None and ts == ts else '-'
+
+
+def print_report(report):
+    print("=" * 98)
+    print(f"{'INDICADOR':<26}{'FUENTE':<10}{'PUBLICADO':<12}{'RETRASO':>9}  {'LOCAL':<12}{'ACTUALIZADO':<18}ESTADO")
+    print("=" * 98)
+    for row in report.itertuples():
+        lag = f"{row.retraso_dias} d" if row.retraso_dias == row.retraso_dias and row.retraso_dias is not None else '-'
+        state = f"ERROR - {row.error[:60]}" if row.error else ("NUEVOS DATOS" if row.pendiente else "al día")
+        print(f"{row.indicador:<26}{row.fuente:<10}{_fmt(row.publicado):<12}{lag:>9}  {_fmt(row.local):<12}"
+              f"{_fmt(row.actualizado, '%Y-%m-%d %H:%M'):<18}{state}")
+    print("=" * 98)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Actualidad de los datos (solo metadatos)")
+    parser.add_argument('--esios-token', default=None, help="Token ESIOS para comprobar la demanda eléctrica")
+    parser.add_argument('--watch', type=float, default=None, help="Repetir cada N minutos")
+    args = parser.parse_args()
+
+    while True:
+        t = time.perf_counter()
+        report = check_freshness(args.esios_token)
+        print_report(report)
+        print(f"{int(report['pendiente'].sum())} indicadores con datos nuevos | {time.perf_counter() - t:.1f} s")
+        if not args.watch:
+            break
+        time.sleep(args.watch * 60)
+
+
+if __name__ == "__main__":
+    main()
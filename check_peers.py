@@ -1,38 +1,44 @@
-import eurostat
-import pandas as pd
-
-def check_peers():
-    code = "namq_10_gdp"
-    peers = ['ES', 'DE', 'FR', 'IT', 'PT', 'PL']
-    print(f"--- CHECKING PEERS FOR {code} ---")
-    
-    try:
-        df = eurostat.get_data_df(code)
-        df.columns = [c.lower() for c in df.columns]
-        
-        geo_col = next((c for c in df.columns if 'geo' in c), None)
-        
-        # Filter for peers
-        df = df[df[geo_col].isin(peers)]
-        
-        # Check common units
-        available_units = df['unit'].unique()
-        print("All Units:", available_units)
-        
-        # Find a unit present for ALL peers
-        valid_units = []
-        for u in available_units:
-            countries_with_unit = df[df['unit'] == u][geo_col].unique()
-            if len(countries_with_unit) == len(peers):
-                valid_units.append(u)
-        
-        print(f"UNITS VALID FOR ALL {len(peers)} PEERS: {valid_units}")
-        
-        # Check Seasonality
-        print("S_ADJ options:", df['s_adj'].unique())
-
-    except Exception as e:
-        print(e)
+"""
+Comprobar la configuración de la comparativa internacional sin descargar datos:
+códigos disponibles (unit, s_adj, ...) y validación de los filtros contra el
+catálogo de metadatos de Eurostat (app/metadata_catalog.py).
+
+    python check_peers.py            # GDP_PEERS, UNEMPLOYMENT, SENTIMENT
+    python check_peers.py --todo     # todas las entradas de EUROSTAT_CONFIG
+"""
+import sys
+sys.path.insert(0, 'app')
+
+from metadata_catalog import get_catalog, validate_config
+from utils import EUROSTAT_CONFIG, PEER_COUNTRIES
+
+PEER_KEYS = ['GDP_PEERS', 'UNEMPLOYMENT', 'SENTIMENT']
+
+
+def check_peers(keys=PEER_KEYS):
+    catalog = get_catalog()
+    for key in keys:
+        config = EUROSTAT_CONFIG[key]
+        code = config['code']
+        print(f"--- {key}: {code} ---")
+        try:
+            for dim, n_codes in catalog.dimensions(code):
+                if dim == 'geo':
+                    missing = [g for g in PEER_COUNTRIES if g not in catalog.codes(code, 'geo')]
+                    print(f"  geo: {n_codes} códigos" + (f" (faltan {', '.join(missing)})" if missing else ""))
+                else:
+                    values = catalog.codes(code, dim)
+                    print(f"  {dim}: {', '.join(values[:15])}{' ...' if len(values) > 15 else ''}")
+        except Exception as e:
+            print(f"  ERROR - {e}")
+
+    print("--- VALIDACIÓN DE FILTROS ---")
+    report = validate_config({k: EUROSTAT_CONFIG[k] for k in keys}, catalog, peer_keys=PEER_KEYS)
+    for key, problems in report.items():
+        print(f"{key}: {'OK' if not problems else ''}")
+        for problem in problems:
+            print(f"  - {problem}")
+
 
 if __name__ == "__main__":
-    check_peers()
+    check_peers(list(EUROSTAT_CONFIG) if '--todo' in sys.argv else PEER_KEYS)
@@ -1,23 +1,29 @@
-import eurostat
-import pandas as pd
+"""
+Explorar un dataset de Eurostat desde el catálogo de metadatos (sin descargar los datos).
 
-# Test GDP dataset
-code = "namq_10_gdp"
-print(f"Fetching {code}...")
+    python debug_eurostat.py namq_10_gdp           # dimensiones, códigos y periodos
+    python debug_eurostat.py namq_10_gdp s_adj     # códigos de una dimensión
+    python debug_eurostat.py --buscar CLV_I10      # en qué datasets catalogados aparece un código
+"""
+import sys
+sys.path.insert(0, 'app')
+
+from metadata_catalog import get_catalog
+
+args = sys.argv[1:] or ["namq_10_gdp"]
+catalog = get_catalog()
 
 try:
-    df = eurostat.get_data_df(code)
-    print("Columns:", df.columns.tolist())
-    print("Head:", df.head(2))
-    
-    # Check distinct values for filtering
-    if 'geo\time' in df.columns:
-        print("Countries:", df['geo\time'].unique())
-    elif 'geo' in df.columns:
-        print("Countries:", df['geo'].unique())
-        
-    if 'unit' in df.columns:
-        print("Units:", df['unit'].unique())
-        
+    if args[0] == '--buscar':
+        for code, dim in catalog.find(args[1]):
+            print(f"{code}: {dim}")
+    elif len(args) > 1:
+        print(f"{args[0]} / {args[1]}:", catalog.codes(args[0], args[1]))
+    else:
+        code = args[0]
+        print(f"{code}: periodos {catalog.time_range(code)}")
+        for dim, n_codes in catalog.dimensions(code):
+            values = catalog.codes(code, dim)
+            print(f"  {dim} ({n_codes}): {', '.join(values[:20])}{' ...' if n_codes > 20 else ''}")
 except Exception as e:
     print("Error:", e)
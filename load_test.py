@@ -0,0 +1,270 @@
+"""
+Prueba de carga: N sesiones concurrentes contra app/main.py
+
+Cada sesión (streamlit.testing AppTest, mismo proceso = mismo servidor, caches
+compartidas) recorre: carga de la página -> las 5 pestañas -> botón PDF.
+Los datos se sirven desde fixtures reproducibles, sin red:
+
+    # 1. Grabar fixtures con datos reales (una vez, con red)
+    python load_test.py --record fixtures/ [--esios-token TOKEN]
+    # 2. Lanzar la carga reproduciendo las fixtures
+    python load_test.py --fixtures fixtures/ --sessions 20 --iterations 3
+    # ...o con series sintéticas deterministas (sin red ni fixtures)
+    python load_test.py --synthetic --sessions 20
+
+Informe: latencia de rerun p50/p95/máx por paso, CPU del proceso (total y por
+sesión) y RSS (base, final y marginal por sesión). --json guarda el resultado.
+"""
+import argparse
+import json
+import os
+import pickle
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app')
+sys.path.insert(0, APP_DIR)
+
+import numpy as np
+import pandas as pd
+
+# Funciones de data_loader que se graban / reproducen (data_store despacha por __name__)
+FIXTURE_FUNCS = ['fetch_eurostat_data', 'fetch_eurostat_panel', 'fetch_esios_data_v6', 'fetch_ine_data']
+TABS = ["🌍 Comparativa", "👤 Per Cápita", "🏘️ Bienestar", "💰 Tu Bolsillo", "🤖 Informe IA"]
+
+
+def _fixture_key(func_name, args, kwargs):
+    from cache_utils import fingerprint
+    if func_name == 'fetch_esios_data_v6':
+        return func_name  # El token no forma parte de la clave
+    return f"{func_name}-{fingerprint(args, kwargs)}"
+
+
+def _install(wrapper_factory):
+    """Sustituye las funciones de data_loader antes de que main.py / data_store las importen."""
+    import data_loader
+    for name in FIXTURE_FUNCS:
+        original = getattr(data_loader, name)
+        wrapper = wrapper_factory(name, original)
+        wrapper.__name__ = name
+        setattr(data_loader, name, wrapper)
+
+
+def install_recorder(fixtures_dir):
+    os.makedirs(fixtures_dir, exist_ok=True)
+
+    def factory(name, original):
+        def record(*args, **kwargs):
+            result = original(*args, **kwargs)
+            with open(os.path.join(fixtures_dir, _fixture_key(name, args, kwargs) + '.pkl'), 'wb') as f:
+                pickle.dump(result, f)
+            return result
+        return record
+    _install(factory)
+
+
+def install_replay(fixtures_dir):
+    cache = {}
+
+    def factory(name, original):
+        def replay(*args, **kwargs):
+            key = _fixture_key(name, args, kwargs)
+            if key not in cache:
+                path = os.path.join(fixtures_dir, key + '.pkl')
+                cache[key] = pd.read_pickle(path) if os.path.exists(path) else pd.DataFrame()
+            return cache[key]
+        return replay
+    _install(factory)
+
+
+def install_synthetic():
+    """Series deterministas con la frecuencia aproximada de cada dataset (sin red ni disco)."""
+    def series(seed, freq, start='2000-01-01', end=None, base=100.0):
+        rng = np.random.default_rng(zlib.crc32(seed.encode()))
+        dates = pd.date_range(start, end or pd.Timestamp.today().normalize(), freq=freq)
+        return pd.DataFrame({'date': dates, 'value': base + np.cumsum(rng.normal(size=len(dates))) * 0.5})
+
+    def freq_for(code):
+        if code.endswith('_q') or code.startswith('namq') or code == 'sdg_17_40':
+            return 'QS'
+        if code.endswith('_m') or code in ('prc_hicp_midx', 'teibs010'):
+            return 'MS'
+        return 'YS'
+
+    def factory(name, original):
+        def synthetic(*args, **kwargs):
+            if name == 'fetch_eurostat_data':
+                return series(args[0], freq_for(args[0]))
+            if name == 'fetch_eurostat_panel':
+                from data_loader import frames_to_panel
+                code, countries = args[0], args[1]
+                return frames_to_panel({c: series(code + c, freq_for(code)) for c in countries}, countries)
+            if name == 'fetch_esios_data_v6':
+                return series('esios', 'D', base=28000)
+            return pd.DataFrame()
+        return synthetic
+    _install(factory)
+
+
+def _rss_bytes():
+    """RSS actual del proceso (Linux /proc; si no, pico de getrusage)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _prepare_concurrent_apptest():
+    """
+    Ajustes para ejecutar varias AppTest en paralelo como haría un servidor real:
+    - AppTest instala un Runtime simulado global al empezar cada run y lo borra
+      al acabar; el run que termina primero dejaría a las demás sin Runtime.
+      Se mantiene visible el último Runtime instalado.
+    - Cada run crea su propio ScriptCache y vuelve a compilar main.py; compilar
+      ASTs en varios hilos a la vez no es seguro en CPython 3.11. Como en el
+      servidor, el script se compila una sola vez para todo el proceso.
+    """
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    last = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            last[:] = [cls._instance]
+            return cls._instance
+        if last:
+            return last[0]
+        raise RuntimeError("Runtime hasn't been created!")
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or bool(last))
+
+    compile_lock, compiled = threading.Lock(), {}
+    get_bytecode = ScriptCache.get_bytecode
+
+    def shared_bytecode(self, script_path):
+        with compile_lock:
+            if script_path not in compiled:
+                compiled[script_path] = get_bytecode(self, script_path)
+            return compiled[script_path]
+
+    ScriptCache.get_bytecode = shared_bytecode
+
+
+def run_session(session_id, args, samples, lock):
+    """Una sesión: carga, recorrido de pestañas y PDF. Añade (paso, segundos, error) a samples."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(APP_DIR, 'main.py'), default_timeout=args.timeout)
+    at.session_state['esios_token_input'] = args.esios_token or 'fixture'
+
+    def step(name, action):
+        t0 = time.perf_counter()
+        try:
+            action()
+            error = at.exception[0].value if len(at.exception) else None
+        except Exception as e:  # Timeout del rerun, etc.
+            error = str(e)
+        with lock:
+            samples.append((name, time.perf_counter() - t0, error, session_id))
+
+    for _ in range(args.iterations):
+        step('carga', at.run)
+        for tab in TABS[1:] + TABS[:1]:
+            at.session_state['tab_activa'] = tab
+            step(f'pestaña {tab}', at.run)
+        if not args.no_pdf:
+            step('pdf', lambda: at.sidebar.button(key='gen_pdf_btn').click().run())
+
+
+def summarize(samples, n_sessions, cpu_s, rss_base, rss_end, wall_s):
+    df = pd.DataFrame(samples, columns=['paso', 'seg', 'error', 'sesion'])
+    ms = df.assign(ms=df['seg'] * 1000).groupby('paso', sort=False)['ms']
+    table = pd.DataFrame({
+        'reruns': ms.count(),
+        'p50_ms': ms.quantile(0.5),
+        'p95_ms': ms.quantile(0.95),
+        'max_ms': ms.max(),
+        'errores': df.groupby('paso', sort=False)['error'].apply(lambda e: int(e.notna().sum())),
+    }).round(1)
+    return {
+        'sesiones': n_sessions,
+        'reruns': int(len(df)),
+        'errores': int(df['error'].notna().sum()),
+        'p50_ms': round(float(np.percentile(df['seg'], 50) * 1000), 1),
+        'p95_ms': round(float(np.percentile(df['seg'], 95) * 1000), 1),
+        'duracion_s': round(wall_s, 2),
+        'cpu_s': round(cpu_s, 2),
+        'cpu_s_por_sesion': round(cpu_s / n_sessions, 3),
+        'rss_base_mb': round(rss_base / 2**20, 1),
+        'rss_final_mb': round(rss_end / 2**20, 1),
+        'rss_por_sesion_mb': round((rss_end - rss_base) / n_sessions / 2**20, 2),
+        'pasos': table.reset_index().to_dict(orient='records'),
+        'primer_error': next((e for e in df['error'] if e), None),
+    }, table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga del dashboard con N sesiones concurrentes")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--fixtures', help="Directorio de fixtures grabadas a reproducir")
+    source.add_argument('--record', help="Graba fixtures ejecutando una sesión con datos reales")
+    source.add_argument('--synthetic', action='store_true', help="Datos sintéticos deterministas (sin red)")
+    parser.add_argument('--sessions', type=int, default=10, help="Sesiones concurrentes (por defecto 10)")
+    parser.add_argument('--iterations', type=int, default=1, help="Recorridos completos por sesión")
+    parser.add_argument('--esios-token', default=None)
+    parser.add_argument('--no-pdf', action='store_true', help="No pulsar el botón de PDF")
+    parser.add_argument('--timeout', type=float, default=300, help="Timeout por rerun (s)")
+    parser.add_argument('--json', help="Guarda el resumen en este fichero")
+    args = parser.parse_args()
+
+    if args.record:
+        install_recorder(args.record)
+        args.sessions, args.iterations = 1, 1
+    elif args.fixtures:
+        install_replay(args.fixtures)
+    else:
+        install_synthetic()
+
+    _prepare_concurrent_apptest()
+    samples, lock = [], threading.Lock()
+
+    # Calentamiento: una sesión llena las caches de proceso (snapshot, figuras, derivadas)
+    t0 = time.perf_counter()
+    run_session('warmup', argparse.Namespace(**{**vars(args), 'iterations': 1, 'no_pdf': True}), [], lock)
+    print(f"Calentamiento (carga en frío): {time.perf_counter() - t0:.2f} s")
+    if args.record:
+        print(f"Fixtures grabadas en {args.record}")
+        return
+
+    rss_base, cpu0, t0 = _rss_bytes(), time.process_time(), time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        for i in range(args.sessions):
+            pool.submit(run_session, i, args, samples, lock)
+    wall_s = time.perf_counter() - t0
+    summary, table = summarize(samples, args.sessions, time.process_time() - cpu0, rss_base, _rss_bytes(), wall_s)
+
+    print("=" * 70)
+    print(f"{args.sessions} sesiones x {args.iterations} recorridos: {summary['reruns']} reruns en {wall_s:.1f} s")
+    print(table.to_string())
+    print("-" * 70)
+    print(f"Latencia rerun   p50 {summary['p50_ms']} ms | p95 {summary['p95_ms']} ms")
+    print(f"CPU proceso      {summary['cpu_s']} s ({summary['cpu_s_por_sesion']} s/sesión)")
+    print(f"RSS              {summary['rss_base_mb']} -> {summary['rss_final_mb']} MB "
+          f"({summary['rss_por_sesion_mb']} MB/sesión)")
+    if summary['errores']:
+        print(f"ERRORES: {summary['errores']} (primero: {summary['primer_error']})")
+    print("=" * 70)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2, default=float)
+
+
+if __name__ == "__main__":
+    main()